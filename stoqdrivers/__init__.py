@@ -27,11 +27,7 @@
 
 import gettext
 import importlib.util
-import locale
 import os
-import platform
-
-import pkg_resources
 
 version = "2.1.0"
 __version__ = tuple(int(n) for n in version.split('.'))
@@ -40,11 +36,14 @@ __all__ = ["library", "__version__"]
 
 
 def enable_translation(domain, root='..', enable_global=None):
-    installed = importlib.util.find_spec("stoqdrivers")
-    if installed and pkg_resources.resource_exists(domain, 'locale'):
-        localedir = pkg_resources.resource_filename(domain, 'locale')
-    elif installed:
-        localedir = None
+    # This is called by stoqdrivers.translation on the first translated
+    # message, not on import, since looking up the locale directory is slow.
+    import locale
+    import platform
+    from stoqdrivers.utils import get_resource_filename
+
+    if importlib.util.find_spec(domain) is not None:
+        localedir = get_resource_filename(domain, 'locale')
     else:
         localedir = os.path.join(root, 'locale')
 
@@ -53,7 +52,9 @@ def enable_translation(domain, root='..', enable_global=None):
     if hasattr(locale, 'bindtextdomain'):
         locale.bindtextdomain(domain, localedir)
 
-    gettext.bind_textdomain_codeset(domain, 'utf-8')
+    # Removed in Python 3.10, where everything is utf-8 already
+    if hasattr(gettext, 'bind_textdomain_codeset'):
+        gettext.bind_textdomain_codeset(domain, 'utf-8')
 
     if enable_global:
         gettext.textdomain(domain)
@@ -69,6 +70,3 @@ def enable_translation(domain, root='..', enable_global=None):
         if enable_global:
             libintl.textdomain(domain)
         del libintl
-
-
-enable_translation('stoqdrivers')
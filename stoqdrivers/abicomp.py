@@ -24,7 +24,10 @@
 ## Author(s):   Johan Dahlin    <jdahlin@async.com.br>
 ##
 
-# This module implements the ABICOMP codec for python
+# This module implements the ABICOMP codec for python, as a charmap codec
+# like the ones on the standard library encodings package
+
+import codecs
 
 TABLE = {
     'À': b'\xa1',
@@ -95,62 +98,89 @@ TABLE = {
 }
 RTABLE = dict([(v, k) for k, v in TABLE.items()])
 
+# ABICOMP is ASCII for the first 128 bytes. On the other bytes, the characters
+# not in the table are not encoded, but are decoded as latin-1, like the
+# replies of the printers were always decoded.
+ENCODING_TABLE = ''.join(
+    chr(i) if i < 128 else RTABLE.get(bytes([i]), '\ufffe')
+    for i in range(256))
+DECODING_TABLE = ''.join(
+    RTABLE.get(bytes([i]), chr(i)) for i in range(256))
+
+ENCODING_MAP = codecs.charmap_build(ENCODING_TABLE)
+
 
-def encode(input):
+def encode(input, errors='strict'):
     """
     Convert unicode to string.
     @param input: text to encode
     @type input: unicode
     @returns: encoded text
-    @rtype: str
+    @rtype: bytes
     """
-    return [TABLE.get(c) or c.encode() for c in input]
+    return codecs.charmap_encode(input, errors, ENCODING_MAP)[0]
 
 
-def decode(input):
+def decode(input, errors='strict'):
     """
     Convert string in unicode.
     @param input: text to decode
-    @type input: str
+    @type input: bytes
     @returns: decoded text
     @rtype: unicode
     """
-    # Iterating over bytes produces a sequence of integers
-    bytes_ = [(c, bytes([c])) for c in input]
-    return [RTABLE.get(b) or chr(i) for i, b in bytes_]
+    return codecs.charmap_decode(input, errors, DECODING_TABLE)[0]
 
 
-def register_codec():
-    import codecs
-
-    class Codec(codecs.Codec):
-        def encode(self, input, errors='strict'):
-            if not input:
-                return b"", 0
-            output = encode(input)
-            return b"".join(output), len(output)
-
-        def decode(self, input, errors='strict'):
-            if not input:
-                return u"", 0
-            output = decode(input)
-            return u"".join(output), len(output)
-
-    class StreamWriter(Codec, codecs.StreamWriter):
-        pass
-
-    class StreamReader(Codec, codecs.StreamReader):
-        pass
-
-    def getregentry(encoding):
-        if encoding != 'abicomp':
-            return None
-        return (Codec().encode,
-                Codec().decode,
-                StreamReader,
-                StreamWriter)
+class Codec(codecs.Codec):
+    def encode(self, input, errors='strict'):
+        return codecs.charmap_encode(input, errors, ENCODING_MAP)
+
+    def decode(self, input, errors='strict'):
+        return codecs.charmap_decode(input, errors, DECODING_TABLE)
+
+
+class IncrementalEncoder(codecs.IncrementalEncoder):
+    def encode(self, input, final=False):
+        return codecs.charmap_encode(input, self.errors, ENCODING_MAP)[0]
+
+
+class IncrementalDecoder(codecs.IncrementalDecoder):
+    def decode(self, input, final=False):
+        return codecs.charmap_decode(input, self.errors, DECODING_TABLE)[0]
+
 
+class StreamWriter(Codec, codecs.StreamWriter):
+    pass
+
+
+class StreamReader(Codec, codecs.StreamReader):
+    pass
+
+
+def getregentry(encoding='abicomp'):
+    if encoding != 'abicomp':
+        return None
+    return codecs.CodecInfo(
+        name='abicomp',
+        encode=Codec().encode,
+        decode=Codec().decode,
+        incrementalencoder=IncrementalEncoder,
+        incrementaldecoder=IncrementalDecoder,
+        streamreader=StreamReader,
+        streamwriter=StreamWriter,
+    )
+
+
+_registered = False
+
+
+def register_codec():
+    global _registered
+    if _registered:
+        return
     codecs.register(getregentry)
+    _registered = True
 
 
 def test():
@@ -28,18 +28,15 @@ Generic base class implementation for all devices.
 """
 
 import logging
-from unittest import mock
-
-try:
-    from gi.repository import GObject
-except ImportError:
-    GObject = mock.Mock()
 
+from stoqdrivers import metrics
 from stoqdrivers.configparser import StoqdriversConfig
 from stoqdrivers.enum import DeviceType
 from stoqdrivers.exceptions import CriticalError, ConfigError
 from stoqdrivers.translation import stoqdrivers_gettext
 from stoqdrivers.serialbase import SerialPort, EthernetPort
+from stoqdrivers.spooler import get_spooler
+from stoqdrivers.trace import get_wire_trace
 
 _ = stoqdrivers_gettext
 
@@ -99,7 +96,7 @@ class BaseDevice:
             section_name = BaseDevice.typename_translate_dict[self.device_type]
             for field in ['brand', 'device', 'model', 'inverted_drawer']:
                 try:
-                    setattr(self, field, self.config.get_option(field, section_name))
+                    setattr(self, field, self.config.get_value(field, section_name))
                 except ConfigError:
                     # Field not found, ignore
                     pass
@@ -142,8 +139,8 @@ class BaseDevice:
         log.info("Device class initialized: brand=%s,device=%s,model=%s"
                  % (self.brand, self.device, self.model))
 
-        # This check is necessary but ugly because the configuration code
-        # doesn't understand booleans, and we don't want mismatches
+        # The config gives us a real boolean, but callers might still pass
+        # the string used by older config code
         if self.inverted_drawer in ("True", True):
             log.info("Inverting drawer check logic")
             self._driver.inverted_drawer = True
@@ -169,8 +166,47 @@ class BaseDevice:
         is coming from the serial port.   It is necessary that a gobject main
         loop is already running before calling this method.
         """
+        try:
+            from gi.repository import GObject
+        except ImportError:
+            log.warning('GObject is not available, cannot watch %r' % self)
+            return
         GObject.io_add_watch(self.get_port().fd, GObject.IO_IN, lambda fd, cond: func(self, cond))
 
+    def get_spooler(self):
+        """ Get the L{stoqdrivers.spooler.DeviceSpooler} that serializes the
+        access to the physical device behind this object. All the objects
+        created for the same device share the same spooler.
+        """
+        return get_spooler(self)
+
+    def get_metrics(self):
+        """ Get a snapshot of the metrics of this device. See
+        L{stoqdrivers.metrics}.
+
+        @returns: a dict with the driver I{name}, the latency histograms of
+          each I{commands}, the transport I{counters} and, if the device has
+          a spooler, its I{spooler} metrics
+        """
+        snapshot = metrics.snapshot(self._driver)
+        port = getattr(self._driver, '_port', None)
+        port_metrics = port is not None and metrics.get_metrics(port, create=False)
+        if port_metrics:
+            counters = snapshot['counters']
+            for name, value in port_metrics.counters.items():
+                counters[name] = counters.get(name, 0) + value
+        spooler = get_spooler(self, create=False)
+        if spooler is not None:
+            snapshot['spooler'] = spooler.get_metrics()
+        return snapshot
+
+    def get_wire_trace(self):
+        """ Get the L{stoqdrivers.trace.WireTrace} with the last bytes
+        exchanged with the device, or None if the driver has none. Save it
+        to reproduce a failure with the tests PlaybackPort.
+        """
+        return get_wire_trace(self._driver)
+
     def set_port(self, port):
         self._driver.set_port(port)
 
@@ -26,15 +26,116 @@
 ##
 """
 Useful routines when parsing the configuration file
+
+The parsed files are cached for the whole process, keyed by their real path
+and modification time, so creating a L{StoqdriversConfig} (which happens on
+every device creation) only costs a stat() of the search paths once the file
+was parsed. The search itself is not cached, so a file created later in a
+path that comes first is found by the next instance.
 """
 import os
-from configparser import ConfigParser
+from configparser import ConfigParser, Error, RawConfigParser
+import threading
 
 from stoqdrivers.exceptions import ConfigError
 from stoqdrivers.translation import stoqdrivers_gettext
 
 _ = stoqdrivers_gettext
 
+_NoDefault = object()
+
+#: Options that are converted to something other than a string
+OPTION_TYPES = {
+    'inverted_drawer': bool,
+    'baudrate': int,
+}
+
+_cache_lock = threading.RLock()
+# realpath -> _ParsedConfig
+_parsed_files = {}
+_change_callbacks = []
+
+
+def add_change_callback(callback):
+    """Call I{callback} when a configuration file changes.
+
+    @param callback: called with the real path of the file, after the new
+      contents were parsed, when a file is found to be modified on disk
+      or by L{StoqdriversConfig.reload}
+    """
+    _change_callbacks.append(callback)
+
+
+def remove_change_callback(callback):
+    _change_callbacks.remove(callback)
+
+
+def clear_cache():
+    """Forget all the parsed configuration files."""
+    with _cache_lock:
+        _parsed_files.clear()
+
+
+def _convert(name, value):
+    option_type = OPTION_TYPES.get(name)
+    if option_type is bool:
+        state = ConfigParser.BOOLEAN_STATES.get(value.lower())
+        if state is not None:
+            return state
+    elif option_type is not None:
+        try:
+            return option_type(value)
+        except ValueError:
+            pass
+    return value
+
+
+class _ParsedConfig:
+    # Shared by all the instances that read the same file, so it must never
+    # be modified
+    def __init__(self, filename, mtime):
+        self.filename = filename
+        self.mtime = mtime
+        parser = RawConfigParser()
+        try:
+            with open(filename) as fp:
+                parser.read_file(fp, filename)
+        except Error as e:
+            raise ConfigError(_("Could not parse %s: %s") % (filename, e))
+        # section -> {option: value}, the values as strings
+        self.values = dict((section, dict(parser.items(section)))
+                           for section in parser.sections())
+
+
+def _get_parsed(filename, force=False):
+    """Get the parsed contents of a file, parsing it again if it changed
+    since the last time.
+
+    @returns: a L{_ParsedConfig} or None if the file does not exist
+    """
+    try:
+        mtime = os.stat(filename).st_mtime_ns
+    except OSError:
+        with _cache_lock:
+            _parsed_files.pop(filename, None)
+        return None
+
+    with _cache_lock:
+        old = _parsed_files.get(filename)
+        if old is not None and old.mtime == mtime and not force:
+            return old
+        try:
+            parsed = _ParsedConfig(filename, mtime)
+        except OSError:
+            _parsed_files.pop(filename, None)
+            return None
+        _parsed_files[filename] = parsed
+
+    if old is not None and old.values != parsed.values:
+        for callback in list(_change_callbacks):
+            callback(filename)
+    return parsed
+
 
 class StoqdriversConfig:
 
@@ -44,20 +145,23 @@ class StoqdriversConfig:
         """ filename is the name of the configuration file we're reading """
 
         self.filename = filename or ('stoqdrivers.conf')
-        self.config = ConfigParser()
+        self._config = None
         self._load_config()
 
+    @property
+    def config(self):
+        # A parser with the options of this instance, created on demand for
+        # the callers that still use it. Changing it doesn't affect the
+        # other instances.
+        if self._config is None:
+            self._config = RawConfigParser()
+            self._config.read_dict(self._values)
+        return self._config
+
     def get_homepath(self):
         return os.path.join(os.getenv('HOME'), '.' + self.domain)
 
-    def _open_config(self, path):
-        filename = os.path.join(path, self.filename)
-        if not os.path.exists(filename):
-            return False
-        self.config.read(filename)
-        return True
-
-    def _load_config(self):
+    def _get_search_paths(self):
         # Try to load configuration  from:
         # 1) $HOME/.$domain/$filename
         # 2) $PREFIX/etc/$domain/$filename
@@ -73,26 +177,79 @@ class StoqdriversConfig:
         homepath = self.get_homepath()
         etcpath = os.path.join(self.prefix, 'etc', self.domain)
         globetcpath = os.path.join(os.sep, 'etc', self.domain)
-        if not (self._open_config(homepath) or self._open_config(etcpath) or
-                self._open_config(globetcpath)):
+        return homepath, etcpath, globetcpath
+
+    def _load_config(self, force=False):
+        paths = self._get_search_paths()
+        for path in paths:
+            filename = os.path.realpath(os.path.join(path, self.filename))
+            parsed = _get_parsed(filename, force)
+            if parsed is not None:
+                break
+        else:
             raise ConfigError(_("Config file %s not found in: `%s', `%s' and "
-                                "`%s'") % (self.filename, homepath, etcpath, globetcpath))
+                                "`%s'") % ((self.filename, ) + paths))
+
+        self._parsed = parsed
+        self._values = parsed.values
+        self._config = None
+
+    def reload(self):
+        """Parse the configuration file again, even if it did not change.
+
+        The changes made with L{set_option} are lost.
+        """
+        self._load_config(force=True)
 
     def has_section(self, section):
-        return self.config.has_section(section)
+        return section in self._values
 
     def has_option(self, name, section='General'):
-        return self.config.has_option(section, name)
+        return name.lower() in self._values.get(section, ())
 
     def get_option(self, name, section='General'):
-        if not self.config.has_section(section):
+        values = self._values.get(section)
+        if values is None:
             raise ConfigError(_("Invalid section: %s") % section)
-        elif not self.config.has_option(section, name):
+        try:
+            return values[name.lower()]
+        except KeyError:
             raise ConfigError(_("%s does not have option: %s")
                               % (self.filename, name))
-        return self.config.get(section, name)
 
-    def set_option(self, name, section='General'):
-        if not self.config.has_section(section):
+    def get_value(self, name, section='General', default=_NoDefault):
+        """Get an option converted to the type in L{OPTION_TYPES}.
+
+        @param default: returned when the option is not set. If not given, a
+          ConfigError is raised instead.
+        """
+        values = self._values.get(section)
+        name = name.lower()
+        if values is None or name not in values:
+            if default is not _NoDefault:
+                return default
+            # Raises the appropriate ConfigError
+            self.get_option(name, section)
+        return _convert(name, values[name])
+
+    def get_bool(self, name, section='General', default=_NoDefault):
+        """Get an option as a boolean."""
+        value = self.get_value(name, section, default)
+        if isinstance(value, str):
+            state = ConfigParser.BOOLEAN_STATES.get(value.lower())
+            if state is None:
+                raise ConfigError(_("%s is not a boolean: %s")
+                                  % (name, value))
+            return state
+        return bool(value)
+
+    def set_option(self, name, section='General', value=''):
+        """Set an option on this instance only, the file is not changed."""
+        if section not in self._values:
             raise ConfigError(_("Invalid section: %s") % section)
-        self.config.set(section, name)
+        if self._values is self._parsed.values:
+            # Copy on write, the parsed values are shared
+            self._values = dict((key, dict(values))
+                                for key, values in self._values.items())
+        self._values[section][name.lower()] = value
+        self._config = None
@@ -0,0 +1,41 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Local print daemon.
+
+The daemon owns every configured device and accepts jobs from other
+processes over a Unix socket, so the devices are opened and initialized only
+once and two processes never fight over the same port. See
+L{stoqdrivers.daemon.server} and L{stoqdrivers.daemon.client}.
+"""
+
+import os
+
+
+def get_default_socket_path():
+    """The socket used when none is specified, $XDG_RUNTIME_DIR (or /tmp)
+    /stoqdrivers.sock
+    """
+    directory = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(directory, 'stoqdrivers.sock')
@@ -0,0 +1,261 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Client of the print daemon.
+
+L{DaemonClient.get_printer} returns a proxy with the same methods as the
+printer owned by the daemon, so code written against
+L{stoqdrivers.printers.nonfiscal.NonFiscalPrinter} or
+L{stoqdrivers.printers.fiscal.FiscalPrinter} works unchanged::
+
+    client = DaemonClient()
+    printer = client.get_printer('receipt')
+    printer.print_line('Hello')
+    with printer.batch():
+        printer.print_line('Coupon')
+        printer.cut_paper()
+"""
+
+from concurrent.futures import Future
+import itertools
+import logging
+import socket
+import threading
+
+from stoqdrivers.daemon import get_default_socket_path
+from stoqdrivers.daemon.protocol import (DaemonError, decode_message,
+                                         encode_message, error_from_dict)
+
+log = logging.getLogger('stoqdrivers.daemon.client')
+
+
+class RemoteBatch:
+    """Calls collected by L{RemotePrinter.batch}, sent as a single request
+    when the block finishes. The daemon executes them atomically and stops
+    at the first error.
+
+    @ivar future: a future for the list of results, set after the batch is
+      sent
+    """
+
+    def __init__(self, printer):
+        self._printer = printer
+        self.calls = []
+        self.future = None
+
+    def __enter__(self):
+        self._printer._batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._printer._batch = None
+        if exc_type is None and self.calls:
+            self.future = self._printer._client.send_batch(
+                self._printer.name, self.calls)
+
+    def add(self, method, args, kwargs):
+        self.calls.append(dict(method=method, args=list(args), kwargs=kwargs))
+
+    def wait(self, timeout=None):
+        """Wait for the batch to be executed.
+
+        @returns: the list of results, one for each call
+        """
+        if self.future is None:
+            return []
+        return self.future.result(timeout)
+
+
+class RemotePrinter:
+    """A proxy for a printer owned by the daemon.
+
+    Calling a method blocks until the daemon replies. Inside a L{batch}
+    block the calls are only collected and return None.
+    """
+
+    def __init__(self, client, name, description):
+        self._client = client
+        self._methods = frozenset(description['methods'])
+        self._attributes = description['attributes']
+        self._batch = None
+        self.name = name
+        self.type = description['type']
+
+    def __getattr__(self, attr):
+        if attr in self._attributes:
+            # Read again, the value may have changed
+            return self._client.get_attributes(self.name)[attr]
+        if attr not in self._methods:
+            raise AttributeError("%s has no method %s" % (self.name, attr))
+
+        def method(*args, **kwargs):
+            if self._batch is not None:
+                self._batch.add(attr, args, kwargs)
+                return None
+            return self.call_async(attr, *args, **kwargs).result(
+                self._client.timeout)
+        method.__name__ = attr
+        return method
+
+    def call_async(self, method, *args, **kwargs):
+        """Call I{method} without waiting for the reply.
+
+        @returns: a L{concurrent.futures.Future} for the result
+        """
+        return self._client.send_call(self.name, method, args, kwargs)
+
+    def batch(self):
+        """Collect the calls made inside the block in a L{RemoteBatch}."""
+        return RemoteBatch(self)
+
+
+class DaemonClient:
+    """A connection to the print daemon.
+
+    @param path: the path of the daemon socket
+    @param timeout: how long, in seconds, the blocking calls wait for the
+      daemon. None means forever.
+    """
+
+    def __init__(self, path=None, timeout=None):
+        self.path = path or get_default_socket_path()
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._callbacks = []
+        self._descriptions = None
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(self.path)
+        self._thread = threading.Thread(target=self._read_loop,
+                                        name='stoqdrivers-daemon-client')
+        self._thread.daemon = True
+        self._thread.start()
+
+    #
+    # Public API
+    #
+
+    def get_devices(self):
+        """The names of the devices owned by the daemon."""
+        return sorted(self._describe())
+
+    def get_printer(self, name):
+        """Get a L{RemotePrinter} for the device I{name}."""
+        descriptions = self._describe()
+        if name not in descriptions:
+            raise DaemonError("Unknown device: %s" % name)
+        return RemotePrinter(self, name, descriptions[name])
+
+    def get_attributes(self, name):
+        """Read the current values of the properties of the device I{name}.
+
+        @returns: a dict mapping the property names to their values
+        """
+        return self._send(dict(method='attributes',
+                               args=[name])).result(self.timeout)
+
+    def send_call(self, device, method, args=(), kwargs=None):
+        return self._send(dict(device=device, method=method, args=list(args),
+                               kwargs=kwargs or {}))
+
+    def send_batch(self, device, calls):
+        return self._send(dict(device=device, batch=calls))
+
+    def subscribe(self, callback):
+        """Receive the daemon status events.
+
+        @param callback: called on the client thread with the event dict,
+          which has the I{event} (queued, done or failed), I{device},
+          I{request} and I{queue_depth} keys
+        """
+        with self._lock:
+            first = not self._callbacks
+            self._callbacks.append(callback)
+        if first:
+            self._send(dict(method='subscribe')).result(self.timeout)
+
+    def close(self):
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        self._thread.join()
+
+    #
+    # Private
+    #
+
+    def _describe(self):
+        if self._descriptions is None:
+            self._descriptions = self._send(
+                dict(method='describe')).result(self.timeout)
+        return self._descriptions
+
+    def _send(self, message):
+        future = Future()
+        with self._lock:
+            message['id'] = request_id = next(self._ids)
+            self._futures[request_id] = future
+            try:
+                self._socket.sendall(encode_message(message))
+            except OSError as e:
+                del self._futures[request_id]
+                raise DaemonError("Could not send to the daemon: %s" % e)
+        return future
+
+    def _read_loop(self):
+        fp = self._socket.makefile('rb')
+        try:
+            for line in fp:
+                try:
+                    message = decode_message(line)
+                except ValueError:
+                    log.warning('Invalid message from the daemon: %r' % line)
+                    continue
+                if 'event' in message:
+                    for callback in list(self._callbacks):
+                        try:
+                            callback(message)
+                        except Exception:
+                            log.exception('Error in the callback %r' % (
+                                callback, ))
+                    continue
+                with self._lock:
+                    future = self._futures.pop(message.get('id'), None)
+                if future is None:
+                    continue
+                if 'error' in message:
+                    future.set_exception(error_from_dict(message['error']))
+                else:
+                    future.set_result(message.get('result'))
+        except (OSError, ValueError):
+            pass
+        finally:
+            fp.close()
+            with self._lock:
+                futures, self._futures = self._futures, {}
+            for future in futures.values():
+                future.set_exception(DaemonError("Connection to the daemon closed"))
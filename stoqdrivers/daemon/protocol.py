@@ -0,0 +1,99 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+The JSON-lines protocol spoken by the print daemon.
+
+Every message is a JSON object on a single line, serialized with
+L{stoqdrivers.utils.json_dumps}, so Decimals, dates and bytes survive the
+trip. A client sends requests::
+
+    {"id": 1, "device": "receipt", "method": "print_line", "args": ["foo"]}
+    {"id": 2, "device": "receipt", "batch": [{"method": "print_line",
+                                             "args": ["foo"]},
+                                            {"method": "cut_paper"}]}
+    {"id": 3, "method": "describe"}
+    {"id": 4, "method": "attributes", "args": ["receipt"]}
+    {"id": 5, "method": "subscribe"}
+
+Requests are answered asynchronously, in the order they finish, with a
+message carrying the same id and either a I{result} (a list of results for
+a batch) or an I{error}. Clients that subscribed also receive status events,
+which have an I{event} key instead of an I{id}.
+"""
+
+from stoqdrivers import exceptions
+from stoqdrivers.utils import json_dumps, json_loads
+
+#: The requests handled by the daemon itself, not sent to a device
+CONTROL_METHODS = frozenset(['describe', 'attributes', 'subscribe',
+                             'unsubscribe'])
+
+EVENT_QUEUED = 'queued'
+EVENT_DONE = 'done'
+EVENT_FAILED = 'failed'
+
+
+class DaemonError(Exception):
+    "An error reported by the print daemon"
+
+    def __init__(self, message, type_name=None):
+        Exception.__init__(self, message)
+        self.type_name = type_name
+
+
+def encode_message(message):
+    """Serialize a message to a line of bytes."""
+    return (json_dumps(message) + '\n').encode()
+
+
+def decode_message(line):
+    """Deserialize a line created by L{encode_message}.
+
+    @raises ValueError: if the line is not a valid message
+    """
+    message = json_loads(line.decode())
+    if not isinstance(message, dict):
+        raise ValueError("Invalid message: %r" % (line, ))
+    return message
+
+
+def error_to_dict(error):
+    return dict(type=error.__class__.__name__, message=str(error))
+
+
+def error_from_dict(data):
+    """Rebuild the exception described by L{error_to_dict}.
+
+    Exceptions defined in L{stoqdrivers.exceptions} are raised again with the
+    same type, everything else becomes a L{DaemonError}.
+    """
+    type_name = data.get('type')
+    message = data.get('message', '')
+    exc_class = getattr(exceptions, type_name or '', None)
+    if isinstance(exc_class, type) and issubclass(exc_class, Exception):
+        try:
+            return exc_class(message)
+        except TypeError:
+            pass
+    return DaemonError(message, type_name)
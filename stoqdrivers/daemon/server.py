@@ -0,0 +1,467 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+The print daemon server.
+
+Each device is owned by its L{stoqdrivers.spooler.DeviceSpooler}, so the
+device session stays open between jobs and the jobs of all the clients are
+serialized on a single thread per device. The asyncio loop only parses the
+requests and sends the replies and the status events back. The calls that
+queue up for a device while it is busy are batched and sent to it by a
+single spooler job.
+
+The devices are described on a config file, one section per device::
+
+    [receipt]
+    type = nonfiscal
+    brand = bematech
+    model = MP4200TH
+    device = /dev/ttyS0
+
+    [ecf]
+    type = fiscal
+    brand = epson
+    model = FBII
+    device = /dev/ttyUSB0
+    baudrate = 115200
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import Future
+from configparser import ConfigParser
+from decimal import Decimal
+import logging
+import os
+import threading
+
+from stoqdrivers.daemon import get_default_socket_path
+from stoqdrivers.daemon.protocol import (CONTROL_METHODS, EVENT_DONE,
+                                         EVENT_FAILED, EVENT_QUEUED,
+                                         decode_message, encode_message,
+                                         error_to_dict)
+from stoqdrivers.exceptions import ConfigError
+from stoqdrivers.spooler import (PRIORITY_URGENT, URGENT_METHODS,
+                                 get_spooler, remove_spooler)
+
+log = logging.getLogger('stoqdrivers.daemon')
+
+#: Public methods of the printers that must not be called remotely
+_HIDDEN_METHODS = frozenset(['get_spooler', 'get_port', 'set_port',
+                             'notify_read', 'check_interfaces',
+                             'enable_journal', 'get_journal',
+                             'recover_from_journal'])
+
+
+_SIMPLE_TYPES = (str, bytes, int, float, Decimal, type(None))
+
+
+def get_remote_methods(device):
+    """The names of the methods of I{device} that can be called remotely."""
+    methods = set()
+    for klass in type(device).__mro__:
+        if klass is object:
+            continue
+        for name, value in vars(klass).items():
+            if (name.startswith('_') or name in _HIDDEN_METHODS or
+                    not callable(value)):
+                continue
+            methods.add(name)
+    return methods
+
+
+def _get_attributes(device):
+    attributes = {}
+    for klass in type(device).__mro__:
+        for name, value in vars(klass).items():
+            if (name.startswith('_') or not isinstance(value, property) or
+                    name in attributes):
+                continue
+            try:
+                value = getattr(device, name)
+            except Exception as e:
+                log.info('Could not read %s from %r: %s' % (name, device, e))
+                continue
+            if isinstance(value, _SIMPLE_TYPES):
+                attributes[name] = value
+    return attributes
+
+
+def _run_batch(device, calls):
+    results = []
+    for i, (method, args, kwargs) in enumerate(calls):
+        try:
+            results.append(getattr(device, method)(*args, **kwargs))
+        except Exception as e:
+            # Nothing after the failed call is sent to the device
+            e.batch_index = i
+            raise
+    return results
+
+
+class _PendingCalls:
+    """The single calls waiting for a device, executed by one spooler job.
+
+    Calls can be added until the job starts, so everything that queues up
+    while the device is busy is sent to it at once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = []
+        self._started = False
+
+    def add(self, func, args, kwargs):
+        """Add a call to the job.
+
+        @returns: a future for the call result, or None if the job already
+          started
+        """
+        with self._lock:
+            if self._started:
+                return None
+            future = Future()
+            self._calls.append((func, args, kwargs, future))
+            return future
+
+    def run(self):
+        with self._lock:
+            self._started = True
+            calls = self._calls
+        # The calls come from different requests, a failure doesn't stop
+        # the others
+        for func, args, kwargs, future in calls:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class _Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.subscribed = False
+
+    def send(self, message):
+        if self.writer.is_closing():
+            return
+        try:
+            data = encode_message(message)
+        except TypeError as e:
+            # The driver returned something that can't be serialized
+            error = TypeError("The result can't be sent: %s" % (e, ))
+            data = encode_message(dict(id=message.get('id'),
+                                       error=error_to_dict(error)))
+        self.writer.write(data)
+
+
+class PrintServer:
+    """Serve the jobs of the local clients for a set of devices.
+
+    @param devices: a dict mapping names to the
+      L{stoqdrivers.printers.nonfiscal.NonFiscalPrinter} or
+      L{stoqdrivers.printers.fiscal.FiscalPrinter} objects owned by the
+      daemon
+    @param path: the path of the Unix socket
+    """
+
+    def __init__(self, devices, path=None):
+        self.devices = devices
+        self.path = path or get_default_socket_path()
+        self._server = None
+        self._clients = set()
+        self._methods = {}
+        self._pending = {}
+
+    async def start(self):
+        for name, device in self.devices.items():
+            self._methods[name] = get_remote_methods(device)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_client,
+                                                       path=self.path)
+        log.info('Listening on %s for %s' % (self.path,
+                                             ', '.join(sorted(self.devices))))
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for client in list(self._clients):
+            client.writer.close()
+        for device in self.devices.values():
+            remove_spooler(device)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    #
+    # Private
+    #
+
+    async def _handle_client(self, reader, writer):
+        client = _Client(writer)
+        self._clients.add(client)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = decode_message(line)
+                except ValueError as e:
+                    client.send(dict(id=None, error=error_to_dict(e)))
+                    continue
+                try:
+                    self._dispatch(client, message)
+                except Exception as e:
+                    client.send(dict(id=message.get('id'),
+                                     error=error_to_dict(e)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(client)
+            writer.close()
+
+    def _dispatch(self, client, message):
+        request_id = message.get('id')
+        name = message.get('device')
+        if name is None:
+            self._dispatch_control(client, request_id, message.get('method'),
+                                   message.get('args', []))
+            return
+
+        device = self.devices.get(name)
+        if device is None:
+            raise ValueError("Unknown device: %s" % (name, ))
+
+        if 'batch' in message:
+            calls = [(call['method'], call.get('args', []),
+                      call.get('kwargs', {})) for call in message['batch']]
+        else:
+            calls = [(message.get('method'), message.get('args', []),
+                      message.get('kwargs', {}))]
+        for method, args, kwargs in calls:
+            if method not in self._methods[name]:
+                raise ValueError("%s does not support %s" % (name, method))
+
+        spooler = get_spooler(device)
+        if 'batch' in message:
+            # The calls sent after the batch must not run before it
+            self._pending.pop(name, None)
+            future = spooler.submit(_run_batch, device, calls)
+        else:
+            method, args, kwargs = calls[0]
+            future = self._submit_call(name, method, args, kwargs)
+        self._broadcast(EVENT_QUEUED, name, request_id,
+                        queue_depth=spooler.get_queue_depth())
+        asyncio.ensure_future(self._reply(client, request_id, name, future))
+
+    def _submit_call(self, name, method, args, kwargs):
+        device = self.devices[name]
+        spooler = get_spooler(device)
+        if method in URGENT_METHODS:
+            return spooler.call(method, *args, **kwargs)
+
+        func = getattr(device, method)
+        pending = self._pending.get(name)
+        future = pending and pending.add(func, args, kwargs)
+        if future is None:
+            pending = self._pending[name] = _PendingCalls()
+            future = pending.add(func, args, kwargs)
+            spooler.submit(pending.run)
+        return future
+
+    def _dispatch_control(self, client, request_id, method, args):
+        if method not in CONTROL_METHODS:
+            raise ValueError("Unknown request: %s" % (method, ))
+        if method == 'describe':
+            asyncio.ensure_future(
+                self._reply_control(client, request_id, self._describe()))
+            return
+        elif method == 'attributes':
+            name = args[0] if args else None
+            if name not in self.devices:
+                raise ValueError("Unknown device: %s" % (name, ))
+            asyncio.ensure_future(self._reply_control(
+                client, request_id, self._read_attributes(name)))
+            return
+        elif method == 'subscribe':
+            client.subscribed = True
+            result = True
+        elif method == 'unsubscribe':
+            client.subscribed = False
+            result = True
+        client.send(dict(id=request_id, result=result))
+
+    async def _read_attributes(self, name):
+        # The properties may talk to the device, so they are read on its
+        # I/O thread
+        device = self.devices[name]
+        future = get_spooler(device).submit(_get_attributes, device,
+                                            priority=PRIORITY_URGENT)
+        return await asyncio.wrap_future(future)
+
+    async def _describe(self):
+        descriptions = {}
+        for name, device in self.devices.items():
+            descriptions[name] = dict(
+                type=type(device).__name__,
+                methods=sorted(self._methods[name]),
+                attributes=await self._read_attributes(name))
+        return descriptions
+
+    async def _reply_control(self, client, request_id, coro):
+        try:
+            result = await coro
+        except Exception as e:
+            client.send(dict(id=request_id, error=error_to_dict(e)))
+        else:
+            client.send(dict(id=request_id, result=result))
+
+    async def _reply(self, client, request_id, name, future):
+        spooler = get_spooler(self.devices[name])
+        try:
+            result = await asyncio.wrap_future(future)
+        except Exception as e:
+            error = error_to_dict(e)
+            if hasattr(e, 'batch_index'):
+                error['index'] = e.batch_index
+            # The event goes first, so a client waiting for the reply has
+            # already seen it
+            self._broadcast(EVENT_FAILED, name, request_id, error=error,
+                            queue_depth=spooler.get_queue_depth())
+            client.send(dict(id=request_id, error=error))
+        else:
+            self._broadcast(EVENT_DONE, name, request_id,
+                            queue_depth=spooler.get_queue_depth())
+            client.send(dict(id=request_id, result=result))
+
+    def _broadcast(self, event, name, request_id, **data):
+        message = dict(event=event, device=name, request=request_id)
+        message.update(data)
+        for client in self._clients:
+            if client.subscribed:
+                client.send(message)
+
+
+def load_devices(filename):
+    """Create the devices described on a daemon config file.
+
+    @returns: a dict mapping the section names to the devices
+    """
+    from stoqdrivers.printers.fiscal import FiscalPrinter
+    from stoqdrivers.printers.nonfiscal import NonFiscalPrinter
+
+    config = ConfigParser()
+    if not config.read(filename):
+        raise ConfigError("Could not read the daemon config %s" % filename)
+
+    devices = {}
+    for name in config.sections():
+        section = config[name]
+        device_type = section.get('type', 'nonfiscal')
+        if device_type == 'fiscal':
+            factory = FiscalPrinter
+        elif device_type == 'nonfiscal':
+            factory = NonFiscalPrinter
+        else:
+            raise ConfigError("Invalid device type for %s: %s"
+                              % (name, device_type))
+        kwargs = dict(brand=section.get('brand'),
+                      model=section.get('model'),
+                      device=section.get('device'),
+                      interface=section.get('interface', 'serial'),
+                      baudrate=section.getint('baudrate', 9600),
+                      inverted_drawer=section.get('inverted_drawer'),
+                      device_name=section.get('device_name'))
+        for option in ['vendor_id', 'product_id']:
+            if option in section:
+                kwargs[option] = int(section[option], 16)
+        log.info('Opening %s: %s %s' % (name, kwargs['brand'], kwargs['model']))
+        devices[name] = factory(**kwargs)
+    return devices
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Stoqdrivers print daemon')
+    parser.add_argument('config', help='The file describing the devices')
+    parser.add_argument('--socket', default=None,
+                        help='The Unix socket to listen on (default: %s)'
+                        % get_default_socket_path())
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve the device metrics on this local port')
+    parser.add_argument('--metrics-textfile', default=None,
+                        help='Write the device metrics to this file')
+    parser.add_argument('--metrics-probe', action='store_true',
+                        help='Also read the status of the devices (paper, '
+                        'drawer, COO) for the metrics')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.DEBUG if options.verbose else logging.INFO)
+    devices = load_devices(options.config)
+    server = PrintServer(devices, options.socket)
+
+    http_server = writer = None
+    if options.metrics_port or options.metrics_textfile:
+        from stoqdrivers import exporter, metrics
+        metrics.enable()
+        metrics_exporter = exporter.MetricsExporter(
+            devices, probe=options.metrics_probe)
+        if options.metrics_port:
+            http_server = exporter.start_http_server(metrics_exporter,
+                                                     options.metrics_port)
+        if options.metrics_textfile:
+            writer = exporter.TextfileWriter(metrics_exporter,
+                                             options.metrics_textfile)
+            writer.start()
+
+    async def serve():
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if http_server is not None:
+            http_server.shutdown()
+        if writer is not None:
+            writer.stop()
+    return 0
@@ -29,27 +29,63 @@
 #   http://www.epson.co.uk/support/manuals/pdf/ESCP/Part_1.pdf
 #   http://www.epson.co.uk/support/manuals/pdf/ESCP/Part_2.pdf
 #
-""" Driver for EPSON Esc/P and Esc/P2 printers. """
+""" Driver for EPSON Esc/P and Esc/P2 printers.
 
+The output is composed in memory and written to the device one page at a
+time, so a long report becomes one write per page instead of one per command.
+Reports can be streamed with L{EscPPrinter.print_pages}, which only keeps the
+current page in memory::
+
+    printer = EscPPrinter('/dev/lp0')
+    printer.print_pages(build_pages())
+    printer.close()
+"""
+
+from contextlib import contextmanager
+import logging
 import struct
 
-ESC = '\x1b'
+from stoqdrivers.utils import encode_text, str2bytes
+
+log = logging.getLogger('stoqdrivers.escp')
 
-CMD_INIT = '@'
-CMD_PRINT_QUALITY = 'x'
-CMD_PROPORTIONAL = 'p'
-CMD_FORM_FEED = '\xff'
-CMD_EJECT = '\x19'
+ESC = b'\x1b'
+FF = b'\x0c'
 
-QUALITY_DRAFT = '0'
-QUALITY_LQ = '1'
-QUALITY_NLQ = '1'
+CMD_INIT = b'@'
+CMD_PRINT_QUALITY = b'x'
+CMD_PROPORTIONAL = b'p'
+CMD_ADVANCE = b'J'
+CMD_EJECT = b'\x19'
+
+QUALITY_DRAFT = b'0'
+QUALITY_LQ = b'1'
+QUALITY_NLQ = b'1'
 
 
 class EscPPrinter(object):
-    def __init__(self, device):
-        self.device = device
-        self.fp = open(device, 'w')
+    """An Esc/P printer.
+
+    @param device: the device filename (eg, /dev/lp0) or a binary file-like
+      object (a file, a pipe or a socket file) to write the output to
+    @param encoding: the encoding of the text sent to the printer
+    @param max_buffer_size: the buffer is written before reaching this size,
+      even in the middle of a page
+    """
+
+    def __init__(self, device, encoding='cp850', max_buffer_size=64 * 1024):
+        if hasattr(device, 'write'):
+            self.fp = device
+            self.device = getattr(device, 'name', None)
+            self._owns_fp = False
+        else:
+            self.fp = open(device, 'wb')
+            self.device = device
+            self._owns_fp = True
+        self.encoding = encoding
+        self.max_buffer_size = max_buffer_size
+        self._buffer = bytearray()
+        self._flushes = 0
 
         self._command(CMD_INIT)
 
@@ -57,19 +93,40 @@ class EscPPrinter(object):
         chars = command
         for arg in args:
             if arg is True:
-                v = '1'
+                v = b'1'
             elif arg is False:
-                v = '0'
+                v = b'0'
             else:
                 v = arg
 
             chars += v
-        cmd = '%s%s' % (ESC, chars)
-        self.send(cmd)
+        self._append(ESC + chars)
+
+    def _append(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self.max_buffer_size:
+            self.flush()
 
     def send(self, data):
-        self.fp.write(data)
+        """Add text (or raw bytes) to the current page."""
+        if isinstance(data, str):
+            data = str2bytes(encode_text(data, self.encoding))
+        self._append(data)
+
+    def flush(self):
+        """Write everything that was buffered to the device."""
+        if not self._buffer:
+            return
+        self.fp.write(self._buffer)
         self.fp.flush()
+        del self._buffer[:]
+        self._flushes += 1
+
+    def close(self):
+        """Write the pending output and close the device."""
+        self.flush()
+        if self._owns_fp:
+            self.fp.close()
 
     def set_draft_mode(self):
         self._command(CMD_PRINT_QUALITY, QUALITY_DRAFT)
@@ -79,13 +136,66 @@ class EscPPrinter(object):
 
     def done(self):
         self._command(CMD_INIT)
+        self.flush()
 
     def form_feed(self):
-        self._command(CMD_FORM_FEED)
+        """End the current page and write it to the device."""
+        self._append(FF)
+        self.flush()
 
     def set_vertical_position(self, position):
-        args = struct.pack('b', position)
-        self._command('J', *args)
+        """Advance the paper by position/180 inches."""
+        self._command(CMD_ADVANCE, struct.pack('B', position))
+
+    #
+    # Pages
+    #
+
+    @contextmanager
+    def page(self):
+        """Compose a page, that is fed and written when the block ends::
+
+            with printer.page():
+                printer.send('Title\\n')
+                printer.set_vertical_position(90)
+                printer.send('Body\\n')
+
+        If the block raises, the page is discarded. When part of it was
+        already written (see max_buffer_size) the rest is discarded and the
+        paper is fed, so the next page starts on a new sheet.
+        """
+        start = len(self._buffer)
+        flushes = self._flushes
+        try:
+            yield self
+        except BaseException:
+            if self._flushes == flushes:
+                del self._buffer[start:]
+            else:
+                del self._buffer[:]
+                self.form_feed()
+            raise
+        self.form_feed()
+
+    def print_pages(self, pages):
+        """Print a report, one page at a time.
+
+        @param pages: an iterable (usually a generator) of pages, each one an
+          iterable of text lines or of bytes. A line can also be an int,
+          that advances the paper (see L{set_vertical_position})
+        @returns: the number of pages printed
+        """
+        n_pages = 0
+        for lines in pages:
+            with self.page():
+                for line in lines:
+                    if isinstance(line, int):
+                        self.set_vertical_position(line)
+                    else:
+                        self.send(line)
+            n_pages += 1
+        log.debug('Printed %d pages on %s' % (n_pages, self.device))
+        return n_pages
 
 
 def test():
@@ -97,6 +207,7 @@ def test():
         'blandit a, leo amet.\n'.upper())
 
     printer.done()
+    printer.close()
 
 
 if __name__ == '__main__':
@@ -21,7 +21,16 @@
 ## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
 ## USA.
 
-from stoqdrivers.utils import encode_text, GRAPHICS_8BITS, GRAPHICS_24BITS, matrix2graphics
+from collections import namedtuple
+import logging
+import time
+
+from stoqdrivers import metrics
+from stoqdrivers.exceptions import DriverError, InvalidReplyException
+from stoqdrivers.listener import get_default_listener
+from stoqdrivers.logos import get_logo_hash, LogoIndex
+from stoqdrivers.utils import (encode_text, GRAPHICS_8BITS, GRAPHICS_24BITS,
+                               matrix2columns, matrix2graphics, matrix2raster)
 
 # Based on python-escpos's escpos.escpos.Escpos:
 #
@@ -29,6 +38,166 @@ from stoqdrivers.utils import encode_text, GRAPHICS_8BITS, GRAPHICS_24BITS, matr
 
 ESC = '\x1b'  # Escape
 GS = '\x1d'  # Group Separator
+DLE = '\x10'  # Data Link Escape
+EOT = '\x04'  # End of Transmission
+FS = '\x1c'  # File Separator
+
+log = logging.getLogger('stoqdrivers.escpos')
+
+# DLE EOT n: real-time status transmission
+STATUS_PRINTER = 1
+STATUS_OFFLINE = 2
+STATUS_ERROR = 3
+STATUS_PAPER = 4
+
+
+class RealTimeStatus(namedtuple('RealTimeStatus',
+                                'printer offline error paper timestamp')):
+    """The status bytes sent by the printer in reply to DLE EOT 1 to 4.
+
+    @ivar timestamp: when the status was read (see L{time.monotonic})
+    """
+    __slots__ = ()
+
+    def get_age(self):
+        """How many seconds ago the status was read"""
+        return time.monotonic() - self.timestamp
+
+    @property
+    def is_online(self):
+        return not self.printer & 0x08
+
+    @property
+    def drawer_pin_high(self):
+        """The level of the pin 3 of the drawer kick-out connector"""
+        return bool(self.printer & 0x04)
+
+    @property
+    def cover_open(self):
+        return bool(self.offline & 0x04)
+
+    @property
+    def feeding_by_button(self):
+        return bool(self.offline & 0x08)
+
+    @property
+    def stopped_by_paper_end(self):
+        return bool(self.offline & 0x20)
+
+    @property
+    def has_error(self):
+        return bool(self.offline & 0x40)
+
+    @property
+    def recoverable_error(self):
+        return bool(self.error & 0x04)
+
+    @property
+    def autocutter_error(self):
+        return bool(self.error & 0x08)
+
+    @property
+    def unrecoverable_error(self):
+        return bool(self.error & 0x20)
+
+    @property
+    def auto_recoverable_error(self):
+        return bool(self.error & 0x40)
+
+    @property
+    def paper_near_end(self):
+        return bool(self.paper & 0x0c)
+
+    @property
+    def paper_end(self):
+        return bool(self.paper & 0x60)
+
+
+# GS a n: the status changes sent by Automatic Status Back
+ASB_DRAWER = 0x01
+ASB_ONLINE = 0x02
+ASB_ERROR = 0x04
+ASB_PAPER = 0x08
+ASB_ALL = ASB_DRAWER | ASB_ONLINE | ASB_ERROR | ASB_PAPER
+
+# The events notified to the ASB subscribers
+EVENT_DRAWER_OPEN = 'drawer-open'
+EVENT_OFFLINE = 'offline'
+EVENT_COVER_OPEN = 'cover-open'
+EVENT_ERROR = 'error'
+EVENT_PAPER_NEAR_END = 'paper-near-end'
+EVENT_PAPER_OUT = 'paper-out'
+
+#: The L{AsbStatus} field behind each event
+_EVENT_FIELDS = [
+    (EVENT_DRAWER_OPEN, 'drawer_pin_high'),
+    (EVENT_OFFLINE, 'offline'),
+    (EVENT_COVER_OPEN, 'cover_open'),
+    (EVENT_ERROR, 'has_error'),
+    (EVENT_PAPER_NEAR_END, 'paper_near_end'),
+    (EVENT_PAPER_OUT, 'paper_end'),
+]
+
+AsbStatus = namedtuple('AsbStatus', 'drawer_pin_high offline cover_open '
+                                    'feeding_by_button has_error '
+                                    'paper_near_end paper_end timestamp')
+
+# How the logos are stored on the NV memory of the printer:
+# GS ( L, one logo for each 2 byte key, printed with GS ( L fn 69
+NV_GRAPHICS_GS = 'gs'
+# FS q, all the logos at once, printed with the 4 byte FS p n m
+NV_GRAPHICS_FS = 'fs'
+
+
+class AsbFramer(object):
+    """Split the input of a printer into 4 byte ASB messages.
+
+    The first byte of a message is 0xx1xx00 and the others 0xx0xxxx, anything
+    else (the replies to other commands, line noise) is discarded.
+    """
+
+    SIZE = 4
+
+    def __init__(self):
+        self._buffer = b''
+
+    def feed(self, data):
+        buf = self._buffer + data
+        frames = []
+        i = 0
+        while i + self.SIZE <= len(buf):
+            if (buf[i] & 0x93 == 0x10 and
+                    all(b & 0x90 == 0 for b in buf[i + 1:i + self.SIZE])):
+                frames.append(buf[i:i + self.SIZE])
+                i += self.SIZE
+            else:
+                i += 1
+        # Keep what may be the start of the next message
+        self._buffer = b''
+        for k in range(i, len(buf)):
+            if buf[k] & 0x93 == 0x10:
+                self._buffer = buf[k:]
+                break
+        return frames
+
+    def reset(self):
+        self._buffer = b''
+
+
+def parse_asb(frame):
+    """Parse a 4 byte ASB message.
+
+    :returns: an L{AsbStatus}
+    """
+    first, errors, paper = frame[0], frame[1], frame[2]
+    return AsbStatus(drawer_pin_high=bool(first & 0x04),
+                     offline=bool(first & 0x08),
+                     cover_open=bool(first & 0x20),
+                     feeding_by_button=bool(first & 0x40),
+                     has_error=bool(errors & 0x6c),
+                     paper_near_end=bool(paper & 0x03),
+                     paper_end=bool(paper & 0x0c),
+                     timestamp=time.monotonic())
 
 
 class EscPosMixin(object):
@@ -101,6 +270,29 @@ class EscPosMixin(object):
         GRAPHICS_24BITS: ESC + '\x2a\x21%s%s%s',
     }
 
+    #: If the printer replies to DLE EOT
+    has_realtime_status = True
+
+    #: For how many seconds L{get_status} returns the last status read
+    status_max_age = 2.0
+
+    _last_status = None
+
+    #: If the printer supports Automatic Status Back (GS a)
+    has_asb = True
+
+    _asb_listener = None
+    _asb_status = None
+    _asb_callbacks = ()
+
+    #: How the logos are stored on the NV memory, NV_GRAPHICS_GS or
+    #: NV_GRAPHICS_FS. None when the printer can't store them, and they
+    #: are printed as bitmaps.
+    nv_graphics = None
+
+    _logo_index = None
+    _logos = None
+
     def __init__(self, charset='cp850'):
         """
         Initialize ESCPOS Printer
@@ -113,6 +305,7 @@ class EscPosMixin(object):
         self.unset_bold()
         self.unset_double_height()
 
+    @metrics.timed()
     def set_charset(self, charset):
         """
         Set character set table
@@ -129,38 +322,48 @@ class EscPosMixin(object):
     # INonFiscalPrinter Methods
     #
 
+    @metrics.timed()
     def centralize(self):
         """ Centralize the text to be sent to coupon. """
         self.write(self.TXT_ALIGN_CENTER)
 
+    @metrics.timed()
     def descentralize(self):
         """ Descentralize the text to be sent to coupon. """
         self.write(self.TXT_ALIGN_LEFT)
 
+    @metrics.timed()
     def set_bold(self):
         """ The sent text will be appear in bold. """
         self.write(self.TXT_BOLD_ON)
 
+    @metrics.timed()
     def unset_bold(self):
         """ Remove the bold option. """
         self.write(self.TXT_BOLD_OFF)
 
+    @metrics.timed()
     def set_condensed(self):
         self.write(self.FONT_CONDENSED)
 
+    @metrics.timed()
     def unset_condensed(self):
         self.write(self.FONT_REGULAR)
 
+    @metrics.timed()
     def set_double_height(self):
         self.write(self.DOUBLE_HEIGHT_ON)
 
+    @metrics.timed()
     def unset_double_height(self):
         self.write(self.DOUBLE_HEIGHT_OFF)
 
+    @metrics.timed(nested=True)
     def print_line(self, text: bytes):
         """ Performs a line break to the given text. """
         self.print_inline(text + b'\n')
 
+    @metrics.timed()
     def print_inline(self, text):
         """ Print a given text in a unique line. """
         # Do nothing for empty texts
@@ -170,6 +373,7 @@ class EscPosMixin(object):
         assert isinstance(text, bytes), text
         self.write(text)
 
+    @metrics.timed(nested=True)
     def print_barcode(self, code):
         """ Print a barcode representing the given code. """
         if not code:
@@ -198,6 +402,7 @@ class EscPosMixin(object):
         self.write(self.BARCODE_CODE93 + chr(len(code)) +
                    encode_text(code, self.charset))
 
+    @metrics.timed()
     def print_qrcode(self, code):
         """ Prints the QR code """
         # Parameters:
@@ -226,6 +431,7 @@ class EscPosMixin(object):
         # Print - 1D 28 6B pl(3) ph(0) cn(49) fn(81) m(48)
         self.write(GS + '(k\x03\x00%s%s%s' % (chr(49), chr(81), chr(48)))
 
+    @metrics.timed(nested=True)
     def cut_paper(self):
         """ Performs a paper cutting. """
         # FIXME: Ensure the paper is safely out of the paper-cutter before
@@ -233,7 +439,12 @@ class EscPosMixin(object):
         self.print_inline(b'\n' * self.cut_line_feeds)
         self.write(self.PAPER_FULL_CUT)
 
+    @metrics.timed()
     def print_matrix(self, matrix, api=None, linefeed=True, multiplier=None):
+        self.write(self._get_matrix_data(matrix, api, linefeed, multiplier))
+
+    def _get_matrix_data(self, matrix, api=None, linefeed=True,
+                         multiplier=None):
         multiplier = multiplier or self.GRAPHICS_MULTIPLIER
         if api is None:
             api = self.GRAPHICS_API
@@ -249,7 +460,7 @@ class EscPosMixin(object):
             cmd = self.GRAPHICS_CMD[api]
 
         # Change the space between lines to 0
-        self.write(ESC + '3\x00')
+        data = [ESC + '3\x00']
         for line, line_len in matrix2graphics(api, matrix,
                                               max_cols, multiplier,
                                               centralized=False):
@@ -261,9 +472,327 @@ class EscPosMixin(object):
                 n2 += 1
                 n1 -= 256
 
-            self.write(cmd % (chr(n1), chr(n2), line))
+            data.append(cmd % (chr(n1), chr(n2), line))
             if linefeed:
-                self.write(self.LINE_FEED)
+                data.append(self.LINE_FEED)
 
         # Change the space between lines to default
-        self.write(ESC + '2')
+        data.append(ESC + '2')
+        return ''.join(data)
+
+    #
+    # Logos
+    #
+
+    def get_logo_index(self):
+        """ Get the index of the logos stored on this printer, by default
+        one named after the model and the port.
+
+        :returns: a L{stoqdrivers.logos.LogoIndex}
+        """
+        if self._logo_index is None:
+            port = getattr(self, '_port', None)
+            parts = [type(self).__name__]
+            for attr in ['address', 'port']:
+                value = getattr(port, attr, None)
+                if value is not None:
+                    parts.append(str(value))
+            self._logo_index = LogoIndex('-'.join(parts))
+        return self._logo_index
+
+    def set_logo_index(self, index):
+        self._logo_index = index
+
+    @metrics.timed()
+    def load_logos(self, logos):
+        """ Make the logos ready to be printed by L{print_logo}.
+
+        The logos are written to the NV memory of the printer, unless the
+        index tells it already has them. Printers without NV graphics get
+        the bitmap commands built once and cached instead.
+
+        With NV_GRAPHICS_FS all the logos are written at once, and the ones
+        that are not given here are erased from the printer.
+
+        :param logos: a dict mapping the names to matrices, like the ones
+          given to L{print_matrix}
+        :returns: the names of the logos written to the NV memory
+        """
+        hashes = dict((name, get_logo_hash(matrix))
+                      for name, matrix in logos.items())
+        if self._logos is None:
+            self._logos = {}
+
+        if self.nv_graphics == NV_GRAPHICS_GS:
+            keys, uploaded = self._load_logos_gs(logos, hashes)
+        elif self.nv_graphics == NV_GRAPHICS_FS:
+            keys, uploaded = self._load_logos_fs(logos, hashes)
+            if uploaded:
+                # The logos loaded before are gone
+                self._logos.clear()
+        else:
+            for name, matrix in logos.items():
+                cached = self._logos.get(name)
+                if cached is None or cached[0] != hashes[name]:
+                    self._logos[name] = (hashes[name], None,
+                                         self._get_matrix_data(matrix))
+            return []
+
+        for name in logos:
+            self._logos[name] = (hashes[name], keys[name], None)
+        if uploaded:
+            log.info('Stored the logos %s on the NV memory'
+                     % ', '.join(uploaded))
+        return uploaded
+
+    @metrics.timed()
+    def print_logo(self, name):
+        """ Print a logo loaded by L{load_logos}.
+
+        :param name: the name of the logo
+        """
+        if not self._logos or name not in self._logos:
+            raise ValueError("The logo %r was not loaded" % (name, ))
+        hash_, key, data = self._logos[name]
+        if key is None:
+            self.write(data)
+        elif self.nv_graphics == NV_GRAPHICS_GS:
+            # GS ( L pL pH m fn kc1 kc2 x y
+            self.write(GS + '(L\x06\x000E' + key + '\x01\x01')
+        else:
+            # FS p n m
+            self.write(FS + 'p' + chr(key) + '\x00')
+
+    def _load_logos_gs(self, logos, hashes):
+        index = self.get_logo_index()
+        used = index.get_keys()
+        keys = {}
+        uploaded = []
+        for name in sorted(logos):
+            entry = index.get(name)
+            if entry is not None and entry[0] == hashes[name]:
+                keys[name] = entry[1]
+                continue
+            if entry is not None:
+                key = entry[1]
+            else:
+                # Two printable characters
+                free = ['%02d' % i for i in range(100)
+                        if '%02d' % i not in used]
+                if not free:
+                    raise ValueError("There is no free key for the logo %r"
+                                     % (name, ))
+                key = free[0]
+                used.add(key)
+            width, height, data = matrix2raster(logos[name])
+            # m fn a kc1 kc2 b xL xH yL yH c d1...dk
+            params = ('0C0' + key + '\x01' +
+                      chr(width & 0xff) + chr(width >> 8) +
+                      chr(height & 0xff) + chr(height >> 8) + '1' + data)
+            size = len(params)
+            if size <= 0xffff:
+                cmd = GS + '(L' + chr(size & 0xff) + chr(size >> 8)
+            else:
+                cmd = GS + '8L' + ''.join(chr(size >> shift & 0xff)
+                                          for shift in (0, 8, 16, 24))
+            self.write(cmd + params)
+            index.set(name, hashes[name], key)
+            keys[name] = key
+            uploaded.append(name)
+        return keys, uploaded
+
+    def _load_logos_fs(self, logos, hashes):
+        index = self.get_logo_index()
+        names = sorted(logos)
+        entries = [index.get(name) for name in names]
+        if all(entry is not None and entry[0] == hashes[name]
+               for name, entry in zip(names, entries)):
+            return dict((name, entry[1])
+                        for name, entry in zip(names, entries)), []
+
+        if len(names) > 255:
+            raise ValueError("At most 255 logos can be stored")
+        # FS q n [xL xH yL yH d1...dk]1...[xL xH yL yH d1...dk]n
+        data = [FS + 'q' + chr(len(names))]
+        for name in names:
+            x, y, columns = matrix2columns(logos[name])
+            data.append(chr(x & 0xff) + chr(x >> 8) + chr(y & 0xff) +
+                        chr(y >> 8) + columns)
+        self.write(''.join(data))
+        keys = dict((name, i + 1) for i, name in enumerate(names))
+        index.replace(dict((name, (hashes[name], keys[name]))
+                           for name in names))
+        return keys, names
+
+    #
+    # Real-time status
+    #
+
+    @metrics.timed()
+    def get_realtime_status(self):
+        """ Read the printer, offline, error and paper sensor status.
+
+        The DLE EOT commands are executed by the printer as soon as they are
+        received, even in the middle of a job, so this can be called between
+        the chunks of a long job.
+
+        :returns: a L{RealTimeStatus}
+        """
+        if not self.has_realtime_status:
+            raise NotImplementedError(
+                "%s does not support DLE EOT" % (type(self).__name__, ))
+        if self._asb_listener is not None:
+            # The listener would get the replies
+            raise DriverError("The real-time status is not available while "
+                              "Automatic Status Back is enabled")
+        functions = (STATUS_PRINTER, STATUS_OFFLINE, STATUS_ERROR,
+                     STATUS_PAPER)
+        # Send all the requests at once, and read all the replies
+        self.write(''.join(DLE + EOT + chr(n) for n in functions))
+        reply = ''
+        while len(reply) < len(functions):
+            data = self.read(len(functions) - len(reply))
+            if not data:
+                break
+            reply += data
+        if len(reply) != len(functions):
+            raise InvalidReplyException("Expected %d status bytes, got %r"
+                                        % (len(functions), reply))
+        values = [ord(c) for c in reply]
+        # The bits 1 and 4 are always set, 0 and 7 always unset
+        if any(value & 0x93 != 0x12 for value in values):
+            raise InvalidReplyException("Invalid status bytes %r" % (reply, ))
+        status = RealTimeStatus(*values, timestamp=time.monotonic())
+        self._last_status = status
+        return status
+
+    def poll_status(self):
+        """ Update the last status, if the printer supports it.
+
+        :returns: the L{RealTimeStatus} or None
+        """
+        # The printer already sends the changes with ASB
+        if not self.has_realtime_status or self._asb_listener is not None:
+            return None
+        return self.get_realtime_status()
+
+    def get_status(self, max_age=None):
+        """ Get the status, reading it from the printer only if the last one
+        is older than max_age seconds.
+
+        :param max_age: defaults to L{status_max_age}
+        :returns: a L{RealTimeStatus}
+        """
+        if max_age is None:
+            max_age = self.status_max_age
+        status = self._last_status
+        if status is None or status.get_age() > max_age:
+            status = self.get_realtime_status()
+        return status
+
+    def get_last_status(self):
+        """ Get the last status read, without talking to the printer.
+
+        :returns: a L{RealTimeStatus} or None if it was never read
+        """
+        return self._last_status
+
+    #
+    # Automatic Status Back
+    #
+
+    def enable_asb(self, listener=None, flags=ASB_ALL):
+        """ Ask the printer to send its status whenever it changes, and read
+        it on a L{stoqdrivers.listener.DeviceListener}.
+
+        While ASB is enabled the listener owns the input of the port, so
+        nothing else can be read from the printer (see L{get_asb_status}).
+
+        :param listener: the listener, by default the one shared by the
+          whole process. It can be running on its own thread or on an
+          asyncio loop.
+        :param flags: the status changes to be sent, a combination of
+          ASB_DRAWER, ASB_ONLINE, ASB_ERROR and ASB_PAPER
+        """
+        if not self.has_asb:
+            raise NotImplementedError(
+                "%s does not support Automatic Status Back"
+                % (type(self).__name__, ))
+        if self._asb_listener is not None:
+            return
+        listener = listener or get_default_listener()
+        try:
+            listener.add(self, AsbFramer(), parse_asb, self._on_asb_status,
+                         self._on_asb_error)
+        except AttributeError:
+            raise TypeError("%s can't be listened to, it has no fileno()"
+                            % (type(self).__name__, ))
+        self._asb_listener = listener
+        # The printer replies with the current status right away
+        self.write(GS + 'a' + chr(flags))
+
+    def disable_asb(self):
+        if self._asb_listener is None:
+            return
+        self.write(GS + 'a' + chr(0))
+        self._asb_listener.remove(self)
+        self._asb_listener = None
+        self._asb_status = None
+
+    def is_asb_enabled(self):
+        return self._asb_listener is not None
+
+    def get_asb_status(self):
+        """ Get the last status sent by the printer through ASB.
+
+        :returns: an L{AsbStatus} or None
+        """
+        return self._asb_status
+
+    def get_cached_drawer_open(self):
+        """ Tell if the drawer is open using the ASB status, without talking
+        to the printer.
+
+        :returns: True or False, or None when ASB has no status to tell
+        """
+        status = self._asb_status
+        if status is None:
+            return None
+        return self._is_drawer_open(status)
+
+    def subscribe_status(self, callback):
+        """ Get notified of the ASB status changes.
+
+        :param callback: called on the listener thread with the event (like
+          EVENT_PAPER_OUT), its new value and the L{AsbStatus}. The first
+          status sent by the printer notifies every event.
+        """
+        self._asb_callbacks = tuple(self._asb_callbacks) + (callback, )
+
+    def unsubscribe_status(self, callback):
+        self._asb_callbacks = tuple(c for c in self._asb_callbacks
+                                    if c != callback)
+
+    def _is_drawer_open(self, status):
+        if getattr(self, 'inverted_drawer', False):
+            return status.drawer_pin_high
+        return not status.drawer_pin_high
+
+    def _on_asb_status(self, status):
+        old, self._asb_status = self._asb_status, status
+        for event, field in _EVENT_FIELDS:
+            value = getattr(status, field)
+            if old is not None and getattr(old, field) == value:
+                continue
+            if event == EVENT_DRAWER_OPEN:
+                value = self._is_drawer_open(status)
+            for callback in self._asb_callbacks:
+                try:
+                    callback(event, value, status)
+                except Exception:
+                    log.exception('Error on the ASB callback %r' % (callback, ))
+
+    def _on_asb_error(self, error):
+        log.warning('Automatic Status Back stopped: %s' % (error, ))
+        self._asb_listener = None
+        self._asb_status = None
@@ -43,10 +43,18 @@ class CommError(Exception):
 class PrinterError(Exception):
     "General printer errors"
 
+    #: The last frames exchanged with the device before the error, a list
+    #: of L{stoqdrivers.trace.Frame}
+    wire_trace = None
+
 
 class DriverError(Exception):
     "Base exception for all printer errors"
 
+    #: The last frames exchanged with the device before the error, a list
+    #: of L{stoqdrivers.trace.Frame}
+    wire_trace = None
+
     def __init__(self, error='', code=-1):
         if code != -1:
             error = '%d: %s' % (code, error)
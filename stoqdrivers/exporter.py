@@ -0,0 +1,398 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+OpenMetrics exporter for the device metrics.
+
+Renders the metrics of a set of devices (see L{stoqdrivers.metrics}) in the
+OpenMetrics text format, together with the device status: the spooler
+queue depth, the paper and drawer status and, for fiscal printers, the COO
+and CRZ counters. Every sample is labelled with the device identity: the
+name it was registered with, its brand, model and serial.
+
+The text can be served on a local HTTP endpoint::
+
+    exporter = MetricsExporter(devices)
+    server = start_http_server(exporter, 9464)
+
+or written periodically to the textfile collector directory of the node
+exporter::
+
+    writer = TextfileWriter(exporter, '/var/lib/node_exporter/stoqdrivers.prom')
+    writer.start()
+
+By default only the metrics recorded by the drivers are exported and the
+devices are never queried. Reading their status (I{probe=True}) sends
+commands to the printers: it is submitted through the device spooler, at
+most once every I{probe_interval} seconds, so it only stays out of a coupon
+command if the application also makes all its calls through the spooler,
+like L{stoqdrivers.daemon.server} does. Even then it can run between two
+commands of the same coupon, so only enable it where that is acceptable.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from stoqdrivers import metrics
+from stoqdrivers.exceptions import AlmostOutofPaper, OutofPaperError
+from stoqdrivers.spooler import PRIORITY_LOW
+
+log = logging.getLogger('stoqdrivers.exporter')
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+(PAPER_OUT,
+ PAPER_LOW,
+ PAPER_OK) = range(3)
+
+_COUNTERS = [
+    (metrics.BYTES_IN, 'receive', 'bytes',
+     'Bytes received from the device'),
+    (metrics.BYTES_OUT, 'transmit', 'bytes', 'Bytes sent to the device'),
+    (metrics.RETRIES, 'retries', None, 'Reads retried by the transport'),
+    (metrics.TIMEOUTS, 'timeouts', None, 'Reads or writes that timed out'),
+    (metrics.RECONNECTS, 'reconnects', None, 'Reconnections to the device'),
+    (metrics.ERRORS, 'command_errors', None, 'Commands that failed'),
+]
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_labels(labels):
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for name, value in labels)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+
+class _DeviceStatus:
+    def __init__(self):
+        self.updated = None
+        self.up = 0
+        self.serial = ''
+        self.paper = None
+        self.drawer_open = None
+        self.coo = None
+        self.crz = None
+
+
+class MetricsExporter:
+    """Collect the metrics of a set of devices as OpenMetrics text.
+
+    @param devices: a dict mapping names to L{stoqdrivers.base.BaseDevice}
+      instances, like the one returned by
+      L{stoqdrivers.daemon.server.load_devices}
+    @param probe: if the status of the devices should be read, sending
+      commands to them. Only safe when every call to the devices goes
+      through their spooler. When False, only the metrics recorded by the
+      drivers are exported.
+    @param probe_interval: the minimum interval, in seconds, between two
+      status reads of a device
+    @param probe_timeout: how long to wait for a status read. A device busy
+      for longer than that keeps its last known status.
+    """
+
+    def __init__(self, devices, probe=False, probe_interval=60.0,
+                 probe_timeout=5.0):
+        self.devices = devices
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._status = {}
+        self._lock = threading.Lock()
+
+    #
+    # Status
+    #
+
+    def _read_paper(self, device):
+        # Only the printers that report their sensors (DLE EOT or ASB) tell
+        # if the paper is ok, the others only fail when it is out
+        if hasattr(device, 'poll_status'):
+            device.poll_status()
+        status = None
+        if hasattr(device, 'get_asb_status'):
+            status = device.get_asb_status()
+        if status is None and hasattr(device, 'get_last_status'):
+            status = device.get_last_status()
+        if status is None:
+            return None
+        if status.paper_end:
+            return PAPER_OUT
+        if status.paper_near_end:
+            return PAPER_LOW
+        return PAPER_OK
+
+    def _read_status(self, device, status):
+        if not status.serial and hasattr(device, 'get_serial'):
+            status.serial = device.get_serial() or ''
+
+        status.paper = None
+        try:
+            status.paper = self._read_paper(device)
+            if hasattr(device, 'query_status'):
+                device.query_status()
+            if hasattr(device, 'is_drawer_open'):
+                status.drawer_open = bool(device.is_drawer_open())
+            if hasattr(device, 'get_coo'):
+                status.coo = device.get_coo()
+                status.crz = device.get_crz()
+        except OutofPaperError:
+            status.paper = PAPER_OUT
+        except AlmostOutofPaper:
+            status.paper = PAPER_LOW
+        except Exception:
+            status.up = 0
+            raise
+        status.up = 1
+
+    def _probe(self, name, device):
+        status = self._status.setdefault(name, _DeviceStatus())
+        now = time.monotonic()
+        if (status.updated is not None and
+                now - status.updated < self.probe_interval):
+            return status
+        status.updated = now
+        future = device.get_spooler().submit(self._read_status, device,
+                                             status, priority=PRIORITY_LOW)
+        try:
+            future.result(self.probe_timeout)
+        except Exception as e:
+            if future.done():
+                log.warning('Could not read the status of %s: %s' % (name, e))
+            else:
+                # Busy printing, the job will update the status later
+                log.info('Timeout reading the status of %s' % (name, ))
+        return status
+
+    #
+    # Rendering
+    #
+
+    def collect(self):
+        """Collect the metrics of all the devices.
+
+        @returns: a list of (device labels, L{_DeviceStatus} or None,
+          metrics snapshot) tuples
+        """
+        collected = []
+        with self._lock:
+            for name, device in sorted(self.devices.items()):
+                status = None
+                if self.probe:
+                    status = self._probe(name, device)
+                labels = [('device', name),
+                          ('brand', device.brand or ''),
+                          ('model', device.model or ''),
+                          ('serial', status.serial if status else '')]
+                collected.append((labels, status, device.get_metrics()))
+        return collected
+
+    def render(self):
+        """Render the metrics of all the devices.
+
+        @returns: the OpenMetrics text, terminated by the EOF marker
+        """
+        collected = self.collect()
+        lines = []
+
+        def family(name, type_, help_, samples, unit=None):
+            if not samples:
+                return
+            name = 'stoqdrivers_' + name
+            lines.append('# TYPE %s %s' % (name, type_))
+            if unit:
+                lines.append('# UNIT %s %s' % (name, unit))
+            lines.append('# HELP %s %s' % (name, help_))
+            for suffix, labels, value in samples:
+                lines.append('%s%s%s %s' % (name, suffix, _format_labels(labels),
+                                            _format_value(value)))
+
+        samples = []
+        for labels, status, snapshot in collected:
+            for command, histogram in sorted(snapshot['commands'].items()):
+                command_labels = labels + [('command', command)]
+                cumulative = 0
+                for bound, n in zip(histogram['buckets'], histogram['counts']):
+                    cumulative += n
+                    samples.append(('_bucket',
+                                    command_labels + [('le', repr(float(bound)))],
+                                    cumulative))
+                samples.append(('_bucket', command_labels + [('le', '+Inf')],
+                                histogram['count']))
+                samples.append(('_count', command_labels, histogram['count']))
+                samples.append(('_sum', command_labels, histogram['sum']))
+        family('command_duration_seconds', 'histogram',
+               'Time taken by each driver command', samples, unit='seconds')
+
+        for counter, name, unit, help_ in _COUNTERS:
+            samples = [('_total', labels, snapshot['counters'][counter])
+                       for labels, status, snapshot in collected
+                       if counter in snapshot['counters']]
+            if unit:
+                name = '%s_%s' % (name, unit)
+            family(name, 'counter', help_, samples, unit=unit)
+
+        spoolers = [(labels, snapshot['spooler'])
+                    for labels, status, snapshot in collected
+                    if 'spooler' in snapshot]
+        family('queue_depth', 'gauge', 'Jobs waiting on the device spooler',
+               [('', labels, spooler['queue_depth'])
+                for labels, spooler in spoolers])
+        family('spooler_jobs', 'counter', 'Jobs executed by the device spooler',
+               [('_total', labels, spooler['jobs_done'])
+                for labels, spooler in spoolers])
+        family('spooler_wait_seconds_max', 'gauge',
+               'Longest time a job waited on the device spooler',
+               [('', labels, float(spooler['wait_time_max']))
+                for labels, spooler in spoolers])
+
+        statuses = [(labels, status) for labels, status, snapshot in collected
+                    if status is not None and status.updated is not None]
+        family('up', 'gauge', 'If the last status read succeeded',
+               [('', labels, status.up) for labels, status in statuses])
+        family('paper_status', 'gauge', 'Paper status: 0 out, 1 low, 2 ok',
+               [('', labels, status.paper) for labels, status in statuses
+                if status.paper is not None])
+        family('drawer_open', 'gauge', 'If the cash drawer is open',
+               [('', labels, int(status.drawer_open))
+                for labels, status in statuses
+                if status.drawer_open is not None])
+        family('fiscal_coo', 'gauge', 'Operation order counter (COO)',
+               [('', labels, status.coo) for labels, status in statuses
+                if status.coo is not None])
+        family('fiscal_crz', 'gauge', 'Z reduction counter (CRZ)',
+               [('', labels, status.crz) for labels, status in statuses
+                if status.crz is not None])
+
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    exporter = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        try:
+            body = self.exporter.render().encode('utf-8')
+        except Exception:
+            log.exception('Could not render the metrics')
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+
+def start_http_server(exporter, port, address='127.0.0.1'):
+    """Serve the metrics of I{exporter} on http://address:port/metrics.
+
+    The server runs on a daemon thread. Call its shutdown() method to stop
+    it.
+
+    @returns: the L{http.server.ThreadingHTTPServer}
+    """
+    handler = type('MetricsHandler', (_MetricsHandler, ),
+                   dict(exporter=exporter))
+    server = ThreadingHTTPServer((address, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever,
+                              name='stoqdrivers-exporter-http')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class TextfileWriter:
+    """Periodically write the metrics to a file.
+
+    The file is replaced atomically, so a collector never reads it half
+    written.
+
+    @param exporter: a L{MetricsExporter}
+    @param filename: the file to write, usually on the node exporter
+      textfile collector directory (with a .prom extension)
+    @param interval: the interval between two writes, in seconds
+    """
+
+    def __init__(self, exporter, filename, interval=15.0):
+        self.exporter = exporter
+        self.filename = filename
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def write(self):
+        """Write the metrics now."""
+        data = self.exporter.render().encode('utf-8')
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.stoqdrivers-')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, self.filename)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='stoqdrivers-exporter-textfile')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.write()
+            except Exception:
+                log.exception('Could not write the metrics to %s'
+                              % self.filename)
+            self._stopped.wait(self.interval)
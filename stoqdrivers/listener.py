@@ -0,0 +1,316 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Event-driven reading of devices that push data on their own.
+
+Some devices send packets without being asked: a scale when the operator
+presses the print button, a barcode reader when something is scanned. A
+L{DeviceListener} waits on the file descriptors of any number of those
+devices at once (with L{selectors}, or on an asyncio loop), splits the bytes
+into frames, parses them and dispatches the results to callbacks. There is
+no polling and no thread per device.
+"""
+
+import logging
+import os
+import selectors
+import threading
+
+log = logging.getLogger('stoqdrivers.listener')
+
+STX = 0x02
+ETX = 0x03
+
+
+class StxEtxFramer:
+    """Split a byte stream into STX ... ETX frames, incrementally.
+
+    Bytes outside of a frame are discarded, and so is a frame that grows
+    beyond I{max_size}, so the framer resynchronizes by itself after line
+    noise.
+    """
+
+    def __init__(self, stx=STX, etx=ETX, max_size=None):
+        self.stx = bytes([stx])
+        self.etx = bytes([etx])
+        self.max_size = max_size
+        self._buffer = b''
+
+    def feed(self, data):
+        """Add data read from the device.
+
+        @returns: a list with the frames completed by I{data}, each one
+          including its STX and ETX
+        """
+        buf = self._buffer + data
+        frames = []
+        while True:
+            start = buf.find(self.stx)
+            if start == -1:
+                buf = b''
+                break
+            end = buf.find(self.etx, start + 1)
+            if end == -1:
+                buf = buf[start:]
+                if self.max_size is not None and len(buf) > self.max_size:
+                    log.info('Discarding %d bytes without ETX' % len(buf))
+                    buf = buf[1:]
+                    continue
+                break
+            frame = buf[start:end + 1]
+            buf = buf[end + 1:]
+            if self.max_size is not None and len(frame) > self.max_size:
+                log.info('Discarding an oversized frame: %r' % (frame, ))
+                # There might be a valid frame starting inside it
+                buf = frame[1:] + buf
+                continue
+            frames.append(frame)
+        self._buffer = buf
+        return frames
+
+    def reset(self):
+        self._buffer = b''
+
+
+class LineFramer:
+    """Split a byte stream into lines, incrementally.
+
+    The delimiter is not included in the frames, and neither are the
+    carriage returns or line feeds around it. Empty lines are skipped.
+    """
+
+    def __init__(self, delimiter=b'\r', max_size=None):
+        self.delimiter = delimiter
+        self.max_size = max_size
+        self._buffer = b''
+
+    def feed(self, data):
+        lines = (self._buffer + data).split(self.delimiter)
+        self._buffer = lines.pop()
+        if self.max_size is not None and len(self._buffer) > self.max_size:
+            log.info('Discarding %d bytes without a delimiter'
+                     % len(self._buffer))
+            self._buffer = b''
+        frames = []
+        for line in lines:
+            line = line.strip(b'\r\n')
+            if line:
+                frames.append(line)
+        return frames
+
+    def reset(self):
+        self._buffer = b''
+
+
+class _Source:
+    def __init__(self, fileobj, framer, parser, callback, error_callback):
+        self.fileobj = fileobj
+        self.fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+        self.framer = framer
+        self.parser = parser
+        self.callback = callback
+        self.error_callback = error_callback
+
+
+class DeviceListener:
+    """Listen to the packets pushed by a set of devices.
+
+    The listener can either run on its own thread, with L{start}, or on an
+    asyncio loop, with L{attach}. In both cases the callbacks are called on
+    the thread that reads the data.
+    """
+
+    read_size = 4096
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}
+        self._selector = selectors.DefaultSelector()
+        self._loop = None
+        self._thread = None
+        self._running = False
+        # Used to wake up the selector when a source is added or removed
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+    def add(self, fileobj, framer, parser, callback, error_callback=None):
+        """Start listening to a device.
+
+        @param fileobj: the port (anything with a fileno()) or a file
+          descriptor
+        @param framer: an object with a feed(data) method, returning the
+          complete frames, like L{StxEtxFramer}
+        @param parser: called with each frame, returns the object passed to
+          I{callback}
+        @param callback: called with each parsed packet
+        @param error_callback: called with the exception when a frame can't
+          be parsed or the device goes away. The default is to log it.
+        """
+        source = _Source(fileobj, framer, parser, callback, error_callback)
+        with self._lock:
+            if source.fd in self._sources:
+                raise ValueError("%r is already being listened" % (fileobj, ))
+            self._sources[source.fd] = source
+            if self._loop is not None:
+                self._loop.add_reader(source.fd, self._on_readable, source.fd)
+            else:
+                self._selector.register(source.fd, selectors.EVENT_READ)
+        self._wakeup()
+
+    def remove(self, fileobj):
+        fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+        with self._lock:
+            source = self._sources.pop(fd, None)
+            if source is None:
+                return
+            if self._loop is not None:
+                self._loop.remove_reader(fd)
+            else:
+                self._selector.unregister(fd)
+        self._wakeup()
+
+    #
+    # Threaded mode
+    #
+
+    def run_once(self, timeout=None):
+        """Wait for data for at most I{timeout} seconds and dispatch it."""
+        for key, events in self._selector.select(timeout):
+            if key.fd == self._wakeup_r:
+                try:
+                    os.read(self._wakeup_r, self.read_size)
+                except BlockingIOError:
+                    pass
+                continue
+            self._on_readable(key.fd)
+
+    def start(self):
+        """Listen on a new thread, shared by all the devices."""
+        if self._loop is not None:
+            raise ValueError("The listener is attached to a loop")
+        self._running = True
+        self._thread = threading.Thread(target=self._run,
+                                        name='stoqdrivers-listener')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self.detach()
+        self._selector.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+
+    def _run(self):
+        while self._running:
+            self.run_once()
+
+    def _wakeup(self):
+        if self._thread is not None:
+            os.write(self._wakeup_w, b'\0')
+
+    #
+    # asyncio mode
+    #
+
+    def attach(self, loop):
+        """Listen on an asyncio loop instead of a thread."""
+        if self._thread is not None:
+            raise ValueError("The listener is running on a thread")
+        with self._lock:
+            self._loop = loop
+            for fd in self._sources:
+                self._selector.unregister(fd)
+                loop.add_reader(fd, self._on_readable, fd)
+
+    def detach(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            for fd in self._sources:
+                self._loop.remove_reader(fd)
+                self._selector.register(fd, selectors.EVENT_READ)
+            self._loop = None
+
+    #
+    # Private
+    #
+
+    def _on_readable(self, fd):
+        source = self._sources.get(fd)
+        if source is None:
+            return
+        try:
+            data = os.read(fd, self.read_size)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.remove(fd)
+            self._report_error(source, e)
+            return
+        if not data:
+            self.remove(fd)
+            self._report_error(source, EOFError("The device was closed"))
+            return
+
+        for frame in source.framer.feed(data):
+            try:
+                packet = source.parser(frame)
+            except Exception as e:
+                self._report_error(source, e)
+                continue
+            try:
+                source.callback(packet)
+            except Exception:
+                log.exception('Error on the callback of %r' % (source.fileobj, ))
+
+    def _report_error(self, source, error):
+        if source.error_callback is not None:
+            source.error_callback(error)
+        else:
+            log.warning('Error reading from %r: %s' % (source.fileobj, error))
+
+
+_default_listener = None
+_default_listener_lock = threading.Lock()
+
+
+def get_default_listener():
+    """Get the listener shared by all the devices of the process, which
+    runs on its own thread.
+    """
+    global _default_listener
+    with _default_listener_lock:
+        if _default_listener is None:
+            _default_listener = DeviceListener()
+            _default_listener.start()
+        return _default_listener
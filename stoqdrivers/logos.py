@@ -0,0 +1,138 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Index of the logos stored on the non-volatile memory of the printers.
+
+Writing a logo to the NV memory is slow, and the memory wears out after some
+thousands of writes, so the drivers record what each printer already has.
+The logos are identified by the hash of their dots, and are only uploaded
+again when they change.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+
+from stoqdrivers.utils import json_dumps, json_loads, matrix2raster, str2bytes
+
+log = logging.getLogger('stoqdrivers.logos')
+
+
+def get_logo_hash(matrix):
+    """Get the hash identifying the dots of a logo.
+
+    @param matrix: a list of rows, each one a list of booleans
+    """
+    width, height, data = matrix2raster(matrix)
+    digest = hashlib.sha1(('%dx%d:' % (width, height)).encode())
+    digest.update(str2bytes(data))
+    return digest.hexdigest()
+
+
+class LogoIndex:
+    """What is stored on the NV memory of a printer.
+
+    Each entry maps the name of a logo to its hash and to the key the
+    printer uses to print it.
+
+    @param name: identifies the printer, used to name the index file
+    @param directory: where the index is stored. Defaults to ~/.stoq/logos
+    """
+
+    def __init__(self, name, directory=None):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.stoq', 'logos')
+        self.filename = os.path.join(
+            directory, '%s.json' % re.sub(r'[^\w.-]', '_', str(name)))
+        self._lock = threading.Lock()
+        self._entries = self._read()
+
+    def get(self, name):
+        """Get the entry of a logo.
+
+        @returns: a (hash, key) tuple or None
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None:
+            return None
+        return entry['hash'], entry['key']
+
+    def get_keys(self):
+        """The keys of all the stored logos."""
+        with self._lock:
+            return set(entry['key'] for entry in self._entries.values())
+
+    def set(self, name, hash_, key):
+        with self._lock:
+            self._entries[name] = dict(hash=hash_, key=key)
+            self._write()
+
+    def replace(self, entries):
+        """Replace all the entries at once.
+
+        @param entries: a dict mapping the names to (hash, key) tuples
+        """
+        with self._lock:
+            self._entries = dict((name, dict(hash=hash_, key=key))
+                                 for name, (hash_, key) in entries.items())
+            self._write()
+
+    def clear(self):
+        """Forget everything, so the logos are uploaded again. Use this when
+        the printer is replaced or its memory is erased.
+        """
+        self.replace({})
+
+    def _read(self):
+        try:
+            with open(self.filename) as fp:
+                entries = json_loads(fp.read())
+        except OSError:
+            return {}
+        except ValueError:
+            log.warning('Ignoring the corrupted logo index %s' % self.filename)
+            return {}
+        return entries.get('logos', {})
+
+    def _write(self):
+        data = json_dumps(dict(logos=self._entries)) + '\n'
+        directory = os.path.dirname(self.filename)
+        try:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.logos-')
+        except OSError as e:
+            log.warning('Could not save the logo index: %s' % e)
+            return
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(data)
+            os.replace(tmp, self.filename)
+        except OSError as e:
+            log.warning('Could not save the logo index: %s' % e)
+            os.unlink(tmp)
@@ -0,0 +1,258 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Lightweight instrumentation of the drivers and transports.
+
+Each driver command records its latency on a fixed-bucket histogram, keyed by
+the command (the CMD_* name on Bematech, the command hex on Epson, the
+command name on FiscNet and the operation name on ESC/POS printers). The
+transports count the bytes sent and received, the retries, the timeouts
+and the reconnections.
+
+Recording is disabled by default, and then only costs the call to the
+wrapper of each command (about 0.2us). Enabled, a command costs about 0.5us
+more. Enable it with L{enable} or by setting the STOQDRIVERS_METRICS
+environment variable to 1. The metrics of a device are available through
+L{stoqdrivers.base.BaseDevice.get_metrics}.
+
+Each thread records on its own shard of the L{DeviceMetrics}, without any
+lock, and the shards are merged when a snapshot is taken (by the exporter,
+or L{stoqdrivers.base.BaseDevice.get_metrics}), so a snapshot taken while a
+command is being recorded might miss it.
+
+When a timed method calls others (print_line calling print_inline, for
+instance) it is declared as I{nested}, and only the outer call is recorded,
+so the time is not counted twice.
+"""
+
+from bisect import bisect_left
+import functools
+import os
+import threading
+from time import perf_counter
+
+#: Upper bounds, in seconds, of the latency buckets. The last bucket is
+#: everything slower than the last bound.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+#: The transport counters
+BYTES_IN = 'bytes_in'
+BYTES_OUT = 'bytes_out'
+RETRIES = 'retries'
+TIMEOUTS = 'timeouts'
+RECONNECTS = 'reconnects'
+ERRORS = 'errors'
+
+enabled = os.environ.get('STOQDRIVERS_METRICS', '') not in ('', '0')
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        return dict(buckets=LATENCY_BUCKETS, counts=list(self.counts),
+                    count=self.count, sum=self.sum)
+
+
+class _Shard:
+    # The metrics recorded by one thread
+    __slots__ = ('histograms', 'counters', 'timing')
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        # If a nested timed call is running
+        self.timing = False
+
+    def observe(self, command, seconds):
+        histogram = self.histograms.get(command)
+        if histogram is None:
+            histogram = self.histograms[command] = Histogram()
+        histogram.observe(seconds)
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+
+class DeviceMetrics:
+    """The metrics of a driver or a port.
+
+    @ivar name: the driver model name, or the class name
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._local = threading.local()
+        self._shards = []
+        # Only taken to add a shard and to merge them
+        self._lock = threading.Lock()
+
+    def get_shard(self):
+        """Get the shard of the current thread."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def observe(self, command, seconds):
+        self.get_shard().observe(command, seconds)
+
+    def count(self, counter, n=1):
+        self.get_shard().count(counter, n)
+
+    @property
+    def histograms(self):
+        histograms = {}
+        for shard in self._get_shards():
+            for command, histogram in list(shard.histograms.items()):
+                merged = histograms.get(command)
+                if merged is None:
+                    merged = histograms[command] = Histogram()
+                merged.counts = [a + b for a, b in zip(merged.counts,
+                                                       histogram.counts)]
+                merged.count += histogram.count
+                merged.sum += histogram.sum
+        return histograms
+
+    @property
+    def counters(self):
+        counters = {}
+        for shard in self._get_shards():
+            for counter, n in list(shard.counters.items()):
+                counters[counter] = counters.get(counter, 0) + n
+        return counters
+
+    def _get_shards(self):
+        with self._lock:
+            return list(self._shards)
+
+    def snapshot(self):
+        return dict(name=self.name,
+                    commands=dict((command, histogram.snapshot())
+                                  for command, histogram
+                                  in self.histograms.items()),
+                    counters=self.counters)
+
+
+def get_metrics(obj, create=True):
+    """Get the L{DeviceMetrics} of a driver or a port.
+
+    @param create: create them if the object has none yet
+    """
+    metrics = getattr(obj, '_metrics', None)
+    if metrics is None and create:
+        name = getattr(obj, 'model_name', None) or type(obj).__name__
+        metrics = obj._metrics = DeviceMetrics(name)
+    return metrics
+
+
+def count(obj, counter, n=1):
+    """Increment a counter of I{obj}, if the metrics are enabled.
+
+    Hot paths should check L{enabled} themselves before calling this.
+    """
+    if enabled:
+        get_metrics(obj).count(counter, n)
+
+
+def snapshot(obj):
+    """Get a snapshot of the metrics of I{obj}, which might have none."""
+    metrics = get_metrics(obj, create=False)
+    if metrics is None:
+        name = getattr(obj, 'model_name', None) or type(obj).__name__
+        return dict(name=name, commands={}, counters={})
+    return metrics.snapshot()
+
+
+def timed(key=None, nested=False):
+    """Record the latency of the decorated driver method.
+
+    @param key: the histogram key. A string, a callable receiving the same
+      arguments as the method, or None to use the method name.
+    @param nested: if the method calls other timed methods of the same
+      object. They are not recorded while it runs.
+    """
+    def decorator(func):
+        if key is None:
+            command = func.__name__
+        elif isinstance(key, str):
+            command = key
+        else:
+            command = None
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not enabled:
+                return func(self, *args, **kwargs)
+            try:
+                shard = self._metrics._local.shard
+            except AttributeError:
+                shard = get_metrics(self).get_shard()
+            if shard.timing:
+                # Already timed by the outer call
+                return func(self, *args, **kwargs)
+            if nested:
+                shard.timing = True
+            start = perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            except Exception:
+                shard.count(ERRORS)
+                raise
+            finally:
+                elapsed = perf_counter() - start
+                if nested:
+                    shard.timing = False
+                name = command or key(self, *args, **kwargs)
+                histogram = shard.histograms.get(name)
+                if histogram is None:
+                    shard.observe(name, elapsed)
+                else:
+                    histogram.observe(elapsed)
+        return wrapper
+    return decorator
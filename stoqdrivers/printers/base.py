@@ -35,10 +35,9 @@ from stoqdrivers.interfaces import (ICouponPrinter,
                                     IDriverConstants,
                                     IChequePrinter,
                                     INonFiscalPrinter)
-from stoqdrivers.serialbase import SerialBase
+from stoqdrivers.printers.manifest import (DRIVER_MANIFEST, DRIVER_MODULES,
+                                           VIRTUAL_BRAND)
 from stoqdrivers.translation import stoqdrivers_gettext
-from stoqdrivers.usbbase import UsbBase
-from stoqdrivers.utils import get_obj_from_module
 
 _ = stoqdrivers_gettext
 
@@ -95,36 +94,22 @@ def get_virtual_printer():
     return FiscalPrinter(brand='virtual', model='Simple')
 
 
-def get_supported_printers(include_virtual=False):
-    result = {}
-    config = [
-        ('bematech', ['DP20C', 'MP20', 'MP2100', 'MP2100TH', 'MP4200TH', 'MP25']),
-        ('daruma', ['DR700', 'FS2100', 'FS345', 'FS600MFD']),
-        ('dataregis', ['EP375', 'Quick']),
-        ('elgin', ['I9', 'KFiscal']),
-        ('tanca', ['TP650']),
-        ('epson', ['FBII', 'FBIII', 'TMT20', 'TMT70']),
-        ('fiscnet', ['FiscNetECF']),
-        ('perto', ['Pay2023']),
-        ('snbc', ['BKC310']),
-        ('sweda', ['SI150']),
-    ]
-    if include_virtual:
-        config.append(('virtual', ['Simple']))
-
-    for brand, module_names in config:
-        result[brand] = []
-        for module_name in module_names:
-            full_module_name = "stoqdrivers.printers.%s.%s" % (brand, module_name)
-            obj = get_obj_from_module(full_module_name, obj_name=module_name)
-            if not hasattr(obj, 'supported'):
-                continue
-            result[brand].append(obj)
-    return result
+def get_supported_printers(include_virtual=False, lazy=False):
+    """ Returns a dict mapping the brands to a list of their supported
+    printer drivers.
+
+    @param include_virtual: If the virtual printer (for development) should be
+                            included in the results
+    @param lazy: If True, the lists hold the
+                 L{stoqdrivers.printers.manifest.DriverInfo} of the drivers
+                 and no driver module is imported. Otherwise they hold the
+                 driver classes.
+    """
+    return _get_printers(lambda info: True, include_virtual, lazy)
 
 
 def get_supported_printers_by_iface(interface, protocol=None,
-                                    include_virtual=False):
+                                    include_virtual=False, lazy=False):
     """ Returns all the printers that supports the interface.  The result
     format is the same for get_supported_printers.
 
@@ -134,29 +119,37 @@ def get_supported_printers_by_iface(interface, protocol=None,
                      (None (all protocols), usb, serial or ethernet)
     @param include_virtual: If the virtual printer (for development) should be
                             included in the results
+    @param lazy: See L{get_supported_printers}
     """
-    # Select the base class depending on which interface has been chosen
-    # TODO: Implement Ethernet interface support
-    base_class = {
-        'usb': UsbBase,
-        'serial': SerialBase,
-        'ethernet': None,
-        None: object,
-    }[protocol]
-
     if interface not in (ICouponPrinter, IChequePrinter, INonFiscalPrinter):
         raise TypeError("Interface specified (`%r') is not a valid "
                         "printer interface" % interface)
-    all_printers_supported = get_supported_printers(include_virtual=include_virtual)
-    result = {}
-    for model, driver_list in all_printers_supported.items():
-        drivers = []
-        for driver in driver_list:
-            if interface.implementedBy(driver) and issubclass(driver, base_class):
-                drivers.append(driver)
-        if drivers:
-            result[model] = drivers
+    if protocol not in (None, 'usb', 'serial', 'ethernet'):
+        raise KeyError(protocol)
+
+    # TODO: Implement Ethernet interface support
+    def matches(info):
+        return (info.implements(interface) and
+                (protocol is None or info.transport == protocol))
 
+    result = _get_printers(matches, include_virtual, lazy)
+    return dict((brand, drivers) for brand, drivers in result.items()
+                if drivers)
+
+
+def _get_printers(matches, include_virtual, lazy):
+    # Only the drivers that match are imported (when not lazy)
+    result = {}
+    for brand, models in DRIVER_MODULES:
+        if brand == VIRTUAL_BRAND and not include_virtual:
+            continue
+        result[brand] = []
+    for info in DRIVER_MANIFEST:
+        if info.brand not in result or info.supported is None:
+            continue
+        if not matches(info):
+            continue
+        result[info.brand].append(info if lazy else info.load())
     return result
 
 
@@ -50,37 +50,40 @@ class DP20C(SerialBase, BaseChequePrinter):
         SerialBase.__init__(self, port)
         BaseChequePrinter.__init__(self)
 
-    def _setup_positions(self, bank):
+    def _compile_positions(self, bank):
         # man page 24.
-        data = [(bank.get_x_coordinate("value") - 60) / 10,
+        data = [(bank.get_x_coordinate("value") - 60) // 10,
                 (bank.get_x_coordinate("value") - 60) % 10,
                 bank.get_y_coordinate("value"),
-                bank.get_x_coordinate("legal_amount") / 10,
+                bank.get_x_coordinate("legal_amount") // 10,
                 bank.get_x_coordinate("legal_amount") % 10,
                 bank.get_y_coordinate("legal_amount"),
                 bank.get_x_coordinate("legal_amount2") % 10,
                 bank.get_y_coordinate("legal_amount2") % 10,
                 bank.get_x_coordinate("thirdparty") % 10,
                 bank.get_y_coordinate("thirdparty") % 10,
-                bank.get_x_coordinate("city") / 10,
-                bank.get_x_coordinate("day") / 10,
+                bank.get_x_coordinate("city") // 10,
+                bank.get_x_coordinate("day") // 10,
                 bank.get_x_coordinate("day") % 10,
-                bank.get_x_coordinate("month") / 10,
+                bank.get_x_coordinate("month") // 10,
                 bank.get_x_coordinate("month") % 10,
                 bank.get_x_coordinate("year") % 10]
-        data = "".join([str(d) for d in data])
+        return "".join([str(d) for d in data])
+
+    def _setup_positions(self, bank):
         self.write("%c%c987? %s%c" % (DP20C.CMD_PREFIX,
                                       DP20C.CMD_SETUP_COORDINATES,
-                                      data, DP20C.CMD_SUFFIX))
+                                      self._get_positions(bank),
+                                      DP20C.CMD_SUFFIX))
 
     def _setup_cheque(self, bank, value, thirdparty, city,
-                      date=None):
+                      date=None, setup_positions=True):
         if date is None:
             date = datetime.datetime.now()
-        self._setup_positions(bank)
+        if setup_positions:
+            self._setup_positions(bank)
         value = "%.02f" % value
-        if "." in value:
-            value.replace(".", ",")
+        value = value.replace(".", ",")
         date = date.strftime("%02d/%02m/%Y")
         bank_code = "987"
         for idx, data in enumerate((thirdparty, city, bank_code, value, date)):
@@ -99,6 +102,16 @@ class DP20C(SerialBase, BaseChequePrinter):
         self._setup_cheque(*args, **kwargs)
         self._print_cheque()
 
+    def print_cheques(self, cheques):
+        # The coordinates stay on the printer, only send them again when the
+        # bank changes.
+        last_bank = None
+        for cheque in cheques:
+            bank = cheque[0]
+            self._setup_cheque(*cheque, setup_positions=bank is not last_bank)
+            self._print_cheque()
+            last_bank = bank
+
     def get_capabilities(self):
         # XXX: The Bematech DP20C manual doesn't specify what are the
         # parameter max values, so...
@@ -48,6 +48,9 @@ class MP2100TH(SerialBase, EscPosMixin):
 
     cut_line_feeds = 2
     max_characters = 67
+    # The status is requested with ENQ in ESC/BEMA mode
+    has_realtime_status = False
+    has_asb = False
     supported = True
     model_name = "Bematech MP2100 TH"
     charset = 'cp850'
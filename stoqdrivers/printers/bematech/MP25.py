@@ -44,11 +44,13 @@ from stoqdrivers.exceptions import (DriverError, OutofPaperError, PrinterError,
                                     PrinterOfflineError, PaymentAdditionError,
                                     ItemAdditionError, CancelItemError,
                                     CouponTotalizeError, CouponNotOpenError)
+from stoqdrivers import metrics
 from stoqdrivers.interfaces import ICouponPrinter
 from stoqdrivers.printers.base import BaseDriverConstants
 from stoqdrivers.printers.capabilities import Capability
 from stoqdrivers.printers.fiscal import SintegraData
 from stoqdrivers.serialbase import SerialBase
+from stoqdrivers.trace import traced
 from stoqdrivers.translation import stoqdrivers_gettext
 from stoqdrivers.utils import bytes2str, str2bytes, encode_text
 
@@ -97,6 +99,15 @@ ACK = 6
 STX = 2
 
 RETRIES_BEFORE_TIMEOUT = 40
+
+# Some commands share the same number
+_COMMAND_NAMES = {}
+for _name, _value in sorted(globals().items()):
+    if _name.startswith('CMD_'):
+        _COMMAND_NAMES.setdefault(_value, []).append(_name)
+_COMMAND_NAMES = dict((value, '/'.join(names))
+                      for value, names in _COMMAND_NAMES.items())
+del _name, _value
 CHARS_LIMIT = 492
 ALLOW_CANCEL_FISCAL_COUPON = 32
 
@@ -345,6 +356,7 @@ class MP25(SerialBase):
         data = ''
         while True:
             if a > RETRIES_BEFORE_TIMEOUT:
+                metrics.count(self, metrics.TIMEOUTS)
                 raise DriverError(_("Timeout communicating with fiscal "
                                     "printer"))
 
@@ -355,15 +367,21 @@ class MP25(SerialBase):
 
             data += reply
             if len(data) < size:
+                if metrics.enabled:
+                    metrics.count(self, metrics.RETRIES)
                 continue
 
-            log.debug("<<< %r (%d bytes)" % (data, len(data)))
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("<<< %r (%d bytes)" % (data, len(data)))
             return data
 
     def _check_error(self, retval=None):
         status = self.get_status(retval)
         status.check_error()
 
+    @metrics.timed(lambda self, command, *args, **kwargs:
+                   _COMMAND_NAMES.get(command, str(command)))
+    @traced
     def _send_command(self, command, *args, **kwargs):
         fmt = ''
         if 'response' in kwargs:
@@ -680,7 +698,7 @@ class MP25(SerialBase):
         return dict(
             item_code=Capability(max_len=13),
             item_id=Capability(digits=4),
-            items_quantity=Capability(min_size=1, digits=4, decimals=3),
+            items_quantity=Capability(min_size=0.001, digits=4, decimals=3),
             item_price=Capability(digits=6, decimals=2),
             item_description=Capability(max_len=29),
             payment_value=Capability(digits=12, decimals=2),
@@ -27,6 +27,7 @@
 Driver Capability management.
 """
 
+from decimal import Decimal
 from numbers import Real
 from typing import Optional
 
@@ -81,7 +82,7 @@ class Capability:
                 decimal_part = 1 - (1 / 10.0 ** decimals)
             else:
                 decimal_part = 0
-            self.max_size = ((10.0 ** digits) - 1) + decimal_part
+            max_size = ((10.0 ** digits) - 1) + decimal_part
 
         self.min_len = min_len
         self.max_len = max_len
@@ -89,27 +90,74 @@ class Capability:
         self.max_size = max_size
         self.digits = digits
         self.decimals = decimals
+        self._validator = None
+
+    def get_validator(self):
+        """ Get a fast validator for this capability.
+
+        The validator is compiled once, with the checks that apply to this
+        capability only.
+
+        @returns: a callable receiving a value and returning None if the
+          value is acceptable, or a message explaining why it is not
+        """
+        if self._validator is None:
+            self._validator = self._compile()
+        return self._validator
+
+    def _compile(self):
+        max_len = self.max_len
+        if max_len:
+            min_len = self.min_len or 0
+            too_long = ("the value can't be greater than %d characters"
+                        % max_len)
+            too_short = ("the value can't be less than %d characters"
+                         % min_len)
+
+            def validate_string(value):
+                if not isinstance(value, str):
+                    return _NOT_A_STRING
+                length = len(value)
+                if length > max_len:
+                    return too_long
+                if length < min_len:
+                    return too_short
+            return validate_string
+
+        max_size = self.max_size
+        min_size = self.min_size
+        if max_size is None and not min_size:
+            return _accept
+
+        if max_size is None:
+            max_size = float('inf')
+        too_big = "the value can't be greater than %r" % self.max_size
+        too_small = "the value can't be less than %r" % self.min_size
+
+        def validate_number(value):
+            if (not isinstance(value, _NUMBER_TYPES) or
+                    isinstance(value, bool)):
+                return _NOT_A_NUMBER
+            if value > max_size:
+                return too_big
+            if value < min_size:
+                return too_small
+        return validate_number
 
     def check_value(self, value):
-        if self.max_len:
-            if not isinstance(value, str):
-                raise CapabilityError("the value must be a string")
-            if len(value) > (self.max_len or float('inf')):
-                raise CapabilityError("the value can't be greater than %d "
-                                      "characters" % self.max_len)
-            elif len(value) < (self.min_len or float('-inf')):
-                raise CapabilityError("the value can't be less than %d "
-                                      "characters" % self.min_len)
-            return
-        elif not (self.max_size and self.min_size):
-            return
-
-        if not isinstance(value, (float, int)):
-            raise CapabilityError("the value must be float, integer or long")
-
-        if value > (self.max_size or float('inf')):
-            raise CapabilityError("the value can't be greater than %r"
-                                  % self.max_size)
-        elif value < (self.min_size or float('-inf')):
-            raise CapabilityError("the value can't be less than %r"
-                                  % self.min_size)
+        """ Check if the value is acceptable by the driver.
+
+        @raises CapabilityError: if it is not
+        """
+        error = self.get_validator()(value)
+        if error is not None:
+            raise CapabilityError(error)
+
+
+_NOT_A_STRING = "the value must be a string"
+_NOT_A_NUMBER = "the value must be float, integer or decimal"
+_NUMBER_TYPES = (int, float, Decimal)
+
+
+def _accept(value):
+    return None
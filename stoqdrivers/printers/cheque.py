@@ -25,23 +25,34 @@
 #               Johan Dahlin     <jdahlin@async.com.br>
 #
 
+from collections import namedtuple
 from configparser import ConfigParser
 import datetime
 from numbers import Real
+import os
+import threading
 from typing import Optional
 
-import pkg_resources
 from zope.interface.exceptions import DoesNotImplement
 from zope.interface import providedBy
 
 from stoqdrivers.interfaces import IChequePrinter
 from stoqdrivers.exceptions import ConfigError
 from stoqdrivers.printers.base import BasePrinter
-from stoqdrivers.utils import encode_text
+from stoqdrivers.utils import encode_text, get_resource_filename
 from stoqdrivers.translation import stoqdrivers_gettext
 
 _ = stoqdrivers_gettext
 
+#: A cheque to be printed by L{BaseChequePrinter.print_cheques}
+Cheque = namedtuple('Cheque', 'bank value thirdparty city date')
+Cheque.__new__.__defaults__ = (None, )
+
+# The parsed bank configurations, by configuration file:
+#   filename -> (mtime, {code: BankConfiguration})
+_banks_cache = {}
+_banks_cache_lock = threading.Lock()
+
 
 class BankConfiguration:
     """ This class store and manage the Cheque elements positions for a bank.
@@ -57,6 +68,22 @@ class BankConfiguration:
         @type items:   dict
         """
         self.name, self._items = name, items
+        self._payloads = {}
+
+    def get_payload(self, key, compile_func):
+        """ Get the position payload a driver sends to the printer for
+        this bank, compiling it on the first call.
+
+        @param key:           identifies the payload format, usually the
+                              driver class name
+        @param compile_func:  a callable receiving this bank and returning
+                              the payload
+        """
+        try:
+            return self._payloads[key]
+        except KeyError:
+            payload = self._payloads[key] = compile_func(self)
+            return payload
 
     def get_coordinate(self, name: str):
         if name not in self._items:
@@ -86,10 +113,50 @@ class BaseChequePrinter:
 
     def get_banks(self):
         configfile = self.__module__.split('.')[-2] + '.ini'
+        filename = get_resource_filename('stoqdrivers', 'conf/%s' % configfile)
+        if filename is None:
+            return None
+        try:
+            mtime = os.stat(filename).st_mtime
+        except OSError:
+            return None
+
+        with _banks_cache_lock:
+            cached = _banks_cache.get(filename)
+            if cached is None or cached[0] != mtime:
+                banks = self._read_banks(filename)
+                if banks is None:
+                    return None
+                cached = _banks_cache[filename] = (mtime, banks)
+        banks = cached[1]
+
+        # Compile the payloads now, so print_cheque does not have to
+        for bank in banks.values():
+            self._get_positions(bank)
+        self._banks = dict(banks)
+        return self._banks
 
+    def print_cheques(self, cheques):
+        """ Print a batch of cheques.
+
+        @param cheques: a sequence of L{Cheque} or of tuples with the
+                        print_cheque arguments
+        @returns:       a list with the print_cheque results
+        """
+        return [self.print_cheque(*cheque) for cheque in cheques]
+
+    def _get_positions(self, bank):
+        return bank.get_payload(type(self).__name__, self._compile_positions)
+
+    def _compile_positions(self, bank):
+        """ Build the position payload of a bank, the subclasses that send
+        the bank coordinates to the printer must override this.
+        """
+        return None
+
+    def _read_banks(self, filename):
+        banks = {}
         config = ConfigParser()
-        resource_name = 'conf/%s' % configfile
-        filename = pkg_resources.resource_filename('stoqdrivers', resource_name)
         if not config.read(filename):
             return None
         for section in config.sections():
@@ -101,8 +168,8 @@ class BaseChequePrinter:
             except ConfigError as errmsg:
                 raise ConfigError("In section `%s' of `%s': %s"
                                   % (section, filename, errmsg))
-            self._banks[int(section)] = bank
-        return self._banks
+            banks[int(section)] = bank
+        return banks
 
     def _parse_bank(self, items: dict):
         if 'name' not in items:
@@ -159,6 +226,25 @@ class ChequePrinter(BasePrinter):
                                          self._format_text(thirdparty),
                                          self._format_text(city), date)
 
+    def print_cheques(self, cheques):
+        """ Print a batch of cheques. The drivers that keep the bank
+        coordinates on the printer, like DP20C, only send them again when
+        the bank changes, the others print the cheques one by one.
+
+        @param cheques: a sequence of L{Cheque} or of tuples with the
+                        print_cheque arguments
+        """
+        self.info('print_cheques')
+        now = datetime.datetime.now()
+        batch = []
+        for cheque in cheques:
+            cheque = Cheque(*cheque)
+            batch.append(cheque._replace(
+                thirdparty=self._format_text(cheque.thirdparty),
+                city=self._format_text(cheque.city),
+                date=cheque.date or now))
+        return self._driver.print_cheques(batch)
+
     def get_capabilities(self):
         self.info("get_capabilities")
         return self._driver.get_capabilities()
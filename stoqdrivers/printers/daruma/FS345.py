@@ -623,7 +623,7 @@ class FS345(SerialBase):
     def get_capabilities(self):
         return dict(item_code=Capability(max_len=13),
                     item_id=Capability(digits=3),
-                    items_quantity=Capability(min_size=1, digits=5, decimals=3),
+                    items_quantity=Capability(min_size=0.001, digits=5, decimals=3),
                     item_price=Capability(min_size=0, digits=7, decimals=3),
                     item_description=Capability(max_len=173),
                     payment_value=Capability(digits=10, decimals=2),
@@ -629,7 +629,7 @@ class EP375(SerialBase, BaseChequePrinter):
         # must be fixed in the future.
         return dict(item_code=Capability(min_len=3, max_len=6),
                     item_id=Capability(digits=3),
-                    items_quantity=Capability(min_size=1, digits=3, decimals=3),
+                    items_quantity=Capability(min_size=0.001, digits=3, decimals=3),
                     item_price=Capability(digits=6, decimals=3),
                     item_description=Capability(max_len=60),
                     payment_value=Capability(digits=12, decimals=2),
@@ -661,6 +661,19 @@ class EP375(SerialBase, BaseChequePrinter):
         self.write(chr(EOT))
         return result
 
+    def _compile_positions(self, bank):
+        positions = [bank.get_y_coordinate("value"),
+                     bank.get_x_coordinate("value"),
+                     bank.get_y_coordinate("legal_amount"),
+                     bank.get_x_coordinate("legal_amount"),
+                     bank.get_y_coordinate("legal_amount2"),
+                     bank.get_x_coordinate("legal_amount2"),
+                     bank.get_y_coordinate("thirdparty"),
+                     bank.get_x_coordinate("thirdparty"),
+                     bank.get_y_coordinate("city"),
+                     bank.get_x_coordinate("city")]
+        return "".join(["%02d" % pos for pos in positions])
+
     def print_cheque(self, bank, value, thirdparty, city, date=None):
         if not isinstance(bank, BankConfiguration):
             raise TypeError("bank parameter must be a BankConfiguration "
@@ -672,17 +685,7 @@ class EP375(SerialBase, BaseChequePrinter):
         city = "%-20s" % city[:20]
         date = date.strftime("%d%m%y")
 
-        positions = [bank.get_y_coordinate("value"),
-                     bank.get_x_coordinate("value"),
-                     bank.get_y_coordinate("legal_amount"),
-                     bank.get_x_coordinate("legal_amount"),
-                     bank.get_y_coordinate("legal_amount2"),
-                     bank.get_x_coordinate("legal_amount2"),
-                     bank.get_y_coordinate("thirdparty"),
-                     bank.get_x_coordinate("thirdparty"),
-                     bank.get_y_coordinate("city"),
-                     bank.get_x_coordinate("city")]
-        positions_data = "".join(["%02d" % pos for pos in positions])
+        positions_data = self._get_positions(bank)
 
         self.send_cheque_command(self.CMD_PRINT_CHEQUE, positions_data, value,
                                  thirdparty, city, date)
@@ -23,7 +23,7 @@
 ##
 
 from zope.interface import implementer
-from stoqdrivers.escpos import EscPosMixin, ESC, GS
+from stoqdrivers.escpos import EscPosMixin, ESC, GS, NV_GRAPHICS_GS
 from stoqdrivers.interfaces import INonFiscalPrinter
 from stoqdrivers.serialbase import SerialBase
 
@@ -34,6 +34,7 @@ class I9(SerialBase, EscPosMixin):
     DOUBLE_HEIGHT_OFF = GS + '!' + '\x00'
 
     cut_line_feeds = 3
+    nv_graphics = NV_GRAPHICS_GS
     supported = True
     model_name = "Elgin I9"
 
@@ -48,6 +49,9 @@ class I9(SerialBase, EscPosMixin):
         self.write(ESC + 'p' + m + t1 + t2)
 
     def is_drawer_open(self):
+        drawer_open = self.get_cached_drawer_open()
+        if drawer_open is not None:
+            return drawer_open
         self.write(GS + 'r2')
         data = ord(self.read(1)[0])
         if self.inverted_drawer:
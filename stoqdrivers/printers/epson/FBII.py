@@ -40,10 +40,12 @@ from stoqdrivers.exceptions import (DriverError, PrinterError, CommandError,
                                     CancelItemError, AlmostOutofPaper,
                                     ItemAdditionError, CouponOpenError,
                                     CouponNotOpenError)
+from stoqdrivers import metrics
 from stoqdrivers.interfaces import ICouponPrinter
 from stoqdrivers.printers.base import BaseDriverConstants
 from stoqdrivers.printers.fiscal import SintegraData
 from stoqdrivers.serialbase import SerialBase
+from stoqdrivers.trace import traced
 from stoqdrivers.translation import stoqdrivers_gettext
 from stoqdrivers.utils import str2bytes
 
@@ -70,6 +72,8 @@ def unescape(string):
 
 
 FIRST_COMMAND_ID = 0x81
+# The id of the intermediate replies, sent while a command is executed
+INTERMEDIATE_ID = '\x80'
 RETRIES_BEFORE_TIMEOUT = 5
 
 # When cancel the last coupon. This values are used to define the coupon type.
@@ -269,18 +273,21 @@ class FBII(SerialBase):
         checksum = sum([ord(d) for d in package])
         return package + '%04X' % checksum
 
-    def _read_reply(self):
+    def _read_frame(self):
         reply = ''
         timeouts = 0
 
         while True:
             if timeouts > RETRIES_BEFORE_TIMEOUT:
+                metrics.count(self, metrics.TIMEOUTS)
                 raise DriverError(_("Timeout communicating with fiscal "
                                     "printer"))
 
             c = self.read(1)
             if len(c) != 1:
                 timeouts += 1
+                if metrics.enabled:
+                    metrics.count(self, metrics.RETRIES)
                 continue
 
             # STX is always the first char in the reply. Ignore garbage
@@ -295,20 +302,52 @@ class FBII(SerialBase):
                 break
 
         reply += self.read(4)
-        log.debug("<<< %s" % repr(reply))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("<<< %s" % repr(reply))
 
-        return Reply(reply, self._command_id)
+        return reply
 
-    def _send_command(self, command, extension='0000', *args):
+    def _read_reply(self):
+        return Reply(self._read_frame(), self._command_id)
+
+    def _transmit(self, command, extension, args):
+        # Send a command and wait for the printer to acknowledge it.
+        # Returns the id of the command.
         cmd = self._get_package(command, extension, args)
+        command_id = self._command_id
         self.write(cmd)
 
         # Printer should reply with an ACK imediataly
         ack = self.read(1)
         if not ack:
+            metrics.count(self, metrics.TIMEOUTS)
             raise DriverError(_("Timeout communicating with fiscal "
                                 "printer"))
         assert ack == ACK, repr(ack)
+        return command_id
+
+    def _receive(self):
+        # Read the final reply of the command being executed and acknowledge
+        # it, without parsing it.
+        while True:
+            frame = self._read_frame()
+            # Keep reading while printer sends intermediate replies.
+            if frame[1:2] != INTERMEDIATE_ID:
+                break
+            log.debug("intermediate")
+
+        checksum = '%04X' % sum([ord(c) for c in frame[:-4]])
+        if checksum != frame[-4:]:
+            raise DriverError('Erro de checksum')
+
+        # send our ACK
+        self.write(ACK)
+        return frame
+
+    @metrics.timed(lambda self, command, *args: command)
+    @traced
+    def _send_command(self, command, extension='0000', *args):
+        self._transmit(command, extension, args)
 
         reply = self._read_reply()
 
@@ -323,6 +362,53 @@ class FBII(SerialBase):
         reply.check_error()
         return reply
 
+    @metrics.timed('pipeline')
+    @traced
+    def _send_commands(self, commands, check=True):
+        """Send a sequence of commands, parsing the reply of each one while
+        the printer executes the next.
+
+        The printer only accepts a command after the reply of the previous
+        one was acknowledged, so the frames themselves are not overlapped.
+        What is overlapped is the work done on our side: each reply is
+        acknowledged as soon as it is received, the next frame is sent, and
+        only then the reply is parsed and checked. Each reply is parsed
+        with the id of the command it belongs to.
+
+        When a reply has an error, the command sent after it was already
+        executed by the printer. Its reply is read and the error raised, and
+        no more commands are sent. So only commands that do not depend on the
+        success of the previous ones can be pipelined, like the lines of a
+        report or the printer configuration.
+
+        @param commands: a list of (command, extension, args) tuples
+        @param check: if the replies should be checked for errors. When
+          False, the caller must check each reply.
+        @returns: a list with the L{Reply} of each command
+        """
+        replies = []
+        pending = None
+        for command, extension, args in commands:
+            command_id = self._transmit(command, extension, args)
+            if pending is not None:
+                try:
+                    replies.append(self._parse_reply(pending, check))
+                except Exception:
+                    # Don't leave the reply of the command in flight behind
+                    self._receive()
+                    raise
+            pending = (self._receive(), command_id)
+        if pending is not None:
+            replies.append(self._parse_reply(pending, check))
+        return replies
+
+    def _parse_reply(self, pending, check):
+        frame, command_id = pending
+        reply = Reply(frame, command_id)
+        if check:
+            reply.check_error()
+        return reply
+
     def _parse_price(self, value):
         # Valor retirado da ECF (string) convertido para decimal.
         return Decimal(value) / Decimal('100')
@@ -588,21 +674,26 @@ class FBII(SerialBase):
         """
 
         # Number of characters per line must be less than 56.
+        commands = []
         for line in text.split('\n'):
             if line == '':
-                self._print_line(line)
+                commands.append(self._get_print_line_command(line))
             for pos in range(0, len(line), 56):
                 data = line[pos:pos + 56]
-                self._print_line(data)
+                commands.append(self._get_print_line_command(data))
+        self._send_commands(commands)
 
-    def _print_line(self, line):
+    def _get_print_line_command(self, line):
         """
         As seen on ACBr code.
         Remove char '\r'. When the ECF receives the character \r,
         the error, 020E(invalid attribute) is emitted.
         """
         line = line.strip('\r')
-        self._send_command('0E02', '0000', line)
+        return ('0E02', '0000', (line, ))
+
+    def _print_line(self, line):
+        self._send_commands([self._get_print_line_command(line)])
 
     def _print_promotional_message(self, message):
         msg = []
@@ -652,14 +743,13 @@ class FBII(SerialBase):
     def get_payment_constants(self):
         methods = []
 
-        for i in range(20):
-            try:
-                reply = self._send_command('050D', '0000', '%d' % (i + 1))
-            except DriverError as e:
-                if e.code == 0x090C:  # Tipo de pagamento não definido
-                    continue
-                else:
-                    raise
+        replies = self._send_commands(
+            [('050D', '0000', ('%d' % (i + 1), )) for i in range(20)],
+            check=False)
+        for i, reply in enumerate(replies):
+            if reply.reply_status == '090C':  # Tipo de pagamento não definido
+                continue
+            reply.check_error()
             name, vinculado = reply.fields
             methods.append(('%d' % (i + 1), name.strip()))
 
@@ -754,35 +844,44 @@ class FBII(SerialBase):
     #   Printer configuration
     #
 
-    def _define_payment_method(self, id, name, vinculated=False):
+    def _get_payment_method_command(self, id, name, vinculated=False):
         if vinculated:
             extension = '0001'
         else:
             extension = '0000'
 
         id = '%02d' % id
-        self._send_command('050C', extension, id, name)
+        return ('050C', extension, (id, name))
 
-    def _define_tax_code(self, value, service=False):
+    def _get_tax_code_command(self, value, service=False):
         if service:
             extension = '0001'
         else:
             extension = '0000'
 
-        self._send_command('0540', extension, value)
+        return ('0540', extension, (value, ))
+
+    def _define_payment_method(self, id, name, vinculated=False):
+        self._send_commands([self._get_payment_method_command(id, name,
+                                                              vinculated)])
+
+    def _define_tax_code(self, value, service=False):
+        self._send_commands([self._get_tax_code_command(value, service)])
 
     def _setup_constants(self):
-        self._define_payment_method(2, 'Cheque')
-        self._define_payment_method(3, 'Boleto')
-        self._define_payment_method(4, 'Cartao credito', vinculated=True)
-        self._define_payment_method(5, 'Cartao debito', vinculated=True)
-        self._define_payment_method(6, 'Financeira')
-        self._define_payment_method(7, 'Vale compra')
-
-        self._define_tax_code("1700")
-        self._define_tax_code("1200")
-        self._define_tax_code("2500")
-        self._define_tax_code("0800")
-        self._define_tax_code("0500")
-        self._define_tax_code("0300", service=True)
-        self._define_tax_code("0900", service=True)
+        self._send_commands([
+            self._get_payment_method_command(2, 'Cheque'),
+            self._get_payment_method_command(3, 'Boleto'),
+            self._get_payment_method_command(4, 'Cartao credito', vinculated=True),
+            self._get_payment_method_command(5, 'Cartao debito', vinculated=True),
+            self._get_payment_method_command(6, 'Financeira'),
+            self._get_payment_method_command(7, 'Vale compra'),
+
+            self._get_tax_code_command("1700"),
+            self._get_tax_code_command("1200"),
+            self._get_tax_code_command("2500"),
+            self._get_tax_code_command("0800"),
+            self._get_tax_code_command("0500"),
+            self._get_tax_code_command("0300", service=True),
+            self._get_tax_code_command("0900", service=True),
+        ])
@@ -28,15 +28,18 @@
 from collections import namedtuple
 import datetime
 from decimal import Decimal
+import functools
+import inspect
 import logging
 from numbers import Real
 import traceback
 import sys
 
 from stoqdrivers.exceptions import (CloseCouponError, PaymentAdditionError,
-                                    AlreadyTotalized, InvalidValue)
+                                    AlreadyTotalized, DriverError, InvalidValue)
 from stoqdrivers.enum import TaxType, UnitType
 from stoqdrivers.printers.base import BasePrinter
+from stoqdrivers.printers.journal import CouponJournal, RECOVERY_RESUMED
 from stoqdrivers.utils import encode_text
 from stoqdrivers.translation import stoqdrivers_gettext
 
@@ -44,6 +47,53 @@ _ = stoqdrivers_gettext
 
 log = logging.getLogger('stoqdrivers.fiscalprinter')
 
+#: A problem found by L{FiscalPrinter.validate_coupon}. I{section} is one of
+#: 'customer', 'items', 'totalize', 'payments' or 'close', I{index} the
+#: position of the item or payment, and I{field} the argument that is not
+#: valid, or None when the problem is not with a single argument.
+CouponViolation = namedtuple('CouponViolation', 'section index field message')
+
+
+def _to_decimal(value):
+    if isinstance(value, float):
+        return Decimal(str(value))
+    return Decimal(value)
+
+
+def _journaled(read_coo=False):
+    """Record the decorated FiscalPrinter method in the coupon journal, if
+    one is enabled.
+
+    @param read_coo: also store the printer COO before the call, so the
+      recovery can tell if a coupon was opened
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            journal = self._journal
+            if journal is None:
+                return func(self, *args, **kwargs)
+
+            arguments = signature.bind(self, *args, **kwargs).arguments
+            arguments.pop('self')
+            extra = {}
+            if read_coo:
+                extra['coo'] = self._driver.get_coo()
+            seq = journal.record_call(name, dict(arguments), **extra)
+            try:
+                result = func(self, *args, **kwargs)
+            except Exception as e:
+                journal.record_error(seq, e)
+                raise
+            journal.record_done(seq, result)
+            return result
+        return wrapper
+    return decorator
+
+
 #
 # FiscalPrinter interface
 #
@@ -54,6 +104,7 @@ class FiscalPrinter(BasePrinter):
                  *args, **kwargs):
         BasePrinter.__init__(self, brand, model, device, config_file, *args,
                              **kwargs)
+        self._journal = None
         self._has_been_totalized = False
         self.payments_total_value = Decimal("0.0")
         self.totalized_value = Decimal("0.0")
@@ -79,6 +130,53 @@ class FiscalPrinter(BasePrinter):
         log.info('setup()')
         self._driver.setup()
 
+    #
+    # Coupon journal
+    #
+
+    def enable_journal(self, directory=None):
+        """Record every state-changing call in a L{CouponJournal}, keyed by
+        the printer serial.
+
+        @param directory: where to store the journal, see L{CouponJournal}
+        @returns: the journal
+        """
+        if self._journal is None:
+            self._journal = CouponJournal(self.get_serial(), directory)
+        return self._journal
+
+    def get_journal(self):
+        return self._journal
+
+    def recover_from_journal(self, resume=True):
+        """Reconcile the coupon journal with the printer after a crash.
+
+        Must be called after L{enable_journal} and before any other coupon
+        operation. See L{CouponJournal.recover}.
+        """
+        log.info('recover_from_journal(resume=%r)' % (resume, ))
+        result = self._journal.recover(self, resume=resume)
+        if result.action != RECOVERY_RESUMED:
+            self._journal.truncate_if_needed()
+        return result
+
+    def _restore_journal_state(self, calls):
+        # Rebuild the coupon state we keep on this side from the journal
+        for call, result in calls:
+            op, args = call['op'], call['args']
+            if op == 'identify_customer':
+                # The customer is stored by the driver, not by the printer
+                self._driver.coupon_identify_customer(
+                    self._format_text(args['customer_name']),
+                    self._format_text(args['customer_address']),
+                    self._format_text(args['customer_id']))
+            elif op == 'totalize':
+                self._has_been_totalized = True
+                self.totalized_value = result
+            elif op == 'add_payment':
+                self.payments_total_value += args['payment_value']
+
+    @_journaled()
     def identify_customer(self, customer_name: str, customer_address: str, customer_id: str):
         log.info('identify_customer(customer_name=%r, '
                  'customer_address=%r, customer_id=%r)' % (
@@ -96,11 +194,13 @@ class FiscalPrinter(BasePrinter):
         log.info('has_open_coupon()')
         return self._driver.has_open_coupon()
 
+    @_journaled(read_coo=True)
     def open(self):
         log.info('coupon_open()')
 
         return self._driver.coupon_open()
 
+    @_journaled()
     def add_item(self, item_code: str, item_description: str, item_price: Real, taxcode: TaxType,
                  items_quantity=Decimal("1.0"), unit=UnitType.EMPTY,
                  discount=Decimal("0.0"), surcharge=Decimal("0.0"),
@@ -114,6 +214,14 @@ class FiscalPrinter(BasePrinter):
         if self._has_been_totalized:
             raise AlreadyTotalized("the coupon is already totalized, you "
                                    "can't add more items")
+        self._check_item(item_price, unit, discount, surcharge, unit_desc)
+
+        return self._driver.coupon_add_item(
+            self._format_text(item_code), self._format_text(item_description),
+            item_price, taxcode, items_quantity, unit, discount, surcharge,
+            unit_desc=self._format_text(unit_desc))
+
+    def _check_item(self, item_price, unit, discount, surcharge, unit_desc):
         if discount and surcharge:
             raise TypeError("discount and surcharge can not be used together")
         elif unit != UnitType.CUSTOM and unit_desc:
@@ -132,26 +240,26 @@ class FiscalPrinter(BasePrinter):
         if discount < 0:
             raise ValueError('Discount cannot be negative')
 
-        return self._driver.coupon_add_item(
-            self._format_text(item_code), self._format_text(item_description),
-            item_price, taxcode, items_quantity, unit, discount, surcharge,
-            unit_desc=self._format_text(unit_desc))
-
+    @_journaled()
     def totalize(self, discount=Decimal(0), surcharge=Decimal(0),
                  taxcode=TaxType.NONE):
         log.info('totalize(discount=%r, surcharge=%r, taxcode=%r)' % (
             discount, surcharge, taxcode))
 
+        self._check_totalize(discount, surcharge, taxcode)
+        result = self._driver.coupon_totalize(discount, surcharge, taxcode)
+        self._has_been_totalized = True
+        self.totalized_value = result
+        return result
+
+    def _check_totalize(self, discount, surcharge, taxcode):
         if discount and surcharge:
             raise TypeError("discount and surcharge can not be used together")
         if surcharge and taxcode == TaxType.NONE:
             raise ValueError("to specify a surcharge you need specify its "
                              "tax code")
-        result = self._driver.coupon_totalize(discount, surcharge, taxcode)
-        self._has_been_totalized = True
-        self.totalized_value = result
-        return result
 
+    @_journaled()
     def add_payment(self, payment_method: str, payment_value: Decimal, description=''):
         log.info("add_payment(method=%r, value=%r, description=%r)" % (
             payment_method, payment_value, description))
@@ -165,6 +273,7 @@ class FiscalPrinter(BasePrinter):
         self.payments_total_value += payment_value
         return result
 
+    @_journaled()
     def cancel(self):
         log.info('coupon_cancel()')
         retval = self._driver.coupon_cancel()
@@ -178,11 +287,13 @@ class FiscalPrinter(BasePrinter):
         log.info('cancel_last_coupon()')
         self._driver.cancel_last_coupon()
 
+    @_journaled()
     def cancel_item(self, item_id: int):
         log.info('coupon_cancel_item(item_id=%r)' % (item_id,))
 
         return self._driver.coupon_cancel_item(item_id)
 
+    @_journaled()
     def close(self, promotional_message=''):
         log.info('coupon_close(promotional_message=%r)' % (
             promotional_message))
@@ -206,6 +317,115 @@ class FiscalPrinter(BasePrinter):
         self.totalized_value = Decimal("0.0")
         return res
 
+    def validate_coupon(self, items, payments, discount=Decimal(0),
+                        customer=None, promotional_message=''):
+        """Check a whole coupon against the printer capabilities, before
+        sending anything to the printer.
+
+        Every argument is checked, as it would be sent to the printer, and
+        all the problems found are returned, so the sale can be fixed before
+        the coupon is opened instead of being cancelled halfway.
+
+        @param items: the arguments of L{add_item} for each item, as dicts
+          of keyword arguments or sequences of positional arguments
+        @param payments: the arguments of L{add_payment} for each payment,
+          in the same format
+        @param discount: the discount that will be passed to L{totalize}
+        @param customer: the arguments of L{identify_customer}, if the
+          customer will be identified
+        @param promotional_message: the message that will be passed to
+          L{close}
+        @returns: a list of L{CouponViolation}, empty if the coupon is valid
+        """
+        violations = []
+        validators = dict((name, capability.get_validator())
+                          for name, capability in self._capabilities.items())
+
+        def check(section, index, field, value, capability=None):
+            validator = validators.get(capability or field)
+            if validator is None:
+                return
+            if isinstance(value, str):
+                value = self._format_text(value)
+            message = validator(value)
+            if message is not None:
+                violations.append(CouponViolation(section, index, field,
+                                                  message))
+
+        def bind(section, index, method, args):
+            signature = inspect.signature(method)
+            try:
+                if isinstance(args, dict):
+                    bound = signature.bind(**args)
+                else:
+                    bound = signature.bind(*args)
+            except TypeError as e:
+                violations.append(CouponViolation(section, index, None, str(e)))
+                return None
+            bound.apply_defaults()
+            return bound.arguments
+
+        if customer is not None:
+            args = bind('customer', None, self.identify_customer, customer)
+            if args is not None:
+                for field in ['customer_name', 'customer_address', 'customer_id']:
+                    check('customer', None, field, args[field])
+
+        if not items:
+            violations.append(CouponViolation('items', None, None,
+                                              _("The coupon has no items")))
+        total = Decimal(0)
+        for i, item in enumerate(items):
+            args = bind('items', i, self.add_item, item)
+            if args is None:
+                continue
+            for field in ['item_code', 'item_description', 'item_price',
+                          'items_quantity']:
+                check('items', i, field, args[field])
+            try:
+                self._check_item(args['item_price'], args['unit'],
+                                 args['discount'], args['surcharge'],
+                                 args['unit_desc'])
+                total += (_to_decimal(args['item_price']) *
+                          _to_decimal(args['items_quantity']) -
+                          _to_decimal(args['discount']) +
+                          _to_decimal(args['surcharge']))
+            except (TypeError, ValueError, ArithmeticError, DriverError) as e:
+                violations.append(CouponViolation('items', i, None, str(e)))
+
+        if discount < 0:
+            violations.append(CouponViolation(
+                'totalize', None, 'discount', _("The discount cannot be negative")))
+        elif discount > total:
+            violations.append(CouponViolation(
+                'totalize', None, 'discount',
+                _("The discount (%.2f) is greater than the coupon total "
+                  "(%.2f)") % (discount, total)))
+        total -= _to_decimal(discount)
+
+        paid = Decimal(0)
+        for i, payment in enumerate(payments):
+            args = bind('payments', i, self.add_payment, payment)
+            if args is None:
+                continue
+            check('payments', i, 'payment_value', args['payment_value'])
+            check('payments', i, 'description', args['description'],
+                  'payment_description')
+            paid += _to_decimal(args['payment_value'])
+        if not payments:
+            violations.append(CouponViolation(
+                'payments', None, None,
+                _("It is not possible close the coupon since there are no "
+                  "payments defined.")))
+        elif paid < total:
+            violations.append(CouponViolation(
+                'payments', None, None,
+                _("The payments total (%.2f) is less than the coupon total "
+                  "(%.2f)") % (paid, total)))
+
+        check('close', None, 'promotional_message', promotional_message)
+        return violations
+
     def summarize(self):
         log.info('summarize()')
 
@@ -29,18 +29,18 @@ FiscNet base driver implementation.
 """
 
 
-import configparser
 import datetime
 from decimal import Decimal
 import logging
 import re
-import os
 
 from serial import PARITY_EVEN
 from zope.interface import implementer
 
+from stoqdrivers import metrics
+from stoqdrivers.configparser import StoqdriversConfig
 from stoqdrivers.enum import PaymentMethodType, TaxType, UnitType
-from stoqdrivers.exceptions import (DriverError, PendingReduceZ,
+from stoqdrivers.exceptions import (ConfigError, DriverError, PendingReduceZ,
                                     CommandParametersError, CommandError,
                                     ReadXError, OutofPaperError,
                                     CouponTotalizeError, PaymentAdditionError,
@@ -53,6 +53,7 @@ from stoqdrivers.printers.capabilities import Capability
 from stoqdrivers.printers.cheque import BaseChequePrinter, BankConfiguration
 from stoqdrivers.printers.fiscal import SintegraData
 from stoqdrivers.serialbase import SerialBase
+from stoqdrivers.trace import traced
 from stoqdrivers.translation import stoqdrivers_gettext
 from stoqdrivers.utils import bytes2str, encode_text, decode_text
 
@@ -170,16 +171,16 @@ class FiscNetECF(SerialBase):
         SerialBase.__init__(self, port)
         self._consts = consts or FiscNetConstants
         self._command_id = 0
-        config = configparser.RawConfigParser()
-        has_conf = config.read([os.path.expanduser('~/.stoq/stoqdrivers.conf')])
-        if has_conf:
+        try:
+            config = StoqdriversConfig()
+        except ConfigError:
+            log.info("file: stoqdrivers.conf not found")
+        else:
             try:
-                self.CASH_SUPPLY = config.get('fiscnet', 'cash_supply')
-                self.CASH_REMOVAL = config.get('fiscnet', 'cash_removal')
-            except configparser.NoOptionError:
+                self.CASH_SUPPLY = config.get_value('cash_supply', 'fiscnet')
+                self.CASH_REMOVAL = config.get_value('cash_removal', 'fiscnet')
+            except ConfigError:
                 log.info("Option not found, check stoqdrivers.conf")
-        else:
-            log.info("file: stoqdrivers.conf not found")
         self._reset()
 
     def _reset(self):
@@ -223,6 +224,8 @@ class FiscNetECF(SerialBase):
 
         return result
 
+    @metrics.timed(lambda self, command, **params: command)
+    @traced
     def _send_command(self, command, **params):
         # Page 38-39
         parameters = []
@@ -0,0 +1,365 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Crash-safe journal of the state-changing FiscalPrinter calls.
+
+Every call is recorded before being sent to the printer, and its result (or
+error) after the printer replies. The records are appended to a file named
+after the printer serial and flushed to disk by a writer thread, which
+fsyncs all the records appended since its last run at once (group commit),
+so the caller never waits for the disk.
+
+When the POS process dies in the middle of a coupon, L{CouponJournal.recover}
+compares the journal with the printer counters (the open coupon flag, the
+COO and the last item id) and either resumes the coupon, replaying the call
+that did not reach the printer, or cancels it.
+"""
+
+from collections import namedtuple
+import logging
+import os
+import re
+import threading
+
+from stoqdrivers.utils import json_dumps, json_loads
+
+log = logging.getLogger('stoqdrivers.journal')
+
+#: The calls of FiscalPrinter that change the state of a coupon
+JOURNALED_CALLS = frozenset(['identify_customer', 'open', 'add_item',
+                             'cancel_item', 'totalize', 'add_payment',
+                             'close', 'cancel'])
+
+(RECOVERY_NOTHING,
+ RECOVERY_RESUMED,
+ RECOVERY_CANCELLED,
+ RECOVERY_CLOSED,
+ RECOVERY_ABANDONED) = range(5)
+
+RecoveryResult = namedtuple('RecoveryResult', 'action coupon replayed')
+
+
+class PendingCoupon:
+    """A coupon that was opened but not closed or cancelled in the journal.
+
+    @ivar coo: the printer COO read right before the coupon was opened
+    @ivar calls: a list of (call record, result) for the successful calls
+    @ivar in_flight: the call record of the last call, when its result was
+      never recorded
+    """
+
+    def __init__(self, open_call, customer=None):
+        self.coo = open_call.get('coo')
+        self.calls = []
+        if customer is not None:
+            self.calls.append(customer)
+        self.in_flight = open_call
+        self.opened = False
+
+    def get_last_item_id(self):
+        ids = [result for call, result in self.calls
+               if call['op'] == 'add_item' and isinstance(result, int)]
+        return max(ids) if ids else 0
+
+
+class CouponJournal:
+    """An append-only journal of the coupon operations of one printer.
+
+    @param serial: the printer serial, used to name the journal file
+    @param directory: where the journal is stored. Defaults to
+      ~/.stoq/journal
+    @param max_size: the journal is truncated when it gets bigger than this
+      and there is no coupon open
+    """
+
+    def __init__(self, serial, directory=None, max_size=1024 * 1024):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.stoq', 'journal')
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.serial = serial
+        self.max_size = max_size
+        self.filename = os.path.join(
+            directory, '%s.journal' % re.sub(r'[^\w.-]', '_', str(serial)))
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._seq = self._durable_seq = self._get_last_seq()
+        self._error = None
+        self._running = True
+        self._fd = os.open(self.filename,
+                           os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._thread = threading.Thread(target=self._run,
+                                        name='stoqdrivers-journal-%s' % serial)
+        self._thread.daemon = True
+        self._thread.start()
+
+    #
+    # Writing
+    #
+
+    def record_call(self, op, arguments, **extra):
+        """Record that I{op} is about to be sent to the printer.
+
+        @returns: the sequence number of the record, to be used by
+          L{record_done} and L{record_error}
+        """
+        record = dict(type='call', op=op, args=arguments)
+        record.update(extra)
+        return self._append(record)
+
+    def record_done(self, call_seq, result, **extra):
+        record = dict(type='done', call=call_seq, result=result)
+        record.update(extra)
+        return self._append(record)
+
+    def record_error(self, call_seq, error, **extra):
+        record = dict(type='error', call=call_seq, error=str(error))
+        record.update(extra)
+        return self._append(record)
+
+    def sync(self, timeout=None):
+        """Wait until all the records appended so far are on disk.
+
+        @returns: True if the records were written before the timeout
+        """
+        with self._cond:
+            target = self._seq
+            self._cond.notify_all()
+            self._cond.wait_for(
+                lambda: self._durable_seq >= target or self._error is not None,
+                timeout)
+            if self._error is not None:
+                raise self._error
+            return self._durable_seq >= target
+
+    def close(self):
+        """Write the pending records and stop the writer thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join()
+        os.close(self._fd)
+
+    def _append(self, record):
+        with self._cond:
+            self._seq += 1
+            record['seq'] = self._seq
+            self._pending.append(json_dumps(record) + '\n')
+            self._cond.notify_all()
+            return self._seq
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and self._running:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+                last_seq = self._seq
+
+            try:
+                os.write(self._fd, ''.join(batch).encode())
+                os.fsync(self._fd)
+            except OSError as e:
+                log.error('Could not write to the journal %s: %s'
+                          % (self.filename, e))
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                continue
+
+            with self._cond:
+                self._durable_seq = last_seq
+                self._cond.notify_all()
+
+    #
+    # Reading
+    #
+
+    def read_records(self):
+        """Read all the records that are on disk.
+
+        A record that was partially written when the power went down is
+        ignored.
+        """
+        records = []
+        try:
+            fp = open(self.filename, 'r')
+        except OSError:
+            return records
+        with fp:
+            for line in fp:
+                try:
+                    records.append(json_loads(line))
+                except ValueError:
+                    log.warning('Ignoring a truncated record on %s'
+                                % self.filename)
+        return records
+
+    def _get_last_seq(self):
+        records = self.read_records()
+        return records[-1]['seq'] if records else 0
+
+    def get_pending_coupon(self):
+        """Find the coupon that was left open by the last session.
+
+        @returns: a L{PendingCoupon} or None
+        """
+        self.sync()
+        calls = {}
+        customer = None
+        pending = None
+        for record in self.read_records():
+            type_ = record['type']
+            if type_ == 'call':
+                calls[record['seq']] = record
+                if record['op'] == 'open':
+                    pending = PendingCoupon(record, customer)
+                    customer = None
+                elif pending is not None:
+                    pending.in_flight = record
+            elif type_ in ('done', 'error'):
+                call = calls.pop(record['call'], None)
+                if call is None:
+                    continue
+                if pending is not None and pending.in_flight is call:
+                    pending.in_flight = None
+                if type_ == 'error':
+                    if call['op'] == 'open' and pending is not None and not pending.opened:
+                        pending = None
+                    continue
+                op = call['op']
+                if pending is None:
+                    if op == 'identify_customer':
+                        customer = (call, record.get('result'))
+                    continue
+                if op == 'open':
+                    pending.opened = True
+                pending.calls.append((call, record.get('result')))
+                if op in ('close', 'cancel'):
+                    pending = None
+            elif type_ == 'abandon':
+                pending = None
+        return pending
+
+    def truncate_if_needed(self):
+        """Truncate the journal if it is too big. Must only be called when
+        there is no coupon open.
+        """
+        self.sync()
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError:
+            return
+        if size <= self.max_size:
+            return
+        with self._cond:
+            os.ftruncate(self._fd, 0)
+            os.fsync(self._fd)
+
+    #
+    # Recovery
+    #
+
+    def recover(self, printer, resume=True):
+        """Reconcile the journal with the printer after a crash.
+
+        @param printer: the L{stoqdrivers.printers.fiscal.FiscalPrinter} this
+          journal belongs to
+        @param resume: if True, a coupon that is still open on the printer
+          is resumed when its state is known exactly. Otherwise it is
+          cancelled.
+        @returns: a L{RecoveryResult}
+        """
+        self.sync()
+        pending = self.get_pending_coupon()
+        device_open = bool(printer.has_open_coupon())
+
+        if pending is None:
+            if device_open:
+                # A coupon we know nothing about, cancel it.
+                printer.cancel()
+                return RecoveryResult(RECOVERY_CANCELLED, None, [])
+            return RecoveryResult(RECOVERY_NOTHING, None, [])
+
+        in_flight = pending.in_flight
+        in_flight_op = in_flight['op'] if in_flight else None
+
+        if not device_open:
+            if in_flight_op == 'close':
+                self.record_done(in_flight['seq'], printer.get_coo(),
+                                 recovered=True)
+                return RecoveryResult(RECOVERY_CLOSED, pending, [])
+            elif in_flight_op == 'cancel':
+                self.record_done(in_flight['seq'], None, recovered=True)
+                return RecoveryResult(RECOVERY_CANCELLED, pending, [])
+            elif (in_flight_op == 'open' and pending.coo is not None and
+                  printer.get_coo() == pending.coo):
+                # The coupon never reached the printer
+                self.record_error(in_flight['seq'], 'not applied',
+                                  recovered=True)
+                return RecoveryResult(RECOVERY_NOTHING, pending, [])
+            # The coupon is gone and we can't tell how it ended.
+            self._append(dict(type='abandon'))
+            return RecoveryResult(RECOVERY_ABANDONED, pending, [])
+
+        if in_flight_op == 'open':
+            self.record_done(in_flight['seq'], None, recovered=True)
+            pending.opened = True
+            in_flight = in_flight_op = None
+
+        if not resume:
+            printer.cancel()
+            return RecoveryResult(RECOVERY_CANCELLED, pending, [])
+
+        replay = []
+        if in_flight_op == 'add_item':
+            get_last_item_id = getattr(printer._driver, '_get_last_item_id', None)
+            if get_last_item_id is None:
+                printer.cancel()
+                return RecoveryResult(RECOVERY_CANCELLED, pending, [])
+            last_item_id = get_last_item_id()
+            if last_item_id > pending.get_last_item_id():
+                self.record_done(in_flight['seq'], last_item_id,
+                                 recovered=True)
+                pending.calls.append((in_flight, last_item_id))
+            else:
+                self.record_error(in_flight['seq'], 'not applied',
+                                  recovered=True)
+                replay.append(in_flight)
+        elif in_flight_op == 'identify_customer':
+            self.record_error(in_flight['seq'], 'not applied', recovered=True)
+            replay.append(in_flight)
+        elif in_flight is not None:
+            # There is no counter telling us if a totalize, payment or item
+            # cancellation reached the printer, so start over.
+            printer.cancel()
+            return RecoveryResult(RECOVERY_CANCELLED, pending, [])
+
+        printer._restore_journal_state(pending.calls)
+        for call in replay:
+            getattr(printer, call['op'])(**call['args'])
+        return RecoveryResult(RECOVERY_RESUMED, pending, replay)
@@ -0,0 +1,198 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Static manifest of the printer drivers.
+
+Listing the supported printers used to import every driver module, and with
+them qrcode, PIL and all the protocol tables. The manifest has everything
+needed to answer those queries, so a driver module is only imported when a
+device is actually created (or when L{DriverInfo.load} is called).
+
+The manifest is generated from the driver modules by L{generate_manifest},
+and a test makes sure both are in sync. After adding or changing a driver,
+regenerate it with::
+
+    python -m stoqdrivers.printers.manifest
+"""
+
+from collections import namedtuple
+
+from stoqdrivers.utils import get_obj_from_module
+
+#: The driver modules, in the order they are listed, by brand
+DRIVER_MODULES = [
+    ('bematech', ['DP20C', 'MP20', 'MP2100', 'MP2100TH', 'MP4200TH', 'MP25']),
+    ('daruma', ['DR700', 'FS2100', 'FS345', 'FS600MFD']),
+    ('dataregis', ['EP375', 'Quick']),
+    ('elgin', ['I9', 'KFiscal']),
+    ('tanca', ['TP650']),
+    ('epson', ['FBII', 'FBIII', 'TMT20', 'TMT70']),
+    ('fiscnet', ['FiscNetECF']),
+    ('perto', ['Pay2023']),
+    ('snbc', ['BKC310']),
+    ('sweda', ['SI150']),
+    ('virtual', ['Simple']),
+]
+
+VIRTUAL_BRAND = 'virtual'
+
+
+class DriverInfo(namedtuple('DriverInfo', ['brand', 'model', 'model_name',
+                                           'interfaces', 'transport',
+                                           'supported'])):
+    """What we know about a driver without importing it.
+
+    @ivar interfaces: the names of the interfaces the driver implements
+    @ivar transport: 'serial', 'usb' or None, depending on the base class
+      of the driver
+    @ivar supported: the value of the driver C{supported} attribute, or
+      None if it does not have one, in which case it is not listed
+    """
+
+    __slots__ = ()
+
+    @property
+    def module_name(self):
+        return 'stoqdrivers.printers.%s.%s' % (self.brand, self.model)
+
+    def implements(self, interface):
+        """If the driver implements I{interface} (an interface object)."""
+        return interface.__name__ in self.interfaces
+
+    def load(self):
+        """Import the driver module.
+
+        @returns: the driver class
+        """
+        return get_obj_from_module(self.module_name, obj_name=self.model)
+
+
+DRIVER_MANIFEST = [
+    DriverInfo('bematech', 'DP20C', 'Bematech DP20C',
+               ('IChequePrinter', ), 'serial', None),
+    DriverInfo('bematech', 'MP20', 'Bematech MP20 TH FI',
+               ('ICouponPrinter', ), 'serial', True),
+    DriverInfo('bematech', 'MP2100', 'Bematech MP2100 TH FI',
+               ('ICouponPrinter', ), 'serial', True),
+    DriverInfo('bematech', 'MP2100TH', 'Bematech MP2100 TH',
+               ('INonFiscalPrinter', ), 'serial', True),
+    DriverInfo('bematech', 'MP4200TH', 'Bematech MP4200 TH',
+               ('INonFiscalPrinter', ), 'serial', True),
+    DriverInfo('bematech', 'MP25', 'Bematech MP25 FI',
+               ('ICouponPrinter', ), 'serial', True),
+    DriverInfo('daruma', 'DR700', 'Daruma DR 700',
+               ('INonFiscalPrinter', ), 'serial', True),
+    DriverInfo('daruma', 'FS2100', 'Daruma FS 2100',
+               ('ICouponPrinter', ), 'serial', True),
+    DriverInfo('daruma', 'FS345', 'Daruma FS 345',
+               ('ICouponPrinter', ), 'serial', True),
+    DriverInfo('daruma', 'FS600MFD', 'Daruma FS 600 MFD',
+               ('ICouponPrinter', ), 'serial', True),
+    DriverInfo('dataregis', 'EP375', 'Dataregis 375 EP',
+               ('IChequePrinter', 'ICouponPrinter'), 'serial', None),
+    DriverInfo('dataregis', 'Quick', 'Dataregis ECF-IF 3202DT (Quick)',
+               ('IChequePrinter', 'ICouponPrinter'), 'serial', True),
+    DriverInfo('elgin', 'I9', 'Elgin I9',
+               ('INonFiscalPrinter', ), 'serial', True),
+    DriverInfo('elgin', 'KFiscal', 'Elgin K Fiscal',
+               ('IChequePrinter', 'ICouponPrinter'), 'serial', True),
+    DriverInfo('tanca', 'TP650', 'Tanca TP650',
+               ('INonFiscalPrinter', ), 'usb', True),
+    DriverInfo('epson', 'FBII', 'Epson FBII',
+               ('ICouponPrinter', ), 'serial', True),
+    DriverInfo('epson', 'FBIII', 'Epson FBIII',
+               ('ICouponPrinter', ), 'serial', True),
+    DriverInfo('epson', 'TMT20', 'Epson TM-T20',
+               ('INonFiscalPrinter', ), 'usb', True),
+    DriverInfo('epson', 'TMT70', 'Epson TM-T70',
+               ('INonFiscalPrinter', ), 'usb', True),
+    DriverInfo('fiscnet', 'FiscNetECF', None,
+               ('IChequePrinter', 'ICouponPrinter'), 'serial', None),
+    DriverInfo('perto', 'Pay2023', 'Pertopay Fiscal 2023',
+               ('IChequePrinter', 'ICouponPrinter'), 'serial', True),
+    DriverInfo('snbc', 'BKC310', 'SNBC BK-C310',
+               ('INonFiscalPrinter', ), 'usb', True),
+    DriverInfo('sweda', 'SI150', 'Sweda SI-150',
+               ('INonFiscalPrinter', ), 'usb', True),
+    DriverInfo('virtual', 'Simple', 'Virtual Printer',
+               ('ICouponPrinter', 'INonFiscalPrinter'), None, False),
+]
+
+
+def get_driver_info(brand, model):
+    """Get the L{DriverInfo} of a driver, or None if it is not known."""
+    for info in DRIVER_MANIFEST:
+        if info.brand == brand and info.model == model:
+            return info
+    return None
+
+
+def generate_manifest():
+    """Build the manifest by importing all the driver modules.
+
+    @returns: a list of L{DriverInfo}, in the same order as
+      L{DRIVER_MANIFEST}
+    """
+    from zope.interface import implementedBy
+    from stoqdrivers.serialbase import SerialBase
+    from stoqdrivers.usbbase import UsbBase
+
+    manifest = []
+    for brand, models in DRIVER_MODULES:
+        for model in models:
+            driver = get_obj_from_module(
+                'stoqdrivers.printers.%s.%s' % (brand, model), obj_name=model)
+            if issubclass(driver, SerialBase):
+                transport = 'serial'
+            elif issubclass(driver, UsbBase):
+                transport = 'usb'
+            else:
+                transport = None
+            interfaces = tuple(sorted(iface.__name__
+                                      for iface in implementedBy(driver)))
+            manifest.append(DriverInfo(brand, model,
+                                       getattr(driver, 'model_name', None),
+                                       interfaces, transport,
+                                       getattr(driver, 'supported', None)))
+    return manifest
+
+
+def format_manifest(manifest):
+    """Format a manifest as the source of L{DRIVER_MANIFEST}."""
+    lines = ['DRIVER_MANIFEST = [']
+    for info in manifest:
+        if len(info.interfaces) == 1:
+            interfaces = '(%r, )' % info.interfaces
+        else:
+            interfaces = repr(info.interfaces)
+        lines.append('    DriverInfo(%r, %r, %r,' % (info.brand, info.model,
+                                                     info.model_name))
+        lines.append('               %s, %r, %r),' % (interfaces, info.transport,
+                                                      info.supported))
+    lines.append(']')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(format_manifest(generate_manifest()))
@@ -22,9 +22,13 @@
 ## Author(s): Stoq Team <stoq-devel@async.com.br>
 ##
 
+import logging
 import re
 
 from stoqdrivers.printers.base import BasePrinter
+from stoqdrivers.spooler import PRIORITY_URGENT
+
+log = logging.getLogger('stoqdrivers.nonfiscalprinter')
 
 
 class NonFiscalPrinter(BasePrinter):
@@ -32,6 +36,7 @@ class NonFiscalPrinter(BasePrinter):
                  *args, **kwargs):
         BasePrinter.__init__(self, brand, model, device, config_file, *args,
                              **kwargs)
+        self._status_refresh = None
 
     @property
     def charset(self):
@@ -101,6 +106,24 @@ class NonFiscalPrinter(BasePrinter):
         if hasattr(self._driver, 'print_matrix'):
             self._driver.print_matrix(data)
 
+    def load_logos(self, logos):
+        """Get the logos ready to be printed by L{print_logo}, storing them on
+        the printer memory when it has NV graphics.
+
+        @param logos: a dict mapping the names to matrices
+        @see: L{stoqdrivers.escpos.EscPosMixin.load_logos}
+        """
+        if hasattr(self._driver, 'load_logos'):
+            return self._driver.load_logos(logos)
+        self._logos = dict(logos)
+        return []
+
+    def print_logo(self, name):
+        if hasattr(self._driver, 'print_logo'):
+            self._driver.print_logo(name)
+        else:
+            self.print_matrix(self._logos[name])
+
     def separator(self):
         if hasattr(self._driver, 'separator'):
             self._driver.separator()
@@ -115,11 +138,91 @@ class NonFiscalPrinter(BasePrinter):
             self._driver.open_drawer()
 
     def is_drawer_open(self):
+        # Answered without a round trip when the printer sends its status
+        # with Automatic Status Back
+        if hasattr(self._driver, 'get_cached_drawer_open'):
+            drawer_open = self._driver.get_cached_drawer_open()
+            if drawer_open is not None:
+                return drawer_open
         if hasattr(self._driver, 'is_drawer_open'):
             return self._driver.is_drawer_open()
         else:
             return False
 
+    def poll_status(self):
+        """Read the real-time status of the printer, if it supports it.
+        The spooler calls this between jobs, see
+        L{stoqdrivers.spooler.DeviceSpooler.set_status_interval}.
+        """
+        if hasattr(self._driver, 'poll_status'):
+            return self._driver.poll_status()
+        return None
+
+    def get_status(self, max_age=None):
+        """Get the last real-time status of the printer, without talking to
+        it. When the status is older than max_age seconds, it is refreshed
+        by an urgent job on the spooler of the printer, so the next calls
+        get the new one.
+
+        @param max_age: defaults to the status_max_age of the driver
+        @returns: a L{stoqdrivers.escpos.RealTimeStatus}, or None if the
+          status was never read or the printer does not support it
+        """
+        if not getattr(self._driver, 'has_realtime_status', False):
+            return None
+        if max_age is None:
+            max_age = self._driver.status_max_age
+        status = self._driver.get_last_status()
+        if status is None or status.get_age() > max_age:
+            self._refresh_status()
+        return status
+
+    def _refresh_status(self):
+        if self._status_refresh is not None and not self._status_refresh.done():
+            return
+        future = self.get_spooler().submit(self.poll_status,
+                                           priority=PRIORITY_URGENT)
+        future.add_done_callback(self._on_status_refreshed)
+        self._status_refresh = future
+
+    def _on_status_refreshed(self, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            log.warning('Could not read the status of %s: %s'
+                        % (self.device, error))
+
+    def enable_asb(self, listener=None):
+        """Receive the status changes the printer sends by itself.
+
+        @see: L{stoqdrivers.escpos.EscPosMixin.enable_asb}
+        """
+        if not getattr(self._driver, 'has_asb', False):
+            raise TypeError("%s does not support Automatic Status Back"
+                            % self._driver.model_name)
+        self._driver.enable_asb(listener)
+
+    def disable_asb(self):
+        if getattr(self._driver, 'has_asb', False):
+            self._driver.disable_asb()
+
+    def subscribe_status(self, callback):
+        self._driver.subscribe_status(callback)
+
+    def unsubscribe_status(self, callback):
+        self._driver.unsubscribe_status(callback)
+
+    def get_asb_status(self):
+        if getattr(self._driver, 'has_asb', False):
+            return self._driver.get_asb_status()
+        return None
+
+    def get_last_status(self):
+        if hasattr(self._driver, 'get_last_status'):
+            return self._driver.get_last_status()
+        return None
+
     def open(self):
         if hasattr(self._driver, 'open'):
             self._driver.open()
@@ -0,0 +1,370 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Routing of non fiscal printing jobs over groups of printers.
+
+Sites with several identical printers (kitchen, bar) put them in groups, and
+the router sends each job to the healthy printer of the group that is
+expected to finish it first, given its spooler queue depth and its recent
+latency. A printer that fails with a paper or communication error is taken
+out of the group for a while, and the job is retried on another one. Once
+the cooldown is over the printer is probed (with is_drawer_open, which every
+printer answers) before it gets jobs again. The probe runs on the printer
+spooler, so the router never blocks waiting for it.
+
+A job is a method name of L{stoqdrivers.printers.nonfiscal.NonFiscalPrinter},
+or a callable receiving the printer, which is executed atomically on the
+printer spooler::
+
+    def ticket(printer):
+        printer.print_line('1x Burger')
+        printer.cut_paper()
+
+    router = PrinterRouter()
+    router.add_printer('kitchen1', kitchen1, groups=['kitchen'])
+    router.add_printer('kitchen2', kitchen2, groups=['kitchen'])
+    router.add_printer('bar', bar, groups=['bar'])
+    router.submit('kitchen', ticket)
+    router.mirror(['kitchen', 'bar'], ticket)
+"""
+
+from concurrent.futures import Future
+from configparser import ConfigParser
+import itertools
+import logging
+import threading
+import time
+
+from stoqdrivers.exceptions import (CommError, HardwareFailure,
+                                    OutofPaperError, PrinterError,
+                                    PrinterOfflineError, USBDriverError)
+from stoqdrivers.spooler import PRIORITY_URGENT, get_spooler
+
+log = logging.getLogger('stoqdrivers.router')
+
+#: Errors that mean the printer can't print right now, so the job is sent
+#: to another printer of the group. Anything else is a problem with the job
+#: itself and is reported back.
+FAILOVER_ERRORS = (OutofPaperError, PrinterOfflineError, HardwareFailure,
+                   USBDriverError, PrinterError, CommError, OSError)
+
+
+class NoPrinterAvailable(PrinterError):
+    "No printer of the group can take the job"
+
+
+class _RoutedPrinter:
+    def __init__(self, name, printer):
+        self.name = name
+        self.printer = printer
+        self.spooler = get_spooler(printer)
+        self.groups = set()
+        self.latency = None
+        self.failed_until = None
+        self.last_error = None
+        self.jobs_done = 0
+        self.last_used = 0
+        self.probe = None
+        self.probe_started = None
+
+    def is_healthy(self, now):
+        return self.failed_until is None or now >= self.failed_until
+
+    def get_expected_wait(self, default_latency):
+        latency = self.latency
+        if latency is None:
+            latency = default_latency
+        return (self.spooler.get_queue_depth() + 1) * latency
+
+
+class PrinterRouter:
+    """Send jobs to groups of printers.
+
+    @param cooldown: for how long, in seconds, a failed printer gets no jobs
+    @param latency_weight: the weight of the last job on the latency
+      average (an exponentially weighted moving average)
+    @param probe_timeout: after how long, in seconds, a probe without a
+      reply counts as a failure
+    """
+
+    def __init__(self, cooldown=30.0, latency_weight=0.3, probe_timeout=5.0):
+        self.cooldown = cooldown
+        self.latency_weight = latency_weight
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._printers = {}
+        self._groups = {}
+        self._counter = itertools.count(1)
+
+    @classmethod
+    def from_config(cls, filename, **kwargs):
+        """Create a router for the printers described on a config file.
+
+        The file has the format of the print daemon config (see
+        L{stoqdrivers.daemon.server}), with an additional I{groups} option,
+        a comma separated list of the groups of each printer.
+        """
+        from stoqdrivers.daemon.server import load_devices
+
+        router = cls(**kwargs)
+        config = ConfigParser()
+        config.read(filename)
+        for name, printer in load_devices(filename).items():
+            groups = config.get(name, 'groups', fallback='')
+            router.add_printer(name, printer,
+                               [g.strip() for g in groups.split(',') if g.strip()])
+        return router
+
+    #
+    # Setup
+    #
+
+    def add_printer(self, name, printer, groups=()):
+        """Add a printer to the router.
+
+        @param name: a unique name for the printer
+        @param printer: a L{stoqdrivers.printers.nonfiscal.NonFiscalPrinter}
+        @param groups: the names of the groups the printer belongs to
+        """
+        with self._lock:
+            if name in self._printers:
+                raise ValueError("There is already a printer called %s" % name)
+            self._printers[name] = _RoutedPrinter(name, printer)
+        for group in groups:
+            self.add_to_group(group, name)
+
+    def add_to_group(self, group, name):
+        with self._lock:
+            routed = self._printers[name]
+            routed.groups.add(group)
+            self._groups.setdefault(group, []).append(routed)
+
+    def get_groups(self):
+        with self._lock:
+            return dict((group, [p.name for p in printers])
+                        for group, printers in self._groups.items())
+
+    def get_status(self):
+        """Get the status of each printer.
+
+        @returns: a dict mapping the printer names to dicts with the
+          I{healthy}, I{queue_depth}, I{latency}, I{jobs_done} and
+          I{last_error} keys
+        """
+        now = time.monotonic()
+        with self._lock:
+            printers = list(self._printers.values())
+        return dict((p.name, dict(healthy=p.is_healthy(now),
+                                  queue_depth=p.spooler.get_queue_depth(),
+                                  latency=p.latency,
+                                  jobs_done=p.jobs_done,
+                                  last_error=p.last_error))
+                    for p in printers)
+
+    #
+    # Jobs
+    #
+
+    def submit(self, group, job, *args, **kwargs):
+        """Send a job to the best printer of I{group}.
+
+        @param job: a NonFiscalPrinter method name, called with I{args} and
+          I{kwargs}, or a callable receiving the printer
+        @returns: a L{concurrent.futures.Future} for the job result. It
+          fails with L{NoPrinterAvailable} when every printer of the group
+          failed.
+        """
+        future = Future()
+        self._dispatch(group, job, args, kwargs, future, set())
+        return future
+
+    def mirror(self, groups, job, *args, **kwargs):
+        """Send the same job to one printer of each group.
+
+        @returns: a list of futures, one for each group
+        """
+        return [self.submit(group, job, *args, **kwargs) for group in groups]
+
+    def probe(self, name):
+        """Check if a printer is responding, without waiting for it.
+
+        The probe is an urgent job on the printer spooler. The printer gets
+        jobs again as soon as it answers.
+
+        @returns: a L{concurrent.futures.Future} for True if the printer is
+          healthy, or False
+        """
+        routed = self._printers[name]
+        with self._lock:
+            if routed.probe is not None:
+                return routed.probe
+            result = routed.probe = Future()
+            routed.probe_started = time.monotonic()
+
+        def done(job_future):
+            error = job_future.exception()
+            with self._lock:
+                routed.probe = None
+                if error is None:
+                    routed.failed_until = None
+            if error is None:
+                log.info('Printer %s is back' % routed.name)
+            else:
+                self._mark_failed(routed, error)
+            result.set_result(error is None)
+
+        job_future = routed.spooler.submit(routed.printer.is_drawer_open,
+                                           priority=PRIORITY_URGENT)
+        job_future.add_done_callback(done)
+        return result
+
+    #
+    # Private
+    #
+
+    def _select(self, group, exclude):
+        """Choose the best healthy printer of the group.
+
+        @returns: the L{_RoutedPrinter} or None, and the probes of the
+          printers that may come back
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [p for p in self._groups.get(group, [])
+                          if p.name not in exclude]
+        if not candidates and group not in self._groups:
+            raise KeyError(group)
+
+        healthy = []
+        probes = []
+        for routed in candidates:
+            if routed.failed_until is None:
+                healthy.append(routed)
+                continue
+            probe = routed.probe
+            if probe is not None:
+                if now - routed.probe_started <= self.probe_timeout:
+                    probes.append(probe)
+                elif now >= routed.failed_until:
+                    # The probe is stuck, keep the printer out for another
+                    # cooldown
+                    self._mark_failed(routed, 'Probe timeout')
+            elif now >= routed.failed_until:
+                probes.append(self.probe(routed.name))
+        if not healthy:
+            return None, probes
+        # A printer without any job done yet is assumed to be as fast as
+        # the others
+        latencies = [p.latency for p in healthy if p.latency is not None]
+        default_latency = sum(latencies) / len(latencies) if latencies else 1.0
+        with self._lock:
+            best = min(healthy, key=lambda p: (
+                p.get_expected_wait(default_latency), p.last_used))
+            best.last_used = next(self._counter)
+        return best, probes
+
+    def _dispatch(self, group, job, args, kwargs, future, tried):
+        try:
+            routed, probes = self._select(group, tried)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        if routed is None:
+            if probes:
+                self._dispatch_after_probes(probes, group, job, args, kwargs,
+                                            future, tried)
+            else:
+                future.set_exception(NoPrinterAvailable(
+                    "No printer available on group %s" % group))
+            return
+        tried.add(routed.name)
+        job_future = routed.spooler.submit(self._run_job, routed, job,
+                                           args, kwargs)
+
+        def done(job_future):
+            error = job_future.exception()
+            if error is None:
+                future.set_result(job_future.result())
+            elif isinstance(error, FAILOVER_ERRORS):
+                self._mark_failed(routed, error)
+                self._dispatch(group, job, args, kwargs, future, tried)
+            else:
+                future.set_exception(error)
+        job_future.add_done_callback(done)
+
+    def _dispatch_after_probes(self, probes, group, job, args, kwargs, future,
+                               tried):
+        # Dispatch again as soon as a printer comes back, fail when all the
+        # probes failed or took too long. Whatever happens first wins.
+        lock = threading.Lock()
+        state = dict(pending=len(probes), finished=False)
+
+        def finish(retry):
+            with lock:
+                if state['finished']:
+                    return
+                state['finished'] = True
+            timer.cancel()
+            if retry:
+                self._dispatch(group, job, args, kwargs, future, tried)
+            else:
+                future.set_exception(NoPrinterAvailable(
+                    "No printer available on group %s" % group))
+
+        def probe_done(probe):
+            with lock:
+                state['pending'] -= 1
+                last = state['pending'] == 0
+            if probe.result():
+                finish(True)
+            elif last:
+                finish(False)
+
+        timer = threading.Timer(self.probe_timeout, finish, (False, ))
+        timer.daemon = True
+        timer.start()
+        for probe in probes:
+            probe.add_done_callback(probe_done)
+
+    def _run_job(self, routed, job, args, kwargs):
+        start = time.monotonic()
+        if callable(job):
+            result = job(routed.printer, *args, **kwargs)
+        else:
+            result = getattr(routed.printer, job)(*args, **kwargs)
+        elapsed = time.monotonic() - start
+        with self._lock:
+            if routed.latency is None:
+                routed.latency = elapsed
+            else:
+                routed.latency += self.latency_weight * (elapsed - routed.latency)
+            routed.jobs_done += 1
+        return result
+
+    def _mark_failed(self, routed, error):
+        log.warning('Printer %s failed, taking it out for %ss: %s'
+                    % (routed.name, self.cooldown, error))
+        with self._lock:
+            routed.failed_until = time.monotonic() + self.cooldown
+            routed.last_error = str(error)
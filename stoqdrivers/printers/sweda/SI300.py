@@ -19,7 +19,7 @@
 from zope.interface import implementer
 
 from stoqdrivers.serialbase import SerialBase
-from stoqdrivers.escpos import EscPosMixin, ESC
+from stoqdrivers.escpos import EscPosMixin, ESC, NV_GRAPHICS_FS
 from stoqdrivers.interfaces import INonFiscalPrinter
 
 
@@ -32,6 +32,7 @@ class SI300(SerialBase, EscPosMixin):
     FLAG_DOUBLE_HEIGHT = 4  # 16
 
     max_characters = 56
+    nv_graphics = NV_GRAPHICS_FS
     supported = True
     model_name = "Sweda SI-300"
 
@@ -29,15 +29,18 @@ A simple implementation of a virtual printer.
 
 import datetime
 from decimal import Decimal
-import json
+import logging
 import os
+import tempfile
 from unittest import mock
 
 try:
     from gi.repository import Gtk, Pango
+    has_gtk = True
 except ImportError:
     Gtk = mock.Mock()
     Pango = mock.Mock()
+    has_gtk = False
 from zope.interface import implementer
 
 from stoqdrivers.enum import PaymentMethodType, TaxType, UnitType
@@ -49,19 +52,40 @@ from stoqdrivers.interfaces import ICouponPrinter, INonFiscalPrinter
 from stoqdrivers.printers.base import BaseDriverConstants
 from stoqdrivers.printers.capabilities import Capability
 from stoqdrivers.printers.fiscal import SintegraData
+from stoqdrivers.printers.virtual.output import (OUTPUT_ENV, OutputSink,
+                                                 get_sink, register_sink)
 from stoqdrivers.translation import stoqdrivers_gettext
+from stoqdrivers.utils import json_dumps, json_loads
 
 _ = stoqdrivers_gettext
 
-# Global state of the printer. Even if we create multiple instances of the printer during runtime
-# (which should not happen), all of them will share the same state.
-_printer_off = False
-_drawer_open = False
-
+log = logging.getLogger('stoqdrivers.virtual')
+
+#: The environment variable with the file where the state of the virtual
+#: printers is kept, see L{Simple.set_state_file}
+STATE_ENV = 'STOQDRIVERS_VIRTUAL_STATE'
+
+#: The persistent state of the printer, the keys of the state file mapped to
+#: the attributes of L{Simple}
+_STATE_ATTRIBUTES = [
+    ('till-closed', 'till_closed'),
+    ('opening-date', 'opening_date'),
+    ('coupon-start', 'coupon_start'),
+    ('coupon-end', 'coupon_end'),
+    ('cro', 'cro'),
+    ('crz', 'crz'),
+    ('coo', 'coo'),
+    ('gnf', 'gnf'),
+    ('ccf', 'ccf'),
+    ('period-total', 'period_total'),
+    ('total', 'total'),
+    ('taxes', 'taxes'),
+]
 
 class CouponItem:
-    def __init__(self, id, quantity, value):
+    def __init__(self, id, quantity, value, taxcode=None):
         self.id, self.quantity, self.value = id, quantity, value
+        self.taxcode = taxcode
 
     def get_total_value(self):
         return self.quantity * self.value
@@ -188,6 +212,39 @@ class OutputWindow(Gtk.Window):
         self.textview.scroll_mark_onscreen(mark)
 
 
+class WindowSink(OutputSink):
+    """Show the output on the L{OutputWindow}"""
+
+    def feed(self, text):
+        OutputWindow.get_instance().feed(text)
+
+    def set_printer(self, printer):
+        OutputWindow.get_instance().set_printer(printer)
+
+    def set_drawer_open(self, is_open):
+        if is_open:
+            label = _("Close drawer")
+        else:
+            label = _("Open drawer")
+        OutputWindow.get_instance().drawer.set_label(label)
+
+    def get_output(self):
+        buf = OutputWindow.get_instance().buffer
+        return buf.get_text(buf.get_start_iter(), buf.get_end_iter(), False)
+
+
+register_sink('window', WindowSink)
+
+
+def get_default_sink():
+    """Get the sink named by the STOQDRIVERS_VIRTUAL_OUTPUT environment
+    variable. Defaults to the window when Gtk is available, and to the
+    memory otherwise.
+    """
+    spec = os.environ.get(OUTPUT_ENV) or ('window' if has_gtk else 'memory')
+    return get_sink(spec)
+
+
 @implementer(ICouponPrinter, INonFiscalPrinter)
 class Simple(object):
 
@@ -198,28 +255,31 @@ class Simple(object):
     supported = False
     max_characters = 72
 
-    def __init__(self, port, consts=None):
+    def __init__(self, port, consts=None, state_file=None):
+        """
+        @param port: the L{OutputSink} to print to. Anything else (a serial
+          port, for instance) is ignored and the default sink is used.
+        @param state_file: where the printer state is kept, see
+          L{set_state_file}
+        """
         self._consts = consts or FakeConstants()
         self._customer_document = None
+        if isinstance(port, OutputSink):
+            self._sink = port
+        else:
+            self._sink = get_default_sink()
+        self._sink.set_printer(self)
 
         # Internal state
-        self.till_closed = False
-        self.opening_date = datetime.date.today()
+        self._off = False
+        self._drawer_open = False
         self.serial = 'Serial'
         self.serial_id = '1234567890'
-        self.coupon_start = 0
-        self.coupon_end = 10
-        self.cro = 1
-        self.crz = 1
-        self.coo = 1
-        self.gnf = 1
-        self.ccf = 1
-        self.period_total = 0
-        self.total = 0
-        self.taxes = []
 
         self._reset_flags()
-        self._load_state()
+        self._reset_state()
+        self._state_dirty = False
+        self.set_state_file(state_file)
 
     #
     # Helper methods
@@ -237,48 +297,100 @@ class Simple(object):
             self.coo))
         self._feed_line()
 
-    def _get_state_filename(self):
+    def _get_default_state_filename(self):
         dirname = os.path.join(os.environ['HOME'], '.stoq')
         if not os.path.exists(dirname):
             os.makedirs(dirname)
         filename = os.path.join(dirname, 'virtual-printer.json')
         return filename
 
+    def set_state_file(self, filename):
+        """Change the file where the printer state is kept, and load the
+        state from it. The printer starts from scratch when the file does
+        not exist yet.
+
+        Each virtual printer running at the same time should have its own
+        file.
+
+        @param filename: the file name. If None, the file named by the
+          STOQDRIVERS_VIRTUAL_STATE environment variable, or
+          ~/.stoq/virtual-printer.json, is used, and if False the state is
+          not persisted at all.
+        """
+        if filename is None:
+            filename = (os.environ.get(STATE_ENV) or
+                        self._get_default_state_filename())
+        self._state_filename = filename or None
+        self._load_state()
+
+    def _reset_state(self):
+        self.till_closed = False
+        self.opening_date = datetime.date.today()
+        self.coupon_start = 0
+        self.coupon_end = 10
+        self.cro = 1
+        self.crz = 1
+        self.coo = 1
+        self.gnf = 1
+        self.ccf = 1
+        self.period_total = Decimal(0)
+        self.total = Decimal(0)
+        self.taxes = []
+
     def _load_state(self):
-        filename = self._get_state_filename()
-        try:
-            fp = open(filename, 'r')
-        except (OSError, IOError):
+        self._reset_state()
+        if self._state_filename is None:
             return
         try:
-            state = json.load(fp)
-        except ValueError:
+            with open(self._state_filename, 'r') as fp:
+                state = json_loads(fp.read())
+        except (OSError, IOError, ValueError):
             return
 
-        self.till_closed = state['till-closed']
-
-        fp.close()
+        # Older versions only saved till-closed
+        for key, attr in _STATE_ATTRIBUTES:
+            if key in state:
+                setattr(self, attr, state[key])
 
     def _save_state(self):
-        filename = self._get_state_filename()
-        try:
-            fp = open(filename, 'w')
-        except (OSError, IOError):
+        self._state_dirty = False
+        if self._state_filename is None:
             return
 
-        state = {}
-        state['till-closed'] = self.till_closed
+        state = dict((key, getattr(self, attr))
+                     for key, attr in _STATE_ATTRIBUTES)
+        data = json_dumps(state) + '\n'
+        directory = os.path.dirname(os.path.abspath(self._state_filename))
+        try:
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.virtual-printer-')
+        except OSError as e:
+            log.warning('Could not save the virtual printer state: %s' % e)
+            return
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(data)
+            os.replace(tmp, self._state_filename)
+        except OSError as e:
+            log.warning('Could not save the virtual printer state: %s' % e)
+            os.unlink(tmp)
+
+    def _state_changed(self):
+        # All the changes made while a coupon is open are saved at once, when
+        # it is closed or cancelled.
+        self._state_dirty = True
+        if not self.is_coupon_opened:
+            self._save_state()
 
-        json.dump(state, fp)
-        fp.write('\n')
-        fp.close()
+    def flush_state(self):
+        """Save the pending changes to the state now."""
+        if self._state_dirty:
+            self._save_state()
 
     def set_off(self, off):
-        global _printer_off
-        _printer_off = off
+        self._off = off
 
     def _check(self):
-        if _printer_off:
+        if self._off:
             raise PrinterOfflineError
 
     def _reset_flags(self):
@@ -289,6 +401,7 @@ class Simple(object):
         self.has_payments = False
         self.payments_total = Decimal("0.0")
         self._items = {}
+        self._discount_value = Decimal(0)
         self._is_centralized = False
 
     def _check_coupon_is_opened(self):
@@ -302,27 +415,86 @@ class Simple(object):
     def _feed_line(self):
         self.write(('-' * self.max_characters) + '\n')
 
+    def _get_tax_totalizer(self, taxcode):
+        # The name and type of the totalizer of a tax, as in SintegraData
+        for tax_type, code, value in self._consts._tax_constants:
+            if code == taxcode:
+                break
+        else:
+            return taxcode, 'ICMS'
+        if tax_type == TaxType.SUBSTITUTION:
+            return 'F', 'ICMS'
+        elif tax_type == TaxType.EXEMPTION:
+            return 'I', 'ICMS'
+        elif tax_type == TaxType.NONE:
+            return 'N', 'ICMS'
+        name = '%04d' % (value * 100)
+        if tax_type == TaxType.SERVICE:
+            return name, 'ISS'
+        return name, 'ICMS'
+
+    def _add_to_tax(self, name, tax_type, value):
+        # The taxes are lists, not tuples, after being loaded from the state
+        for tax in self.taxes:
+            if tax[0] == name:
+                tax[1] += value
+                return
+        self.taxes.append([name, value, tax_type])
+
     def open_drawer(self):
-        global _drawer_open
-        _drawer_open = True
-        OutputWindow.get_instance().drawer.set_label(_("Close drawer"))
+        self._drawer_open = True
+        self._sink.set_drawer_open(True)
 
     def close_drawer(self):
-        global _drawer_open
-        _drawer_open = False
-        OutputWindow.get_instance().drawer.set_label(_("Open drawer"))
+        self._drawer_open = False
+        self._sink.set_drawer_open(False)
 
     def is_drawer_open(self):
-        return _drawer_open
+        return self._drawer_open
 
     #
     #   SerialBase implementation
     #
 
     def write(self, data):
-        output = OutputWindow.get_instance()
-        output.set_printer(self)
-        output.feed(data)
+        if isinstance(data, bytes):
+            data = data.decode(self.coupon_printer_charset)
+        self._sink.feed(data)
+
+    #
+    # Inspection
+    #
+
+    def get_sink(self):
+        return self._sink
+
+    def get_output(self):
+        """Get the output kept by the sink (see L{OutputSink.get_output})"""
+        return self._sink.get_output()
+
+    def get_state(self):
+        """Get a snapshot of the printer state.
+
+        @returns: a dict with the coupon, till and drawer state. The
+          I{items} are (item_id, quantity, value) tuples.
+        """
+        return {
+            'off': self._off,
+            'drawer_open': self._drawer_open,
+            'till_closed': self.till_closed,
+            'coo': self.coo,
+            'ccf': self.ccf,
+            'crz': self.crz,
+            'gnf': self.gnf,
+            'coupon_opened': self.is_coupon_opened,
+            'coupon_totalized': self.is_coupon_totalized,
+            'customer_document': self._customer_document,
+            'items_quantity': self.items_quantity,
+            'items': [(item.id, item.quantity, item.value)
+                      for item in self._items.values()],
+            'totalized_value': self.totalized_value,
+            'payments_total': self.payments_total,
+        }
 
     #
     # ICouponPrinter implementation
@@ -363,7 +535,7 @@ class Simple(object):
                                       "you can't add items anymore."))
         self.items_quantity += 1
         item_id = self.items_quantity
-        item = CouponItem(item_id, quantity, price)
+        item = CouponItem(item_id, quantity, price, taxcode)
         self._items[item_id] = item
         self.write("%03d %s %s\n" % (self.items_quantity, code, description))
         self.write("  %d %f %s\n" % (quantity, price, taxcode))
@@ -386,7 +558,13 @@ class Simple(object):
         self._feed_line()
         self.write('    Cupom Cancelado\n')
         self._feed_line()
+        cancelled = sum(item.get_total_value()
+                        for item in self._items.values())
+        if cancelled:
+            self._add_to_tax('CANC', 'ICMS', cancelled)
         self._reset_flags()
+        self.coo += 1
+        self._state_changed()
 
     def coupon_totalize(self, discount=Decimal("0.0"),
                         surcharge=Decimal("0.0"), taxcode=TaxType.NONE):
@@ -404,8 +582,9 @@ class Simple(object):
 
         surcharge_value = self.totalized_value * surcharge / 100
         discount_value = self.totalized_value * discount / 100
+        self._discount_value = Decimal(discount_value).quantize(Decimal('.01'))
         self.totalized_value += (
-            Decimal(-discount_value).quantize(Decimal('.01')) +
+            -self._discount_value +
             Decimal(surcharge_value).quantize(Decimal('.01')))
 
         if not self.totalized_value > 0:
@@ -448,7 +627,18 @@ class Simple(object):
         if message:
             self.write(message)
         self.write('\n')
+        self.period_total += self.totalized_value
+        self.total += self.totalized_value
+        for item in self._items.values():
+            self._add_to_tax(*self._get_tax_totalizer(item.taxcode),
+                             value=item.get_total_value())
+        if self._discount_value:
+            self._add_to_tax('DESC', 'ICMS', value=self._discount_value)
+        self.coupon_end = self.coo
+        self.coo += 1
+        self.ccf += 1
         self._reset_flags()
+        self._state_changed()
         return 0
 
     def get_capabilities(self):
@@ -478,7 +668,9 @@ class Simple(object):
         self.write('LEITURA X\n')
         self._feed_line()
         self.till_closed = False
-        self._save_state()
+        self.coo += 1
+        self.gnf += 1
+        self._state_changed()
 
     def open_till(self):
         self.summarize()
@@ -489,7 +681,12 @@ class Simple(object):
             raise DriverError(
                 "Reduce Z was already sent today, try again tomorrow")
         self.till_closed = True
-        self._save_state()
+        self.coo += 1
+        self.crz += 1
+        self.coupon_start = self.coo
+        self.period_total = Decimal(0)
+        self.taxes = []
+        self._state_changed()
         self.write("REDUÇÃO Z\n")
         self._feed_line()
 
@@ -566,7 +763,7 @@ class Simple(object):
                             coo=self.coo,
                             period_total=self.period_total,
                             total=self.total,
-                            taxes=self.taxes)
+                            taxes=[tuple(tax) for tax in self.taxes])
 
     def get_crz(self):
         return self.crz
@@ -0,0 +1,158 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Output sinks of the virtual printer.
+
+The virtual printer writes what a real printer would print to a sink. The
+sink is the port given to the driver, so a headless process can use::
+
+    sink = MemorySink()
+    printer = FiscalPrinter(brand='virtual', model='Simple', port=sink)
+    ...
+    sink.get_output()
+
+When the port is not a sink, the one named by the STOQDRIVERS_VIRTUAL_OUTPUT
+environment variable is used (see L{get_sink}).
+"""
+
+import collections
+import threading
+
+OUTPUT_ENV = 'STOQDRIVERS_VIRTUAL_OUTPUT'
+
+
+class OutputSink(object):
+    """The base class of the virtual printer sinks, which discards the
+    output.
+    """
+
+    def feed(self, text):
+        """Receive the text printed by the virtual printer.
+
+        @param text: the printed text
+        @type text: str
+        """
+
+    def set_printer(self, printer):
+        pass
+
+    def set_drawer_open(self, is_open):
+        pass
+
+    def get_output(self):
+        """Get the output kept by this sink, if any.
+
+        @returns: the printed text
+        """
+        return ''
+
+    def clear(self):
+        pass
+
+    def close(self):
+        pass
+
+
+NullSink = OutputSink
+
+
+class MemorySink(OutputSink):
+    """Keep the last chunks of output in memory.
+
+    @param max_chunks: how many of the last writes are kept
+    """
+
+    def __init__(self, max_chunks=4096):
+        self._chunks = collections.deque(maxlen=max_chunks)
+        self._lock = threading.Lock()
+
+    def feed(self, text):
+        with self._lock:
+            self._chunks.append(text)
+
+    def get_output(self):
+        with self._lock:
+            return ''.join(self._chunks)
+
+    def get_lines(self):
+        return self.get_output().splitlines()
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+
+
+class FileSink(OutputSink):
+    """Append the output to a file.
+
+    @param filename: the file name, or a text file object
+    @param flush: if the file should be flushed after each write
+    """
+
+    def __init__(self, filename, flush=False):
+        if hasattr(filename, 'write'):
+            self._fp = filename
+            self._owns_fp = False
+        else:
+            self._fp = open(filename, 'a', encoding='utf-8')
+            self._owns_fp = True
+        self.filename = getattr(self._fp, 'name', None)
+        self._flush = flush
+
+    def feed(self, text):
+        self._fp.write(text)
+        if self._flush:
+            self._fp.flush()
+
+    def close(self):
+        self._fp.flush()
+        if self._owns_fp:
+            self._fp.close()
+
+
+_sink_factories = {
+    'null': OutputSink,
+    'memory': MemorySink,
+}
+
+
+def register_sink(name, factory):
+    """Make a sink available to L{get_sink} by name.
+
+    @param factory: a callable without arguments returning an L{OutputSink}
+    """
+    _sink_factories[name] = factory
+
+
+def get_sink(spec):
+    """Create a sink from a textual specification: C{null}, C{memory},
+    C{window} or C{file:<filename>}.
+    """
+    if spec.startswith('file:'):
+        return FileSink(spec[len('file:'):], flush=True)
+    try:
+        factory = _sink_factories[spec]
+    except KeyError:
+        raise ValueError("Unknown virtual printer output %r" % (spec, ))
+    return factory()
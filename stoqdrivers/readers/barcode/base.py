@@ -29,7 +29,9 @@ from importlib import import_module
 from zope.interface import implementer
 
 from stoqdrivers.interfaces import IBarcodeReader
+from stoqdrivers.listener import LineFramer
 from stoqdrivers.serialbase import SerialBase
+from stoqdrivers.utils import bytes2str, str2bytes
 
 
 @implementer(IBarcodeReader)
@@ -43,6 +45,16 @@ class BaseBarcodeReader(SerialBase):
     def get_code(self):
         return self.readline()
 
+    #
+    # Push mode, see stoqdrivers.readers.hub
+    #
+
+    def create_framer(self):
+        return LineFramer(str2bytes(self.EOL_DELIMIT), max_size=1024)
+
+    def parse_frame(self, frame):
+        return bytes2str(frame)
+
 
 def get_supported_barcode_readers():
     result = {}
@@ -0,0 +1,153 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+A single event stream for all the barcode readers (and push-mode scales) of
+a store.
+
+Instead of one thread blocked on L{BarcodeReader.get_code} for each scanner,
+a L{ReaderHub} watches all the devices with one
+L{stoqdrivers.listener.DeviceListener} and delivers a L{ReaderEvent} for
+each scan, either to a callback or to a queue::
+
+    events = queue.Queue()
+    hub = ReaderHub(queue=events)
+    hub.add(BarcodeReader(brand='metrologic', model='MC630',
+                          device='/dev/ttyS1'))
+    hub.start()
+    device, code, timestamp = events.get()
+"""
+
+from collections import namedtuple
+import logging
+import threading
+import time
+
+from stoqdrivers.listener import DeviceListener
+
+log = logging.getLogger('stoqdrivers.readers.hub')
+
+#: A scan. I{code} is the code read by a barcode reader or the
+#: L{stoqdrivers.interfaces.IScaleInfo} sent by a scale, and I{timestamp}
+#: is the time.time() when it was received.
+ReaderEvent = namedtuple('ReaderEvent', 'device code timestamp')
+
+
+class ReaderHub:
+    """Deliver the scans of many devices from a single thread.
+
+    @param callback: called with each L{ReaderEvent}
+    @param queue: an object with a put_nowait() method (a queue.Queue, or an
+      asyncio.Queue when the hub is attached to that loop) where the events
+      are put
+    @param duplicate_window: the same code read by the same device again
+      within this many seconds is ignored. 0 disables the suppression.
+    @param listener: the listener to use. By default the hub creates its
+      own.
+    """
+
+    def __init__(self, callback=None, queue=None, duplicate_window=0.5,
+                 listener=None):
+        if callback is None and queue is None:
+            raise ValueError("A callback or a queue is needed")
+        self.callback = callback
+        self.queue = queue
+        self.duplicate_window = duplicate_window
+        self._listener = listener or DeviceListener()
+        self._owns_listener = listener is None
+        self._lock = threading.Lock()
+        # device -> (last frame, monotonic time it was received)
+        self._last_scans = {}
+        self._devices = []
+
+    def add(self, device):
+        """Start watching a device.
+
+        @param device: a L{stoqdrivers.readers.barcode.reader.BarcodeReader},
+          a L{stoqdrivers.scales.scales.Scale} or a driver that supports
+          push mode (create_framer() and parse_frame())
+        """
+        driver = getattr(device, '_driver', device)
+        if not hasattr(driver, 'create_framer'):
+            raise TypeError("%r does not send data by itself" % (device, ))
+
+        def parse(frame):
+            return frame, driver.parse_frame(frame)
+
+        def dispatch(parsed):
+            self._dispatch(device, *parsed)
+
+        def error(e):
+            log.warning('Error reading from %r: %s' % (device, e))
+
+        self._listener.add(driver.get_port(), driver.create_framer(), parse,
+                           dispatch, error)
+        self._devices.append(device)
+
+    def remove(self, device):
+        driver = getattr(device, '_driver', device)
+        self._listener.remove(driver.get_port())
+        self._devices.remove(device)
+        with self._lock:
+            self._last_scans.pop(device, None)
+
+    def get_devices(self):
+        return list(self._devices)
+
+    def start(self):
+        """Watch the devices on a thread."""
+        self._listener.start()
+
+    def attach(self, loop):
+        """Watch the devices on an asyncio loop."""
+        self._listener.attach(loop)
+
+    def close(self):
+        for device in list(self._devices):
+            self.remove(device)
+        if self._owns_listener:
+            self._listener.close()
+
+    #
+    # Private
+    #
+
+    def _is_duplicate(self, device, frame):
+        if not self.duplicate_window:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_scans.get(device)
+            self._last_scans[device] = frame, now
+        return (last is not None and last[0] == frame and
+                now - last[1] < self.duplicate_window)
+
+    def _dispatch(self, device, frame, code):
+        if self._is_duplicate(device, frame):
+            log.debug('Ignoring a duplicated scan from %r: %r' % (device, code))
+            return
+        event = ReaderEvent(device, code, time.time())
+        if self.queue is not None:
+            self.queue.put_nowait(event)
+        if self.callback is not None:
+            self.callback(event)
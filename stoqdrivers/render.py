@@ -0,0 +1,903 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Render the output of a receipt printer to an image.
+
+L{ReceiptRenderer} interprets the byte stream a driver sends to an ESC/POS
+printer (or to the ESC/BEMA and Daruma command sets used by
+L{stoqdrivers.printers.bematech.MP2100TH} and
+L{stoqdrivers.printers.daruma.DR700}) and draws the receipt with PIL::
+
+    renderer = ReceiptRenderer(DIALECT_ESCPOS)
+    renderer.feed(data)
+    renderer.get_image().save('receipt.png')
+    renderer.get_stats()
+
+Besides the image, it measures the paper length, the number of head passes
+(print bands) and how many bytes were spent on each kind of command, for
+each section of paper between cuts.
+
+Text is drawn on fixed character cells, so the columns of a receipt line up
+like on paper. Barcodes are drawn with their real size, but the bars are a
+pattern of the data bits, not a scannable symbol. QR codes are drawn with
+the qrcode module when it is installed.
+"""
+
+from collections import namedtuple
+import codecs
+import hashlib
+import logging
+
+from PIL import Image, ImageDraw, ImageFont
+
+from stoqdrivers.utils import str2bytes
+
+log = logging.getLogger('stoqdrivers.render')
+
+DIALECT_ESCPOS = 'escpos'
+DIALECT_BEMA = 'bema'
+DIALECT_DARUMA = 'daruma'
+
+(KIND_TEXT,
+ KIND_STYLE,
+ KIND_GRAPHICS,
+ KIND_BARCODE,
+ KIND_QRCODE,
+ KIND_PAPER,
+ KIND_OTHER) = ('text', 'style', 'graphics', 'barcode', 'qrcode', 'paper',
+                'other')
+
+#: The height of a print band of the head, in dots
+BAND_HEIGHT = 24
+
+NUL = 0x00
+ENQ = 0x05
+HT = 0x09
+LF = 0x0a
+CR = 0x0d
+SI = 0x0f
+DLE = 0x10
+DC2 = 0x12
+ESC = 0x1b
+FS = 0x1c
+GS = 0x1d
+
+#: The (width, height) of the character cells of the fonts A (regular) and
+#: B (condensed)
+FONT_CELLS = [(12, 24), (9, 17)]
+
+DEFAULT_LINE_SPACING = 30
+
+#: ESC t n code pages, see L{stoqdrivers.escpos.EscPosMixin.CHARSET_CMD}
+CODE_PAGES = {
+    0: 'cp437', 1: 'cp932', 2: 'cp850', 3: 'cp860', 4: 'cp863',
+    5: 'cp865', 6: 'latin1', 7: 'cp737', 8: 'cp862', 17: 'cp1252',
+    18: 'cp866', 19: 'cp852', 20: 'cp858',
+}
+
+#: ESC/BEMA GS 0xf9 0x37 n code pages
+BEMA_CODE_PAGES = {0x32: 'cp850', 0x38: 'utf-8'}
+
+#: GS k m symbologies
+BARCODE_TYPES = {
+    0: 'UPC-A', 1: 'UPC-E', 2: 'EAN13', 3: 'EAN8', 4: 'CODE39', 5: 'ITF',
+    6: 'CODABAR', 65: 'UPC-A', 66: 'UPC-E', 67: 'EAN13', 68: 'EAN8',
+    69: 'CODE39', 70: 'ITF', 71: 'CODABAR', 72: 'CODE93', 73: 'CODE128',
+}
+
+#: A piece of paper between two cuts.
+#:   - nbytes: how many bytes were sent for it
+#:   - length: its length in dots
+#:   - passes: how many head passes it took
+#:   - bytes_by_kind: a dict with the bytes spent on each kind of command
+Section = namedtuple('Section', 'nbytes length passes bytes_by_kind')
+
+Barcode = namedtuple('Barcode', 'symbology data')
+
+# Returned by the command handlers when the command is not complete yet
+_INCOMPLETE = -1
+
+
+def _load_font(size):
+    try:
+        return ImageFont.load_default(size)
+    except (TypeError, OSError, ImportError):
+        # Pillow < 10.1 or no FreeType
+        return ImageFont.load_default()
+
+
+def _matrix_to_image(matrix, module_size):
+    size = len(matrix)
+    image = Image.new('1', (size, size), 255)
+    image.putdata([0 if value else 255 for row in matrix for value in row])
+    return image.resize((size * module_size, size * module_size),
+                        Image.NEAREST)
+
+
+def _get_qr_matrix(data, ecc_level):
+    try:
+        import qrcode
+    except ImportError:
+        return _get_fake_qr_matrix(data)
+    qr = qrcode.QRCode(border=0, error_correction=[
+        qrcode.constants.ERROR_CORRECT_L, qrcode.constants.ERROR_CORRECT_M,
+        qrcode.constants.ERROR_CORRECT_Q,
+        qrcode.constants.ERROR_CORRECT_H][ecc_level & 3])
+    qr.add_data(data)
+    return qr.get_matrix()
+
+
+def _get_fake_qr_matrix(data):
+    # The same size of a real symbol (roughly), with the finder patterns and
+    # a pattern of the data hash instead of the encoded data.
+    version = min(40, 1 + len(data) // 14)
+    size = 17 + 4 * version
+    digest = hashlib.sha256(data).digest()
+    matrix = [[bool(digest[(x * size + y) % len(digest)] >> (x + y) % 8 & 1)
+               for x in range(size)] for y in range(size)]
+    for top, left in [(0, 0), (0, size - 7), (size - 7, 0)]:
+        for y in range(7):
+            for x in range(7):
+                ring = max(abs(y - 3), abs(x - 3))
+                matrix[top + y][left + x] = ring != 2
+    return matrix
+
+
+class _State(object):
+    def __init__(self, charset):
+        self.charset = charset
+        self.font = 0
+        self.bold = False
+        self.double_strike = False
+        self.underline = False
+        self.reverse = False
+        self.width_mult = 1
+        self.height_mult = 1
+        self.align = 0
+        self.line_spacing = DEFAULT_LINE_SPACING
+        self.right_spacing = 0
+        self.barcode_height = 162
+        self.barcode_width = 3
+        self.barcode_hri = 0
+        self.qr_module_size = 3
+        self.qr_ecc = 0
+        self.qr_data = b''
+
+
+class ReceiptRenderer(object):
+    """Interpret the commands sent to a receipt printer and draw them.
+
+    @param dialect: DIALECT_ESCPOS, DIALECT_BEMA or DIALECT_DARUMA
+    @param width: the printable width, in dots
+    @param charset: the initial charset of the printer
+    @param dots_per_mm: the resolution of the printer
+    """
+
+    def __init__(self, dialect=DIALECT_ESCPOS, width=576, charset='cp850',
+                 dots_per_mm=8):
+        if dialect not in _DIALECTS:
+            raise ValueError("Unknown dialect %r" % (dialect, ))
+        self.dialect = dialect
+        self.width = width
+        self.dots_per_mm = dots_per_mm
+        self._initial_charset = charset
+        self._esc_commands, self._gs_commands = _DIALECTS[dialect]
+        self._state = _State(charset)
+        self._pending = b''
+        self._glyphs = {}
+        self._fonts = {}
+
+        # The line being composed: a list of (x, image)
+        self._line = []
+        self._line_align = 0
+        self._x = 0
+        # Everything already printed: a list of (x, y, image)
+        self._blocks = []
+        self._cuts = []
+        self._y = 0
+
+        self.barcodes = []
+        self.qrcodes = []
+        self.unknown = []
+        self._sections = []
+        self._new_section()
+
+    #
+    # Public API
+    #
+
+    def feed(self, data):
+        """Interpret more data sent to the printer. The data can end in the
+        middle of a command, which is completed by the next call.
+
+        @param data: the data, as bytes or as a str of bytes
+        """
+        if isinstance(data, str):
+            data = str2bytes(data)
+        buf = self._pending + data
+        i = 0
+        end = len(buf)
+        while i < end:
+            # A cut starts a new section, but the bytes of the cut command
+            # belong to the section it ends
+            section = self._sections[-1]
+            byte = buf[i]
+            if byte >= 0x20:
+                j = i + 1
+                while j < end and buf[j] >= 0x20:
+                    j += 1
+                self._put_text(buf[i:j])
+                kind = KIND_TEXT
+            else:
+                j, kind = self._run_control(buf, i)
+                if j == _INCOMPLETE:
+                    break
+            section[0] += j - i
+            section[3][kind] = section[3].get(kind, 0) + j - i
+            i = j
+        self._pending = buf[i:]
+
+    def close(self):
+        """Print what is left on the line buffer, like the printer does
+        before a cut.
+        """
+        if self._line:
+            self._print_line()
+
+    def get_paper_length(self):
+        """The length of paper used so far, in dots."""
+        return self._y
+
+    def get_paper_length_mm(self):
+        return self._y / float(self.dots_per_mm)
+
+    def get_head_passes(self):
+        """How many bands the head printed: one for each line of text or of
+        column images, and one for each L{BAND_HEIGHT} dots of raster
+        images, barcodes and QR codes.
+        """
+        return sum(section[2] for section in self._sections)
+
+    def get_sections(self):
+        """Get the sections of paper between cuts.
+
+        @returns: a list of L{Section}
+        """
+        sections = []
+        for nbytes, start, passes, by_kind, end in self._sections:
+            if end is None:
+                if not nbytes:
+                    continue
+                end = self._y
+            sections.append(Section(nbytes, end - start, passes,
+                                    dict(by_kind)))
+        return sections
+
+    def get_stats(self):
+        """Get a summary of the receipt.
+
+        @returns: a dict with the total I{bytes}, the I{bytes_by_kind}, the
+          I{paper_length} (in dots), I{paper_length_mm}, I{head_passes},
+          I{cuts} and the list of I{sections}
+        """
+        sections = self.get_sections()
+        by_kind = {}
+        for section in sections:
+            for kind, nbytes in section.bytes_by_kind.items():
+                by_kind[kind] = by_kind.get(kind, 0) + nbytes
+        return {
+            'bytes': sum(section.nbytes for section in sections),
+            'bytes_by_kind': by_kind,
+            'paper_length': self.get_paper_length(),
+            'paper_length_mm': self.get_paper_length_mm(),
+            'head_passes': self.get_head_passes(),
+            'cuts': len(self._cuts),
+            'sections': sections,
+        }
+
+    def get_image(self):
+        """Draw the receipt.
+
+        @returns: a PIL image in mode '1', L{width} wide and as long as the
+          paper used.
+        """
+        image = Image.new('1', (self.width, max(self._y, 1)), 255)
+        for x, y, block in self._blocks:
+            image.paste(block, (x, y))
+        draw = ImageDraw.Draw(image)
+        for y in self._cuts:
+            for x in range(0, self.width, 8):
+                draw.line([(x, y), (x + 3, y)], fill=0)
+        return image
+
+    #
+    # Accounting
+    #
+
+    def _new_section(self):
+        # nbytes, start, passes, bytes_by_kind, end
+        self._sections.append([0, self._y, 0, {}, None])
+
+    def _add_passes(self, passes):
+        self._sections[-1][2] += passes
+
+    #
+    # Layout
+    #
+
+    def _get_font(self, size):
+        font = self._fonts.get(size)
+        if font is None:
+            font = self._fonts[size] = _load_font(size)
+        return font
+
+    def _get_glyph(self, char):
+        state = self._state
+        key = (char, state.font, state.bold or state.double_strike,
+               state.underline, state.reverse, state.width_mult,
+               state.height_mult)
+        glyph = self._glyphs.get(key)
+        if glyph is not None:
+            return glyph
+
+        width, height = FONT_CELLS[state.font]
+        glyph = Image.new('1', (width, height), 255)
+        draw = ImageDraw.Draw(glyph)
+        font = self._get_font(height - 6)
+        for offset in ([0, 1] if key[2] else [0]):
+            try:
+                draw.text((width / 2.0 + offset, height / 2.0), char,
+                          font=font, fill=0, anchor='mm')
+            except (TypeError, ValueError):
+                draw.text((offset, 0), char, font=font, fill=0)
+        if state.underline:
+            draw.line([(0, height - 2), (width, height - 2)], fill=0)
+        if state.reverse:
+            glyph = glyph.convert('L').point(lambda v: 255 - v).convert('1')
+        if state.width_mult != 1 or state.height_mult != 1:
+            glyph = glyph.resize((width * state.width_mult,
+                                  height * state.height_mult), Image.NEAREST)
+        self._glyphs[key] = glyph
+        return glyph
+
+    def _put_image(self, image):
+        if not self._line:
+            self._line_align = self._state.align
+        if self._x + image.width > self.width:
+            self._print_line()
+        self._line.append((self._x, image))
+        self._x += image.width
+
+    def _put_text(self, data):
+        text = codecs.decode(data, self._state.charset, 'replace')
+        for char in text:
+            glyph = self._get_glyph(char)
+            self._put_image(glyph)
+            self._x += self._state.right_spacing
+
+    def _tab(self):
+        cell = FONT_CELLS[self._state.font][0] * self._state.width_mult
+        self._x = min(self.width, (self._x // (cell * 8) + 1) * cell * 8)
+
+    def _get_align_offset(self, align, used):
+        free = max(0, self.width - used)
+        if align == 1:
+            return free // 2
+        elif align == 2:
+            return free
+        return 0
+
+    def _print_line(self, advance=None):
+        """Print the line buffer and feed the paper.
+
+        @param advance: how much to feed, the line spacing by default
+        """
+        if advance is None:
+            advance = self._state.line_spacing
+        if self._line:
+            height = max(image.height for x, image in self._line)
+            used = max(x + image.width for x, image in self._line)
+            offset = self._get_align_offset(self._line_align, used)
+            for x, image in self._line:
+                self._blocks.append((x + offset, self._y + height - image.height,
+                                     image))
+            self._add_passes(1)
+            advance = max(advance, height)
+        self._y += advance
+        self._line = []
+        self._x = 0
+
+    def _print_block(self, image, passes=None):
+        # Barcodes, QR codes and raster images are printed at once, at the
+        # start of a line
+        if self._line:
+            self._print_line()
+        offset = self._get_align_offset(self._state.align, image.width)
+        self._blocks.append((offset, self._y, image))
+        self._y += image.height
+        if passes is None:
+            passes = -(-image.height // BAND_HEIGHT)
+        self._add_passes(passes)
+
+    def _cut(self):
+        if self._line:
+            self._print_line()
+        self._cuts.append(self._y)
+        self._sections[-1][4] = self._y
+        self._new_section()
+
+    #
+    # Commands
+    #
+
+    def _run_control(self, buf, i):
+        byte = buf[i]
+        if byte == ESC:
+            table = self._esc_commands
+        elif byte == GS:
+            table = self._gs_commands
+        elif byte == DLE:
+            return self._run_dle(buf, i)
+        elif byte == FS:
+            return self._run_fs(buf, i)
+        else:
+            return i + 1, self._run_single(byte)
+
+        if i + 1 >= len(buf):
+            return _INCOMPLETE, None
+        command = buf[i + 1]
+        try:
+            handler, kind = table[command]
+        except KeyError:
+            # Guess that it has a single parameter
+            self.unknown.append(bytes(buf[i:i + 2]))
+            log.debug('Unknown command %r' % (bytes(buf[i:i + 2]), ))
+            return min(i + 3, len(buf)), KIND_OTHER
+        return handler(self, buf, i + 2), kind
+
+    def _run_single(self, byte):
+        if byte == LF:
+            self._print_line()
+            return KIND_PAPER
+        elif byte == HT:
+            self._tab()
+            return KIND_TEXT
+        elif self.dialect != DIALECT_ESCPOS and byte == SI:
+            self._state.font = 1
+            return KIND_STYLE
+        elif self.dialect != DIALECT_ESCPOS and byte == DC2:
+            self._state.font = 0
+            return KIND_STYLE
+        # NUL, CR, ENQ...
+        return KIND_OTHER
+
+    def _run_dle(self, buf, i):
+        # DLE EOT n, DLE ENQ n and DLE DC4 fn m t
+        if i + 2 >= len(buf):
+            return _INCOMPLETE, None
+        if buf[i + 1] == 0x14:
+            end = i + 5
+        else:
+            end = i + 3
+        if end > len(buf):
+            return _INCOMPLETE, None
+        return end, KIND_OTHER
+
+    def _run_fs(self, buf, i):
+        # FS p n m prints a NV bit image, the others are for kanji
+        if i + 1 >= len(buf):
+            return _INCOMPLETE, None
+        if buf[i + 1] == ord('p'):
+            end = i + 4
+            if end > len(buf):
+                return _INCOMPLETE, None
+            return end, KIND_GRAPHICS
+        return i + 2, KIND_OTHER
+
+
+#
+# Command handlers, called with the buffer and the index right after the
+# command bytes. They return the index after the command, or _INCOMPLETE.
+#
+
+def _params(count):
+    def handler(renderer, buf, i):
+        if i + count > len(buf):
+            return _INCOMPLETE
+        return i + count
+    return handler
+
+
+def _param_handler(func):
+    """A command with a single parameter, that is passed to func"""
+    def handler(renderer, buf, i):
+        if i >= len(buf):
+            return _INCOMPLETE
+        func(renderer, renderer._state, buf[i])
+        return i + 1
+    return handler
+
+
+def _state_handler(func):
+    """A command without parameters"""
+    def handler(renderer, buf, i):
+        func(renderer, renderer._state)
+        return i
+    return handler
+
+
+def _init(renderer, state):
+    renderer._state = _State(renderer._initial_charset)
+    renderer._state.qr_data = state.qr_data
+
+
+def _set_print_mode(renderer, state, n):
+    state.font = n & 1
+    state.bold = bool(n & 8)
+    state.height_mult = 2 if n & 16 else 1
+    state.width_mult = 2 if n & 32 else 1
+    state.underline = bool(n & 128)
+
+
+def _set_char_size(renderer, state, n):
+    state.width_mult = (n >> 4 & 7) + 1
+    state.height_mult = (n & 7) + 1
+
+
+def _set_double_height(renderer, state, n):
+    state.height_mult = 2 if n & 1 else 1
+
+
+def _set_code_page(renderer, state, n):
+    state.charset = CODE_PAGES.get(n, state.charset)
+
+
+def _set_attribute(attr, value=None):
+    def func(renderer, state, n=None):
+        setattr(state, attr, bool(n & 1) if value is None else value)
+    return func
+
+
+def _set_value(attr, mask=None):
+    def func(renderer, state, n):
+        setattr(state, attr, n if mask is None else n & mask)
+    return func
+
+
+def _reset_line_spacing(renderer, state):
+    state.line_spacing = DEFAULT_LINE_SPACING
+
+
+def _feed_lines(renderer, state, n):
+    renderer._print_line(advance=0)
+    renderer._y += n * state.line_spacing
+
+
+def _feed_dots(renderer, state, n):
+    renderer._print_line(advance=n)
+
+
+def _cut(renderer, state):
+    renderer._cut()
+
+
+def _cut_with_mode(renderer, buf, i):
+    if i >= len(buf):
+        return _INCOMPLETE
+    # GS V 65/66 n feeds n lines before cutting
+    end = i + 2 if buf[i] in (65, 66) else i + 1
+    if end > len(buf):
+        return _INCOMPLETE
+    renderer._cut()
+    return end
+
+
+def _absolute_position(renderer, buf, i):
+    if i + 2 > len(buf):
+        return _INCOMPLETE
+    renderer._x = min(renderer.width, buf[i] + buf[i + 1] * 256)
+    return i + 2
+
+
+def _column_image(renderer, buf, i, n_bytes, scale_x, scale_y):
+    if i + 2 > len(buf):
+        return _INCOMPLETE
+    columns = buf[i] + buf[i + 1] * 256
+    end = i + 2 + columns * n_bytes
+    if end > len(buf):
+        return _INCOMPLETE
+    if columns:
+        # Each column is a row of this image, with the top dot first
+        image = Image.frombytes('1', (n_bytes * 8, columns),
+                                bytes(buf[i + 2:end]), 'raw', '1;I')
+        image = image.transpose(Image.TRANSPOSE)
+        if scale_x != 1 or scale_y != 1:
+            image = image.resize((image.width * scale_x,
+                                  image.height * scale_y), Image.NEAREST)
+        renderer._put_image(image)
+    return end
+
+
+def _select_bit_image(renderer, buf, i):
+    # ESC * m nL nH d1...dk
+    if i >= len(buf):
+        return _INCOMPLETE
+    mode = buf[i]
+    if mode in (32, 33):
+        n_bytes, scale_y = 3, 1
+    else:
+        # 8 dot modes have a third of the vertical density
+        n_bytes, scale_y = 1, 3
+    scale_x = 1 if mode & 1 else 2
+    return _column_image(renderer, buf, i + 1, n_bytes, scale_x, scale_y)
+
+
+def _eight_dot_image(renderer, buf, i):
+    # ESC K nL nH d1...dk, used by EscPosMixin.print_matrix
+    return _column_image(renderer, buf, i, 1, 1, 3)
+
+
+def _raster_image(renderer, buf, i):
+    # GS v 0 m xL xH yL yH d1...dk
+    if i + 6 > len(buf):
+        return _INCOMPLETE
+    mode = buf[i + 1]
+    width_bytes = buf[i + 2] + buf[i + 3] * 256
+    height = buf[i + 4] + buf[i + 5] * 256
+    end = i + 6 + width_bytes * height
+    if end > len(buf):
+        return _INCOMPLETE
+    if width_bytes and height:
+        image = Image.frombytes('1', (width_bytes * 8, height),
+                                bytes(buf[i + 6:end]), 'raw', '1;I')
+        scale_x = 2 if mode & 1 else 1
+        scale_y = 2 if mode & 2 else 1
+        if scale_x != 1 or scale_y != 1:
+            image = image.resize((image.width * scale_x,
+                                  image.height * scale_y), Image.NEAREST)
+        renderer._print_block(image)
+    return end
+
+
+def _draw_barcode(renderer, symbology, data, height=None, module=None,
+                  hri=None):
+    state = renderer._state
+    height = height or state.barcode_height
+    module = module or state.barcode_width
+    hri = state.barcode_hri if hri is None else hri
+    renderer.barcodes.append(Barcode(symbology, data.decode('latin-1')))
+
+    # A quiet zone, the data bits between two guards, and a quiet zone
+    bits = [1, 0, 1, 1] + [byte >> (7 - k) & 1 for byte in data
+                           for k in range(8)] + [1, 1, 0, 1]
+    width = min(renderer.width, (len(bits) + 20) * module)
+    image = Image.new('1', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for n, bit in enumerate(bits):
+        x = (n + 10) * module
+        if bit and x < width:
+            draw.rectangle([x, 0, x + module - 1, height - 1], fill=0)
+    if hri:
+        text_height = FONT_CELLS[1][1]
+        font = renderer._get_font(text_height - 4)
+        with_text = Image.new('1', (width, height + text_height * 2), 255)
+        y = text_height if hri & 1 else 0
+        with_text.paste(image, (0, y))
+        draw = ImageDraw.Draw(with_text)
+        text = data.decode('latin-1')
+        if hri & 1:
+            draw.text((10 * module, 0), text, font=font, fill=0)
+        if hri & 2:
+            draw.text((10 * module, y + height), text, font=font, fill=0)
+        image = with_text
+    renderer._print_block(image)
+
+
+def _barcode(renderer, buf, i):
+    # GS k m d1...dk NUL or GS k m n d1...dn
+    if i >= len(buf):
+        return _INCOMPLETE
+    symbology = buf[i]
+    if symbology < 65:
+        end = buf.find(b'\x00', i + 1)
+        if end == -1:
+            return _INCOMPLETE
+        data = buf[i + 1:end]
+        end += 1
+    else:
+        if i + 1 >= len(buf):
+            return _INCOMPLETE
+        end = i + 2 + buf[i + 1]
+        if end > len(buf):
+            return _INCOMPLETE
+        data = buf[i + 2:end]
+    _draw_barcode(renderer, BARCODE_TYPES.get(symbology, str(symbology)),
+                  bytes(data))
+    return end
+
+
+def _draw_qrcode(renderer, data, module_size, ecc):
+    renderer.qrcodes.append(data.decode('utf-8', 'replace'))
+    matrix = _get_qr_matrix(data, ecc)
+    renderer._print_block(_matrix_to_image(matrix, module_size))
+
+
+def _two_dimension_code(renderer, buf, i):
+    # GS ( k pL pH cn fn [parameters]
+    if i + 2 > len(buf):
+        return _INCOMPLETE
+    length = buf[i] + buf[i + 1] * 256
+    end = i + 2 + length
+    if end > len(buf):
+        return _INCOMPLETE
+    params = buf[i + 2:end]
+    if len(params) >= 2 and params[0] == 49:
+        state = renderer._state
+        function = params[1]
+        if function == 67 and len(params) > 2:
+            state.qr_module_size = max(1, params[2])
+        elif function == 69 and len(params) > 2:
+            state.qr_ecc = params[2] - 48
+        elif function == 80:
+            state.qr_data = bytes(params[3:])
+        elif function == 81 and state.qr_data:
+            _draw_qrcode(renderer, state.qr_data, state.qr_module_size,
+                         state.qr_ecc)
+    return end
+
+
+def _gs_parenthesis(renderer, buf, i):
+    # GS ( fn pL pH ...
+    if i >= len(buf):
+        return _INCOMPLETE
+    if buf[i] == ord('k'):
+        return _two_dimension_code(renderer, buf, i + 1)
+    if i + 3 > len(buf):
+        return _INCOMPLETE
+    end = i + 3 + buf[i + 1] + buf[i + 2] * 256
+    return _INCOMPLETE if end > len(buf) else end
+
+
+def _set_bema_option(renderer, buf, i):
+    # GS 0xf9 function n
+    if i + 2 > len(buf):
+        return _INCOMPLETE
+    if buf[i] == 0x37:
+        state = renderer._state
+        state.charset = BEMA_CODE_PAGES.get(buf[i + 1], state.charset)
+    return i + 2
+
+
+def _daruma_barcode(renderer, buf, i):
+    # ESC b type width height label d1...dk NUL
+    if i + 4 > len(buf):
+        return _INCOMPLETE
+    end = buf.find(b'\x00', i + 4)
+    if end == -1:
+        return _INCOMPLETE
+    symbology = {5: 'CODE128'}.get(buf[i], str(buf[i]))
+    _draw_barcode(renderer, symbology, bytes(buf[i + 4:end]),
+                  height=buf[i + 2], module=buf[i + 1], hri=buf[i + 3])
+    return end + 1
+
+
+def _daruma_qrcode(renderer, buf, i):
+    # ESC 0x81 nL nH width correction d1...dk
+    if i + 2 > len(buf):
+        return _INCOMPLETE
+    length = buf[i] + buf[i + 1] * 256
+    end = i + 2 + length
+    if end > len(buf):
+        return _INCOMPLETE
+    if length > 2:
+        _draw_qrcode(renderer, bytes(buf[i + 4:end]), max(1, buf[i + 2]), 0)
+    return end
+
+
+_ESCPOS_ESC = {
+    ord('@'): (_state_handler(_init), KIND_STYLE),
+    ord('!'): (_param_handler(_set_print_mode), KIND_STYLE),
+    ord('E'): (_param_handler(_set_attribute('bold')), KIND_STYLE),
+    ord('G'): (_param_handler(_set_attribute('double_strike')), KIND_STYLE),
+    ord('-'): (_param_handler(_set_value('underline', 3)), KIND_STYLE),
+    ord('a'): (_param_handler(_set_value('align', 3)), KIND_STYLE),
+    ord('M'): (_param_handler(_set_value('font', 1)), KIND_STYLE),
+    ord('t'): (_param_handler(_set_code_page), KIND_STYLE),
+    ord(' '): (_param_handler(_set_value('right_spacing')), KIND_STYLE),
+    ord('2'): (_state_handler(_reset_line_spacing), KIND_STYLE),
+    ord('3'): (_param_handler(_set_value('line_spacing')), KIND_STYLE),
+    ord('$'): (_absolute_position, KIND_STYLE),
+    ord('d'): (_param_handler(_feed_lines), KIND_PAPER),
+    ord('J'): (_param_handler(_feed_dots), KIND_PAPER),
+    ord('*'): (_select_bit_image, KIND_GRAPHICS),
+    ord('K'): (_eight_dot_image, KIND_GRAPHICS),
+    ord('i'): (_state_handler(_cut), KIND_PAPER),
+    ord('m'): (_state_handler(_cut), KIND_PAPER),
+    ord('p'): (_params(3), KIND_OTHER),
+    ord('='): (_params(1), KIND_OTHER),
+    ord('R'): (_params(1), KIND_STYLE),
+    ord('{'): (_params(1), KIND_STYLE),
+    ord('V'): (_params(1), KIND_STYLE),
+    ord('c'): (_params(2), KIND_OTHER),
+}
+
+_ESCPOS_GS = {
+    ord('!'): (_param_handler(_set_char_size), KIND_STYLE),
+    ord('B'): (_param_handler(_set_attribute('reverse')), KIND_STYLE),
+    ord('V'): (_cut_with_mode, KIND_PAPER),
+    ord('v'): (_raster_image, KIND_GRAPHICS),
+    ord('h'): (_param_handler(_set_value('barcode_height')), KIND_BARCODE),
+    ord('w'): (_param_handler(_set_value('barcode_width')), KIND_BARCODE),
+    ord('H'): (_param_handler(_set_value('barcode_hri', 3)), KIND_BARCODE),
+    ord('f'): (_params(1), KIND_BARCODE),
+    ord('k'): (_barcode, KIND_BARCODE),
+    ord('('): (_gs_parenthesis, KIND_QRCODE),
+    ord('L'): (_params(2), KIND_STYLE),
+    ord('W'): (_params(2), KIND_STYLE),
+    ord('a'): (_params(1), KIND_OTHER),
+    ord('r'): (_params(1), KIND_OTHER),
+    ord('I'): (_params(1), KIND_OTHER),
+    ord('b'): (_params(1), KIND_STYLE),
+}
+
+_BEMA_ESC = dict(_ESCPOS_ESC)
+_BEMA_ESC.update({
+    ord('E'): (_state_handler(_set_attribute('bold', True)), KIND_STYLE),
+    ord('F'): (_state_handler(_set_attribute('bold', False)), KIND_STYLE),
+    ord('H'): (_state_handler(_set_attribute('font', 0)), KIND_STYLE),
+    SI: (_state_handler(_set_attribute('font', 1)), KIND_STYLE),
+    ord('d'): (_param_handler(_set_double_height), KIND_STYLE),
+    ord('v'): (_params(1), KIND_OTHER),
+    ord('b'): (_params(1), KIND_OTHER),
+})
+_BEMA_GS = dict(_ESCPOS_GS)
+_BEMA_GS.update({
+    0xf9: (_set_bema_option, KIND_OTHER),
+})
+
+_DARUMA_ESC = dict(_BEMA_ESC)
+_DARUMA_ESC.update({
+    ord('j'): (_param_handler(_set_value('align', 3)), KIND_STYLE),
+    ord('w'): (_param_handler(_set_double_height), KIND_STYLE),
+    SI: (_param_handler(_set_attribute('font', 1)), KIND_STYLE),
+    ord('b'): (_daruma_barcode, KIND_BARCODE),
+    0x81: (_daruma_qrcode, KIND_QRCODE),
+})
+
+_DIALECTS = {
+    DIALECT_ESCPOS: (_ESCPOS_ESC, _ESCPOS_GS),
+    DIALECT_BEMA: (_BEMA_ESC, _BEMA_GS),
+    DIALECT_DARUMA: (_DARUMA_ESC, _ESCPOS_GS),
+}
+
+
+def render(data, dialect=DIALECT_ESCPOS, **kwargs):
+    """Render all the data sent to a printer.
+
+    @returns: the L{ReceiptRenderer}
+    """
+    renderer = ReceiptRenderer(dialect, **kwargs)
+    renderer.feed(data)
+    renderer.close()
+    return renderer
@@ -27,6 +27,8 @@
 Useful functions related to all scales supported by stoqdrivers
 """
 
+from collections import deque
+
 from zope.interface import providedBy
 
 from stoqdrivers.base import BaseDevice
@@ -45,6 +47,45 @@ class BaseScale(BaseDevice):
             raise TypeError("This driver doesn't implements a valid interface")
 
 
+class WeightStabilizer:
+    """ Tell when the weight on a scale has settled.
+
+    The last readings are kept on a ring buffer, and the weight is stable
+    when the buffer is full and all of them are within a tolerance of each
+    other. A zero reading means the product was removed, so it empties the
+    buffer.
+
+    @param size: how many readings must agree
+    @param tolerance: the maximum difference (in kg) between them
+    """
+
+    def __init__(self, size=5, tolerance=0.005):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size = size
+        self.tolerance = tolerance
+        self._weights = deque(maxlen=size)
+
+    def add(self, weight):
+        """ Add a reading.
+
+        @returns: True if the weight is stable after this reading
+        """
+        if not weight:
+            self._weights.clear()
+            return False
+        self._weights.append(weight)
+        return self.is_stable()
+
+    def is_stable(self):
+        weights = self._weights
+        return (len(weights) == self.size and
+                max(weights) - min(weights) <= self.tolerance)
+
+    def reset(self):
+        self._weights.clear()
+
+
 def get_supported_scales():
     result = {}
 
@@ -27,18 +27,127 @@
 Base class implementation for all the scales drivers.
 """
 
+import asyncio
+import logging
+import time
 
-from stoqdrivers.scales.base import BaseScale
+from stoqdrivers.exceptions import InvalidReply
+from stoqdrivers.listener import get_default_listener
+from stoqdrivers.scales.base import BaseScale, WeightStabilizer
+
+log = logging.getLogger('stoqdrivers.scales')
 
 #
 # Scale interface
 #
 
 
+class _StreamState:
+    def __init__(self, stable_readings, tolerance, on_stable):
+        self.stabilizer = WeightStabilizer(stable_readings, tolerance)
+        self.on_stable = on_stable
+        self.notified = False
+
+    def process(self, reading):
+        """ Returns True if the reading should be yielded """
+        stable = self.stabilizer.add(reading.weight)
+        if not stable:
+            # Moving or removed: the next stable weight is a new one
+            self.notified = False
+            return False
+        if not self.notified:
+            self.notified = True
+            if self.on_stable is not None:
+                self.on_stable(reading)
+        return True
+
+
 class Scale(BaseScale):
     def read_data(self):
         return self._driver.read_data()
 
+    def listen(self, callback, error_callback=None, listener=None):
+        """ Receive the packets the scale sends by itself (when the print
+        button is pressed, for instance), without polling.
+
+        @param callback: called with an L{stoqdrivers.interfaces.IScaleInfo}
+          for each packet, on the listener thread
+        @param error_callback: called with the exception when a packet
+          can't be parsed
+        @param listener: the L{stoqdrivers.listener.DeviceListener} to use.
+          By default the one shared by the whole process.
+        """
+        if not hasattr(self._driver, 'create_framer'):
+            raise TypeError("%s does not send packets by itself"
+                            % self._driver.model_name)
+        listener = listener or get_default_listener()
+        listener.add(self._driver.get_port(), self._driver.create_framer(),
+                     self._driver.parse_frame, callback, error_callback)
+        return listener
+
+    def stop_listening(self, listener=None):
+        listener = listener or get_default_listener()
+        listener.remove(self._driver.get_port())
+
+    def _read_reading(self):
+        try:
+            return self._driver.read_data()
+        except InvalidReply as e:
+            # Garbage on the line, usually while the scale is settling
+            log.info('Ignoring an invalid scale reply: %s' % e)
+            return None
+
+    def stream(self, interval=0.2, stable_readings=5, tolerance=0.005,
+               on_stable=None):
+        """ Poll the scale continuously, yielding the stable readings.
+
+        Zero readings (nothing on the scale) and readings taken while the
+        weight is still changing are not yielded.
+
+        @param interval: the time between two polls, in seconds
+        @param stable_readings: how many readings within I{tolerance} of
+          each other are needed for the weight to be stable
+        @param tolerance: see L{WeightStabilizer}
+        @param on_stable: called with the reading when the weight settles.
+          It is called again only after the weight changes or the product
+          is removed.
+        @returns: a generator of L{stoqdrivers.interfaces.IScaleInfo}
+        """
+        state = _StreamState(stable_readings, tolerance, on_stable)
+        deadline = time.monotonic()
+        while True:
+            reading = self._read_reading()
+            if reading is not None and state.process(reading):
+                yield reading
+            deadline += interval
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # The scale is slower than the interval, don't try to catch up
+                deadline = time.monotonic()
+
+    async def stream_async(self, interval=0.2, stable_readings=5,
+                           tolerance=0.005, on_stable=None):
+        """ The asyncio version of L{stream}.
+
+        The serial reads are done on the default executor, so the loop is
+        never blocked.
+        """
+        loop = asyncio.get_event_loop()
+        state = _StreamState(stable_readings, tolerance, on_stable)
+        deadline = loop.time()
+        while True:
+            reading = await loop.run_in_executor(None, self._read_reading)
+            if reading is not None and state.process(reading):
+                yield reading
+            deadline += interval
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                deadline = loop.time()
+
 
 def test():
     scale = Scale()
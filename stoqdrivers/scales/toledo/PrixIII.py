@@ -32,7 +32,9 @@ from zope.interface import implementer
 
 from stoqdrivers.exceptions import InvalidReply
 from stoqdrivers.interfaces import IScale, IScaleInfo
+from stoqdrivers.listener import StxEtxFramer
 from stoqdrivers.serialbase import SerialBase, SerialPort
+from stoqdrivers.utils import bytes2str
 
 STX = 0x02
 ETX = 0x03
@@ -110,6 +112,17 @@ class PrixIII(SerialBase):
         # to Package's constructor the whole data.
         return PackagePrt1(reply + PrixIII.EOL_DELIMIT)
 
+    #
+    # Push mode, see stoqdrivers.listener
+    #
+
+    def create_framer(self):
+        """ The packets sent when the print button is pressed """
+        return StxEtxFramer(STX, ETX, max_size=PackagePrt4.SIZE)
+
+    def parse_frame(self, frame):
+        return PackagePrt4(bytes2str(frame))
+
     #
     # IScale implementation
     #
@@ -31,8 +31,10 @@ import socket
 from serial import Serial, EIGHTBITS, PARITY_NONE, STOPBITS_ONE
 from zope.interface import implementer
 
+from stoqdrivers import metrics
 from stoqdrivers.interfaces import ISerialPort
 from stoqdrivers.exceptions import DriverError, PrinterError
+from stoqdrivers.trace import WireTrace, traced
 from stoqdrivers.translation import stoqdrivers_gettext
 from stoqdrivers.utils import str2bytes, bytes2str
 
@@ -107,6 +109,7 @@ class EthernetPort:
         try:
             self.device.sendall(data)
         except (ConnectionResetError, OSError):
+            metrics.count(self, metrics.RECONNECTS)
             self._create_connection()
             self.device.sendall(data)
 
@@ -114,7 +117,10 @@ class EthernetPort:
         self._check_device()
         try:
             data = self.device.recv(n_bytes)
-        except (ConnectionResetError, socket.timeout):
+        except socket.timeout:
+            metrics.count(self, metrics.TIMEOUTS)
+            raise PrinterError
+        except ConnectionResetError:
             raise PrinterError
 
         return str2bytes(data)
@@ -156,6 +162,7 @@ class SerialBase(object):
     inverted_drawer = False
 
     def __init__(self, port):
+        self._wire_trace = WireTrace()
         self.set_port(port)
 
     def set_port(self, port):
@@ -167,6 +174,11 @@ class SerialBase(object):
     def fileno(self):
         return self._port.fileno()
 
+    def get_wire_trace(self):
+        """Get the L{stoqdrivers.trace.WireTrace} of this device."""
+        return self._wire_trace
+
+    @traced
     def writeline(self, data):
         self.write(self.CMD_PREFIX + data + self.CMD_SUFFIX)
         return self.readline()
@@ -174,12 +186,19 @@ class SerialBase(object):
     def write(self, data):
         # pyserial is expecting bytes but we work with str in stoqdrivers
         data = str2bytes(data)
-        log.debug(">>> %r (%d bytes)" % (data, len(data)))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(">>> %r (%d bytes)" % (data, len(data)))
+        if metrics.enabled:
+            metrics.count(self, metrics.BYTES_OUT, len(data))
+        self._wire_trace.write(data)
         self._port.write(data)
 
     def read(self, n_bytes):
         # stoqdrivers is expecting str but pyserial will reply with bytes
         data = self._port.read(n_bytes)
+        self._wire_trace.read(data)
+        if metrics.enabled:
+            metrics.count(self, metrics.BYTES_IN, len(data))
         return bytes2str(data)
 
     def readline(self):
@@ -188,17 +207,19 @@ class SerialBase(object):
         retries = 10
         while True:
             if a > retries:
+                metrics.count(self, metrics.TIMEOUTS)
                 raise DriverError(_("Timeout communicating with fiscal "
                                     "printer"))
 
             c = self.read(1)
             if not c:
                 a += 1
-                print('take %s' % a)
+                metrics.count(self, metrics.RETRIES)
                 continue
             a = 0
             if c == self.EOL_DELIMIT:
-                log.debug('<<< %r' % out)
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug('<<< %r' % out)
                 return out
             out += c
 
@@ -0,0 +1,380 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Per-device command spooler.
+
+Printer objects are not thread-safe, so every physical device gets a single
+I/O thread that owns it. Callers submit jobs and receive a
+L{concurrent.futures.Future} for each one. Jobs that must not be interleaved
+with anything else (a whole coupon, a whole receipt) are submitted as a
+L{JobGroup}. Urgent jobs (opening the drawer, querying the status) jump ahead
+of the queue, but only between groups, never in the middle of one.
+
+The spooler can also keep the real-time status of the device up to date
+(see L{DeviceSpooler.set_status_interval}). The status is polled between jobs,
+even between the jobs of a group, and while the queue is idle, so the UI can
+check the cached status without waiting for the printer.
+"""
+
+from concurrent.futures import Future
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+log = logging.getLogger('stoqdrivers.spooler')
+
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+#: Methods that are submitted with PRIORITY_URGENT by L{DeviceSpooler.call}
+URGENT_METHODS = frozenset(['open_drawer', 'query_status', 'is_drawer_open'])
+
+
+class _Job:
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.submitted = time.monotonic()
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except BaseException as e:
+            self.future.set_exception(e)
+        else:
+            self.future.set_result(result)
+
+
+class JobGroup:
+    """A sequence of jobs executed atomically by the spooler.
+
+    Jobs can be added while the group is open, even after the I/O thread
+    already started executing it. The thread will not run anything else until
+    the group is closed and all its jobs are done::
+
+        with spooler.group() as group:
+            group.submit(printer.open)
+            group.submit(printer.add_item, ...)
+        # group.futures holds one future for each job
+    """
+
+    def __init__(self, spooler, priority):
+        self._spooler = spooler
+        self._cond = threading.Condition()
+        self._jobs = []
+        self._closed = False
+        self._enqueued = False
+        self.priority = priority
+        self.futures = []
+        self.submitted = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def submit(self, func, *args, **kwargs):
+        """Add a job to this group.
+
+        @returns: a future for the job result
+        """
+        job = _Job(func, args, kwargs)
+        with self._cond:
+            if self._closed:
+                raise ValueError("Cannot submit jobs to a closed group")
+            self._jobs.append(job)
+            self.futures.append(job.future)
+            self._cond.notify()
+        self._ensure_enqueued()
+        return job.future
+
+    def call(self, name, *args, **kwargs):
+        """Add a job calling the method I{name} of the spooled device."""
+        return self.submit(getattr(self._spooler.device, name), *args, **kwargs)
+
+    def close(self):
+        """Close the group: no more jobs can be added to it."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        # An empty group still needs to be consumed by the I/O thread
+        self._ensure_enqueued()
+
+    def _ensure_enqueued(self):
+        with self._cond:
+            if self._enqueued:
+                return
+            self._enqueued = True
+        self._spooler._enqueue(self.priority, self)
+
+    def _next_job(self):
+        with self._cond:
+            while not self._jobs and not self._closed:
+                self._cond.wait()
+            if self._jobs:
+                return self._jobs.pop(0)
+            return None
+
+    def run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                break
+            self._spooler._record_wait(job)
+            job.run()
+            self._spooler._maybe_poll_status()
+
+
+class DeviceSpooler:
+    """Serialize all the access to a device through a dedicated thread.
+
+    @ivar device: the device (or driver) owned by this spooler
+    """
+
+    def __init__(self, device, name=None, status_interval=None):
+        self.device = device
+        self.name = name or repr(device)
+        self.status_interval = status_interval
+        self._last_poll = 0.0
+        self._cond = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        self._running = True
+        self._busy = False
+        self._jobs_done = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._last_wait = 0.0
+        self._thread = threading.Thread(target=self._run,
+                                        name='stoqdrivers-spooler-%s' % self.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    #
+    # Public API
+    #
+
+    def submit(self, func, *args, priority=PRIORITY_NORMAL, **kwargs):
+        """Submit a single job to be executed on the I/O thread.
+
+        @param func: the callable to execute
+        @param priority: one of PRIORITY_URGENT, PRIORITY_NORMAL or
+          PRIORITY_LOW. Lower values run first.
+        @returns: a future for the job result
+        """
+        job = _Job(func, args, kwargs)
+        self._enqueue(priority, job)
+        return job.future
+
+    def call(self, name, *args, **kwargs):
+        """Submit a call to the method I{name} of the spooled device.
+
+        Methods listed in L{URGENT_METHODS} are submitted as urgent jobs.
+        """
+        if name in URGENT_METHODS:
+            priority = PRIORITY_URGENT
+        else:
+            priority = PRIORITY_NORMAL
+        return self.submit(getattr(self.device, name), *args,
+                           priority=priority, **kwargs)
+
+    def group(self, priority=PRIORITY_NORMAL):
+        """Create a new L{JobGroup} for jobs that must not be interleaved.
+
+        The group is queued when its first job is submitted (or when it is
+        closed), so a group is ordered by the time it started, not by the
+        time it finished.
+        """
+        return JobGroup(self, priority)
+
+    def submit_group(self, calls, priority=PRIORITY_NORMAL):
+        """Submit a list of (func, args, kwargs) tuples as one group.
+
+        @returns: a list of futures, one for each call
+        """
+        with self.group(priority) as group:
+            for func, args, kwargs in calls:
+                group.submit(func, *args, **kwargs)
+        return group.futures
+
+    def get_queue_depth(self):
+        """The number of jobs and groups waiting to be executed."""
+        with self._cond:
+            return len(self._queue) + int(self._busy)
+
+    def get_metrics(self):
+        """Get a snapshot of the spooler metrics.
+
+        @returns: a dict with the queue depth, the number of executed jobs and
+          the last, average and maximum time (in seconds) the jobs waited on
+          the queue before being executed.
+        """
+        with self._cond:
+            done = self._jobs_done
+            return {
+                'queue_depth': len(self._queue) + int(self._busy),
+                'jobs_done': done,
+                'wait_time_last': self._last_wait,
+                'wait_time_avg': self._wait_total / done if done else 0.0,
+                'wait_time_max': self._wait_max,
+            }
+
+    def set_status_interval(self, interval):
+        """Poll the status of the device every I{interval} seconds.
+
+        The device must have a C{poll_status} method, like
+        L{stoqdrivers.printers.nonfiscal.NonFiscalPrinter.poll_status}.
+
+        @param interval: the interval, or None to stop polling
+        """
+        with self._cond:
+            self.status_interval = interval
+            self._cond.notify()
+
+    def stop(self, wait=True):
+        """Stop the I/O thread after executing all the pending jobs."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    #
+    # Private
+    #
+
+    def _enqueue(self, priority, item):
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("The spooler %s was stopped" % self.name)
+            heapq.heappush(self._queue, (priority, next(self._counter), item))
+            self._cond.notify()
+
+    def _record_wait(self, job):
+        wait = time.monotonic() - job.submitted
+        with self._cond:
+            self._jobs_done += 1
+            self._wait_total += wait
+            self._last_wait = wait
+            if wait > self._wait_max:
+                self._wait_max = wait
+
+    def _get_poll_timeout(self):
+        if (self.status_interval is None or
+                not hasattr(self.device, 'poll_status')):
+            return None
+        return max(0.0, self._last_poll + self.status_interval -
+                   time.monotonic())
+
+    def _poll_status(self):
+        self._last_poll = time.monotonic()
+        try:
+            self.device.poll_status()
+        except Exception as e:
+            log.debug('Could not poll the status of %s: %s' % (self.name, e))
+
+    def _maybe_poll_status(self):
+        if self._get_poll_timeout() == 0:
+            self._poll_status()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and self._running:
+                    timeout = self._get_poll_timeout()
+                    if timeout == 0:
+                        break
+                    self._cond.wait(timeout)
+                if self._queue:
+                    priority, n, item = heapq.heappop(self._queue)
+                    self._busy = True
+                elif not self._running:
+                    return
+                else:
+                    item = None
+
+            if item is None:
+                # Idle, time to poll the status
+                self._poll_status()
+                continue
+
+            try:
+                if isinstance(item, JobGroup):
+                    item.run()
+                else:
+                    self._record_wait(item)
+                    item.run()
+            except Exception:
+                log.exception('Unhandled error on spooler %s' % self.name)
+            finally:
+                with self._cond:
+                    self._busy = False
+            self._maybe_poll_status()
+
+
+_spoolers = {}
+_spoolers_lock = threading.Lock()
+
+
+def _get_device_key(device):
+    # Two printer objects created for the same port share the same physical
+    # device, so they must share the same spooler.
+    for attr in ['device', '_device_name']:
+        value = getattr(device, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return id(device)
+
+
+def get_spooler(device, create=True):
+    """Get the spooler for the physical device behind I{device}.
+
+    @param device: a L{stoqdrivers.base.BaseDevice} instance (or a driver)
+    @param create: if a new spooler should be created when there is none
+    @returns: the L{DeviceSpooler} or None if there is none and
+      I{create} is False
+    """
+    key = _get_device_key(device)
+    with _spoolers_lock:
+        spooler = _spoolers.get(key)
+        if spooler is None and create:
+            spooler = _spoolers[key] = DeviceSpooler(device, name=str(key))
+        return spooler
+
+
+def remove_spooler(device):
+    """Stop and forget the spooler of I{device}, if any."""
+    key = _get_device_key(device)
+    with _spoolers_lock:
+        spooler = _spoolers.pop(key, None)
+    if spooler is not None:
+        spooler.stop()
@@ -0,0 +1,231 @@
+# -*- Mode: Python; coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Stoqdrivers
+## Copyright (C) 2026 Stoq Tecnologia <http://stoq.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307,
+## USA.
+##
+"""
+Always-on trace of the bytes exchanged with a device.
+
+Each transport keeps a L{WireTrace} with the last frames written to and read
+from the device. A frame is a single write, or all the bytes read between
+two writes. The frames are copied into buffers allocated once, when the
+trace is created, so the memory used is bounded and tracing costs a slice
+assignment per read or write, even when the debug log is off.
+
+When a driver command fails, the frames are attached to the raised
+L{stoqdrivers.exceptions.DriverError} or
+L{stoqdrivers.exceptions.PrinterError} as its I{wire_trace}. They can also
+be saved in the format of the tests/data files, to replay a failure seen on
+the field with the tests PlaybackPort.
+"""
+
+from collections import namedtuple
+import copy
+import functools
+import logging
+import time
+
+from stoqdrivers.exceptions import DriverError, PrinterError
+
+log = logging.getLogger('stoqdrivers.trace')
+
+#: Number of frames kept for each direction
+DEFAULT_FRAMES = 32
+#: Bytes kept of each frame. The rest of a longer frame is dropped, but its
+#: real length is still recorded.
+DEFAULT_FRAME_SIZE = 1024
+
+WRITE = 'W'
+READ = 'R'
+
+Frame = namedtuple('Frame', 'direction timestamp data length')
+Frame.__doc__ = """A frame of the trace.
+
+@ivar direction: L{WRITE} or L{READ}
+@ivar timestamp: the time.monotonic() of the first byte
+@ivar data: the bytes of the frame, truncated to the frame size
+@ivar length: the real length of the frame
+"""
+
+
+class _Ring:
+    __slots__ = ('frame_size', 'data', 'lengths', 'times', 'seqs', 'pos')
+
+    def __init__(self, frames, frame_size):
+        self.frame_size = frame_size
+        self.data = bytearray(frames * frame_size)
+        self.lengths = [0] * frames
+        self.times = [0.0] * frames
+        # The sequence number of each frame, 0 for an unused slot
+        self.seqs = [0] * frames
+        self.pos = frames - 1
+
+    def start(self, seq):
+        pos = self.pos = (self.pos + 1) % len(self.seqs)
+        self.seqs[pos] = seq
+        self.times[pos] = time.monotonic()
+        self.lengths[pos] = 0
+
+    def extend(self, data):
+        pos = self.pos
+        length = self.lengths[pos]
+        room = self.frame_size - length
+        if room > 0:
+            chunk = data[:room]
+            offset = pos * self.frame_size + length
+            self.data[offset:offset + len(chunk)] = chunk
+        self.lengths[pos] = length + len(data)
+
+    def get_frames(self, direction):
+        frames = []
+        for pos, seq in enumerate(self.seqs):
+            if not seq:
+                continue
+            offset = pos * self.frame_size
+            length = self.lengths[pos]
+            data = bytes(self.data[offset:offset + min(length, self.frame_size)])
+            frames.append((seq, Frame(direction, self.times[pos], data, length)))
+        return frames
+
+    def clear(self):
+        for pos in range(len(self.seqs)):
+            self.seqs[pos] = 0
+
+
+class WireTrace:
+    """The last frames exchanged with a device.
+
+    The trace is not thread-safe, it must only be used by the thread that
+    owns the device (see L{stoqdrivers.spooler}).
+
+    @param frames: the number of frames kept for each direction
+    @param frame_size: the number of bytes kept of each frame
+    """
+
+    def __init__(self, frames=DEFAULT_FRAMES, frame_size=DEFAULT_FRAME_SIZE):
+        self._out = _Ring(frames, frame_size)
+        self._in = _Ring(frames, frame_size)
+        self._seq = 0
+        self._reading = False
+
+    def write(self, data):
+        """Record the bytes written to the device."""
+        self._seq += 1
+        self._out.start(self._seq)
+        self._out.extend(data)
+        self._reading = False
+
+    def read(self, data):
+        """Record the bytes read from the device."""
+        if not data:
+            return
+        if not self._reading:
+            self._seq += 1
+            self._in.start(self._seq)
+            self._reading = True
+        self._in.extend(data)
+
+    def clear(self):
+        self._out.clear()
+        self._in.clear()
+        self._reading = False
+
+    def get_frames(self):
+        """Get the frames in the order they were exchanged.
+
+        @returns: a list of L{Frame}
+        """
+        frames = self._out.get_frames(WRITE) + self._in.get_frames(READ)
+        frames.sort(key=lambda f: f[0])
+        return [frame for seq, frame in frames]
+
+    def format(self):
+        """Format the frames for a log or a bug report, one per line, with
+        the time relative to the last frame.
+        """
+        frames = self.get_frames()
+        if not frames:
+            return ''
+        last = frames[-1].timestamp
+        lines = []
+        for frame in frames:
+            truncated = ''
+            if frame.length > len(frame.data):
+                truncated = ' (%d bytes)' % frame.length
+            lines.append('%+.3f %s %s%s' % (frame.timestamp - last,
+                                            frame.direction,
+                                            _escape(frame.data), truncated))
+        return '\n'.join(lines)
+
+    def save(self, filename):
+        """Save the frames in the format used by the tests/data files,
+        with the think-time of the device before each reply.
+
+        Frames longer than the frame size are saved truncated, and the
+        saved file will not replay beyond them.
+        """
+        with open(filename, 'w') as fp:
+            written = None
+            for frame in self.get_frames():
+                if frame.length > len(frame.data):
+                    log.warning('Saving a truncated frame (%d of %d bytes) '
+                                'to %s' % (len(frame.data), frame.length,
+                                           filename))
+                if frame.direction == WRITE:
+                    written = frame.timestamp
+                elif written is not None:
+                    # The device think-time, approximated by the time from
+                    # the start of the write to the first byte read
+                    fp.write('D %.6f\n' % (frame.timestamp - written))
+                fp.write('%s %s\n' % (frame.direction, _escape(frame.data)))
+
+
+def _escape(data):
+    # Same as the tests LogSerialPort
+    return repr(bytes(data))[2:-1]
+
+
+def get_wire_trace(obj):
+    """Get the L{WireTrace} of a transport or driver, or None."""
+    return getattr(obj, '_wire_trace', None)
+
+
+def traced(func):
+    """Attach the wire trace of the driver to the errors raised by the
+    decorated command.
+
+    The frames are stored on the I{wire_trace} attribute of the error, a
+    list of L{Frame}. Some drivers raise the same error instance every time
+    the device reports a given error code, so the trace is set on a copy of
+    the error, raised from the original one.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        except (DriverError, PrinterError) as e:
+            trace = get_wire_trace(self)
+            if trace is None:
+                raise
+            error = copy.copy(e)
+            error.wire_trace = trace.get_frames()
+            raise error from e
+    return wrapper
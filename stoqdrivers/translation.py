@@ -27,6 +27,13 @@ Stoqdrivers translation functions
 
 import gettext
 
+_translation_enabled = False
+
 
 def stoqdrivers_gettext(message):
+    global _translation_enabled
+    if not _translation_enabled:
+        from stoqdrivers import enable_translation
+        _translation_enabled = True
+        enable_translation('stoqdrivers')
     return gettext.dgettext('stoqdrivers', message)
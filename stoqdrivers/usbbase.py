@@ -22,6 +22,8 @@
 ## USA.
 
 
+import errno
+
 try:
     import usb.core
     import usb.util
@@ -29,7 +31,9 @@ try:
 except ImportError:
     has_usb = False
 
+from stoqdrivers import metrics
 from stoqdrivers.exceptions import USBDriverError
+from stoqdrivers.trace import WireTrace
 from stoqdrivers.utils import str2bytes
 
 # Based on python-escpos's escpos.printer.Usb:
@@ -43,6 +47,11 @@ class UsbBase(object):
     #: Out Endpoint address. Subclasses must define this.
     out_ep = None
 
+    # Nothing is read from the printer, so the ESC/POS drivers can't get
+    # the DLE EOT replies or the ASB status
+    has_realtime_status = False
+    has_asb = False
+
     def __init__(self, vendor_id, product_id, interface=0,
                  timeout=0, *args, **kwargs):
         assert has_usb
@@ -51,6 +60,7 @@ class UsbBase(object):
         self.product_id = product_id
         self.interface = interface
         self.timeout = timeout
+        self._wire_trace = WireTrace()
         assert self.out_ep is not None
         super(UsbBase, self).__init__(*args, **kwargs)
 
@@ -83,6 +93,10 @@ class UsbBase(object):
         #self.device.set_configuration()
         self.device.reset()
 
+    def get_wire_trace(self):
+        """Get the L{stoqdrivers.trace.WireTrace} of this device."""
+        return self._wire_trace
+
     def close(self):
         """Release the USB interface"""
         if self.device:
@@ -97,7 +111,16 @@ class UsbBase(object):
         """
         if not self.device:
             self.open()
-        self.device.write(self.out_ep, str2bytes(data), self.timeout)
+        data = str2bytes(data)
+        self._wire_trace.write(data)
+        try:
+            self.device.write(self.out_ep, data, self.timeout)
+        except usb.core.USBError as e:
+            if e.errno == errno.ETIMEDOUT:
+                metrics.count(self, metrics.TIMEOUTS)
+            raise
+        if metrics.enabled:
+            metrics.count(self, metrics.BYTES_OUT, len(data))
         # FIXME: we cant keep opening/closing the device, otherwise it gets
         # *really* slow to print.
         #self.close()
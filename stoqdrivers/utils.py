@@ -28,13 +28,59 @@ Functions for general use.
 """
 
 import codecs
+import datetime
+from decimal import Decimal
 from importlib import import_module
+import importlib.util
+import json
+import os
 import unicodedata
 
 GRAPHICS_8BITS = 8
 GRAPHICS_24BITS = 24
 
 
+class _TranslateTable(dict):
+    # Maps the ordinals of the characters to their encoded form, as returned
+    # by bytes2str. Characters are encoded the first time they are seen.
+    def __init__(self, encoding):
+        dict.__init__(self)
+        self.encoding = encoding
+
+    def __missing__(self, ordinal):
+        char = chr(ordinal)
+        if self.encoding == "ascii":
+            char = unicodedata.normalize("NFKD", char)
+        value = self[ordinal] = bytes2str(
+            codecs.encode(char, self.encoding, "ignore"))
+        return value
+
+
+_translate_tables = {}
+
+
+def _get_translate_table(encoding):
+    table = _translate_tables.get(encoding)
+    if table is None:
+        # Only encodings that encode each character on its own, and ascii as
+        # ascii, can be encoded character by character (i.e. not utf-16)
+        try:
+            encoded = codecs.encode('ascii', encoding)
+        except LookupError:
+            # Might be registered later, don't cache it
+            return None
+        except TypeError:
+            encoded = None
+        if encoded == b'ascii':
+            table = _TranslateTable(encoding)
+        else:
+            table = False
+        _translate_tables[encoding] = table
+    if table is False:
+        return None
+    return table
+
+
 def encode_text(text, encoding):
     """ Converts the string 'text' to encoding 'encoding' and optionally
     normalizes the string (currently only for ascii)
@@ -45,6 +91,14 @@ def encode_text(text, encoding):
     @type text:        str
     @returns:          converted text
     """
+    table = _get_translate_table(encoding)
+    if table is not None:
+        if text.isascii():
+            return text
+        # Use the cached encoding of each character, already converted with
+        # bytes2str (see below)
+        return text.translate(table)
+
     if encoding == "ascii":
         text = unicodedata.normalize("NFKD", text)
     # If we use text.encode we will get this sometimes:
@@ -75,11 +129,12 @@ def decode_text(text, encoding):
 def str2bytes(text):
     if isinstance(text, bytes):
         return text
-    return bytes(ord(i) for i in text)
+    # Each character is a byte, as returned by bytes2str
+    return text.encode('latin-1')
 
 
 def bytes2str(data):
-    return ''.join(chr(i) for i in data)
+    return bytes(data).decode('latin-1')
 
 
 def bits2byte(bits):
@@ -124,9 +179,109 @@ def matrix2graphics(graphics_api, matrix, max_cols, multiplier=1, centralized=Tr
         yield ''.join(chr(b) for b in bytes_), int(len(bytes_) / divide_len_by)
 
 
+def matrix2raster(matrix):
+    """Convert a matrix to raster format: the rows from top to bottom, each
+    one padded to a whole number of bytes, the leftmost dot being the most
+    significant bit.
+
+    :returns: the width and height in dots and the data
+    """
+    width = len(matrix[0])
+    bytes_ = []
+    for row in matrix:
+        row = list(row) + [False] * (-width % 8)
+        for i in range(0, len(row), 8):
+            bytes_.append(bits2byte(row[i:i + 8]))
+    return width, len(matrix), ''.join(chr(b) for b in bytes_)
+
+
+def matrix2columns(matrix):
+    """Convert a matrix to column format: the columns from left to right,
+    each one from top to bottom, the topmost dot being the most significant
+    bit. The matrix is padded to a multiple of 8 dots in both directions.
+
+    :returns: the width and height in bytes (8 dots) and the data
+    """
+    width = len(matrix[0])
+    height = len(matrix)
+    rows = [list(row) for row in matrix]
+    rows.extend([[False] * width] * (-height % 8))
+    bytes_ = []
+    for j in range(width + (-width % 8)):
+        column = [row[j] if j < width else False for row in rows]
+        for i in range(0, len(column), 8):
+            bytes_.append(bits2byte(column[i:i + 8]))
+    return ((width + 7) // 8, (height + 7) // 8,
+            ''.join(chr(b) for b in bytes_))
+
+
 def get_obj_from_module(module_name, obj_name):
     module = import_module(module_name)
     try:
         return getattr(module, obj_name)
     except AttributeError:
         raise ImportError("Can't find class %s for module %s" % (module_name, module_name))
+
+
+def get_resource_filename(package, resource):
+    """Get the filename of a file or directory shipped with a package.
+
+    This is what pkg_resources.resource_filename does, without the cost of
+    importing pkg_resources.
+
+    @returns: the filename or None if the resource does not exist
+    """
+    try:
+        from importlib.resources import files
+    except ImportError:
+        # Python < 3.9
+        spec = importlib.util.find_spec(package)
+        if spec is None or not spec.origin:
+            return None
+        filename = os.path.join(os.path.dirname(spec.origin), resource)
+    else:
+        filename = str(files(package).joinpath(resource))
+    if not os.path.exists(filename):
+        return None
+    return filename
+
+
+def _json_default(obj):
+    if isinstance(obj, Decimal):
+        return {'__decimal__': str(obj)}
+    elif isinstance(obj, datetime.datetime):
+        return {'__datetime__': obj.isoformat()}
+    elif isinstance(obj, datetime.date):
+        return {'__date__': obj.isoformat()}
+    elif isinstance(obj, bytes):
+        return {'__bytes__': bytes2str(obj)}
+    raise TypeError("%r is not JSON serializable" % (obj, ))
+
+
+def _json_object_hook(obj):
+    if len(obj) != 1:
+        return obj
+    key, value = list(obj.items())[0]
+    if key == '__decimal__':
+        return Decimal(value)
+    elif key == '__datetime__':
+        return datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+    elif key == '__date__':
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    elif key == '__bytes__':
+        return str2bytes(value)
+    return obj
+
+
+def json_dumps(obj):
+    """Serialize obj to a single line of JSON.
+
+    Decimals, dates and bytes, which are common in driver arguments and
+    replies, are preserved and restored by L{json_loads}.
+    """
+    return json.dumps(obj, default=_json_default, separators=(',', ':'))
+
+
+def json_loads(data):
+    """Deserialize a string created by L{json_dumps}."""
+    return json.loads(data, object_hook=_json_object_hook)
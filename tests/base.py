@@ -1,4 +1,5 @@
 import os
+import time
 import unittest
 
 from zope.interface import implementer
@@ -11,11 +12,27 @@ from stoqdrivers.serialbase import SerialPort
 # The directory where tests data will be stored
 RECORDER_DATA_DIR = "data"
 
+# A configuration without any device, see create_device
+EMPTY_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'stoqdrivers-empty.conf')
+
+# How PlaybackPort replays the device timing: 'instant' (the default),
+# 'recorded', or a number scaling the recorded delays (e.g. 0.5 replays
+# twice as fast)
+PLAYBACK_MODE_ENV = 'STOQDRIVERS_PLAYBACK'
+
+PLAYBACK_INSTANT = 'instant'
+PLAYBACK_RECORDED = 'recorded'
+
 
 @implementer(ISerialPort)
 class LogSerialPort:
     """ A decorator for the SerialPort object expected by the driver to test,
     responsible for log all the bytes read/written.
+
+    Each reply is preceded by a D line with the device think-time (from the
+    end of the last write to the first byte read) and the time spent
+    receiving the whole reply, in seconds.
     """
 
     def __init__(self, port):
@@ -23,6 +40,9 @@ class LogSerialPort:
         self._bytes = []
         self._last = None
         self._buffer = b''
+        self._written = None
+        self._first_read = None
+        self._last_read = None
 
     def setDTR(self):
         return self._port.setDTR()
@@ -56,37 +76,79 @@ class LogSerialPort:
 
     def read(self, n_bytes=1):
         data = self._port.read(n_bytes)
+        if data:
+            now = time.monotonic()
+            if not self._buffer:
+                self._first_read = now
+            self._last_read = now
         self._buffer += data
         self._last = 'R'
         return data
 
+    def _flush_reply(self):
+        if not self._buffer:
+            return
+        think_time = self._first_read - (self._written or self._first_read)
+        self._bytes.append(('D', '%.6f %.6f' % (
+            think_time, self._last_read - self._first_read)))
+        self._bytes.append(('R', self._buffer))
+        self._buffer = b''
+
     def write(self, bytes):
         if self._last == 'R':
-            self._bytes.append(('R', self._buffer))
-            self._buffer = ''
+            self._flush_reply()
 
         self._bytes.append(('W', bytes))
         self._port.write(bytes)
+        self._written = time.monotonic()
         self._last = 'W'
 
     def save(self, filename):
-        if self._buffer:
-            self._bytes.append(('R', self._buffer))
+        self._flush_reply()
         fd = open(filename, "w")
         for type, line in self._bytes:
-            fd.write("%s %s\n" % (type, repr(line)[2:-1]))
+            if type == 'D':
+                fd.write("D %s\n" % line)
+            else:
+                fd.write("%s %s\n" % (type, repr(line)[2:-1]))
         fd.close()
 
 
 @implementer(ISerialPort)
 class PlaybackPort:
+    """ Replay the data recorded by L{LogSerialPort}.
 
-    def __init__(self, datafile):
+    @param mode: PLAYBACK_INSTANT to reply as soon as the data is read,
+      PLAYBACK_RECORDED to reply with the recorded device timing, or a
+      number scaling the recorded timing. Defaults to the value of the
+      STOQDRIVERS_PLAYBACK environment variable, or PLAYBACK_INSTANT.
+
+    When replaying the timing, a read blocks until the bytes it asks for
+    would have been received from the device, or for I{timeout} seconds
+    (when set by the driver, like on a real port), returning what arrived
+    so far.
+    """
+
+    timeout = None
+
+    def __init__(self, datafile, mode=None):
         self._input = []
-        self._output = b''
+        # A list of [think time, transfer time, data, bytes already read]
+        self._replies = []
+        self._written = time.monotonic()
         self._datafile = datafile
+        self._scale = self._get_scale(mode)
         self._load_data(datafile)
 
+    def _get_scale(self, mode):
+        if mode is None:
+            mode = os.environ.get(PLAYBACK_MODE_ENV) or PLAYBACK_INSTANT
+        if mode == PLAYBACK_INSTANT:
+            return None
+        elif mode == PLAYBACK_RECORDED:
+            return 1.0
+        return float(mode)
+
     def setDTR(self):
         pass
 
@@ -103,12 +165,51 @@ class PlaybackPort:
                              "FILE:     %s\n"
                              "EXPECTED: %r\n"
                              "GOT:      %r\n" % (self._datafile, data, bytes_))
+        self._written = time.monotonic()
+
+    def _wait_for(self, reply, n_bytes):
+        # Sleep until n_bytes of the reply are available, or the timeout
+        # expires. Returns how many bytes are available.
+        think_time, transfer_time, data, offset = reply
+        wanted = min(offset + n_bytes, len(data))
+        arrival = think_time
+        if len(data) > 1:
+            arrival += transfer_time * (wanted - 1) / (len(data) - 1)
+        deadline = self._written + arrival * self._scale
+        now = time.monotonic()
+        if self.timeout is not None and deadline - now > self.timeout:
+            time.sleep(self.timeout)
+            # Only what arrived before the timeout
+            elapsed = (time.monotonic() - self._written) / self._scale - think_time
+            if elapsed < 0:
+                return 0
+            if transfer_time > 0 and len(data) > 1:
+                wanted = min(wanted, int(elapsed / transfer_time *
+                                         (len(data) - 1)) + 1)
+            return max(wanted - offset, 0)
+        if deadline > now:
+            time.sleep(deadline - now)
+        return wanted - offset
 
     def read(self, n_bytes=1):
-        data = self._output[:n_bytes]
+        data = b''
+        while self._replies and len(data) < n_bytes:
+            reply = self._replies[0]
+            needed = n_bytes - len(data)
+            if self._scale is not None:
+                needed = self._wait_for(reply, needed)
+                if not needed:
+                    break
+            offset = reply[3]
+            data += reply[2][offset:offset + needed]
+            reply[3] = offset + needed
+            if reply[3] >= len(reply[2]):
+                self._replies.pop(0)
+            if self._scale is not None:
+                # Never join the bytes of two replies in the same read
+                break
         if not data:
             return None
-        self._output = self._output[n_bytes:]
         return data
 
     def _convert_data(self, data):
@@ -136,19 +237,74 @@ class PlaybackPort:
 
     def _load_data(self, datafile):
         fd = open(datafile, "rb")
+        timing = (0.0, 0.0)
         for n, line in enumerate(fd.readlines()):
+            if line.startswith(b"D"):
+                # The transfer time is optional
+                timing = tuple(float(v) for v in line[2:].split() + [0])[:2]
+                continue
+
             data = self._convert_data(line[2:-1])
 
             if line.startswith(b"W"):
                 self._input.extend(data)
             elif line.startswith(b"R"):
-                self._output += data
+                think_time, transfer_time = timing
+                self._replies.append([think_time, transfer_time, data, 0])
+                timing = (0.0, 0.0)
             else:
                 raise TypeError("Unrecognized entry type at %s:%d: %r"
                                 % (datafile, n + 1, line[0]))
         fd.close()
 
 
+@implementer(ISerialPort)
+class FakePort:
+    """ A port recording everything written to it, which replies with
+    I{reply} and then nothing.
+    """
+
+    def __init__(self, reply=b''):
+        self.written = b''
+        self.reply = reply
+
+    def write(self, data):
+        self.written += data
+
+    def read(self, n_bytes=1):
+        data, self.reply = self.reply[:n_bytes], self.reply[n_bytes:]
+        return data
+
+
+class PipePort(FakePort):
+    """ A L{FakePort} that can be watched by a
+    L{stoqdrivers.listener.DeviceListener}: the data given to L{push} is
+    read from its fileno().
+    """
+
+    def __init__(self):
+        FakePort.__init__(self)
+        self.read_fd, self.write_fd = os.pipe()
+
+    def fileno(self):
+        return self.read_fd
+
+    def push(self, data):
+        os.write(self.write_fd, data)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+def create_device(device_class, brand, model, port, **kwargs):
+    """ Create a device on a fake port. The stoqdrivers.conf of the user is
+    not read, so it can't change the brand, model or device.
+    """
+    kwargs.setdefault('config_file', EMPTY_CONFIG)
+    return device_class(brand=brand, model=model, port=port, **kwargs)
+
+
 class _BaseTest(unittest.TestCase):
     def __init__(self, test_name):
         self._test_name = test_name
@@ -0,0 +1,100 @@
+import unittest
+
+from stoqdrivers.escpos import (AsbFramer, EVENT_COVER_OPEN,
+                                EVENT_DRAWER_OPEN, EVENT_PAPER_NEAR_END,
+                                EVENT_PAPER_OUT, parse_asb)
+from stoqdrivers.exceptions import DriverError
+from stoqdrivers.listener import DeviceListener
+from stoqdrivers.printers.nonfiscal import NonFiscalPrinter
+
+from tests.base import PipePort, create_device
+
+# Online, drawer pin low, paper present
+_ASB_OK = b'\x10\x00\x00\x00'
+# Drawer pin high, paper near end
+_ASB_NEAR_END = b'\x14\x00\x03\x00'
+# Drawer pin high, cover open, paper out
+_ASB_PAPER_OUT = b'\x34\x00\x0f\x00'
+
+
+class TestAsbFramer(unittest.TestCase):
+    def test_feed(self):
+        framer = AsbFramer()
+        # A DLE EOT reply and a partial message
+        self.assertEqual(framer.feed(b'\x12' + _ASB_OK[:2]), [])
+        self.assertEqual(framer.feed(_ASB_OK[2:] + _ASB_PAPER_OUT),
+                         [_ASB_OK, _ASB_PAPER_OUT])
+        # Noise is skipped
+        self.assertEqual(framer.feed(b'\xff\x10\x80' + _ASB_NEAR_END),
+                         [_ASB_NEAR_END])
+
+    def test_parse(self):
+        status = parse_asb(_ASB_PAPER_OUT)
+        self.assertTrue(status.drawer_pin_high)
+        self.assertTrue(status.cover_open)
+        self.assertTrue(status.paper_near_end)
+        self.assertTrue(status.paper_end)
+        self.assertFalse(status.offline)
+        self.assertFalse(status.has_error)
+
+
+class TestAutomaticStatusBack(unittest.TestCase):
+    def setUp(self):
+        self.port = PipePort()
+        self.printer = create_device(NonFiscalPrinter, 'elgin', 'I9',
+                                     self.port)
+        self.driver = self.printer._driver
+        self.listener = DeviceListener()
+        self.events = []
+        self.printer.subscribe_status(
+            lambda event, value, status: self.events.append((event, value)))
+        self.port.written = b''
+        self.printer.enable_asb(self.listener)
+
+    def tearDown(self):
+        self.printer.disable_asb()
+        self.listener.close()
+        self.port.close()
+
+    def _push(self, data):
+        self.port.push(data)
+        self.listener.run_once(timeout=5)
+
+    def test_events(self):
+        self.assertEqual(self.port.written, b'\x1da\x0f')
+        self.assertIsNone(self.driver.get_asb_status())
+
+        self._push(_ASB_OK)
+        # The first status notifies everything
+        self.assertEqual(len(self.events), 6)
+        self.assertIn((EVENT_DRAWER_OPEN, True), self.events)
+        self.assertIn((EVENT_PAPER_OUT, False), self.events)
+
+        del self.events[:]
+        self._push(_ASB_NEAR_END)
+        self.assertEqual(self.events, [(EVENT_DRAWER_OPEN, False),
+                                       (EVENT_PAPER_NEAR_END, True)])
+
+        del self.events[:]
+        self._push(_ASB_PAPER_OUT)
+        self.assertEqual(self.events, [(EVENT_COVER_OPEN, True),
+                                       (EVENT_PAPER_OUT, True)])
+
+    def test_drawer_is_cached(self):
+        self._push(_ASB_OK)
+        self.port.written = b''
+        self.assertTrue(self.printer.is_drawer_open())
+        self._push(_ASB_NEAR_END)
+        self.assertFalse(self.driver.is_drawer_open())
+
+        self.driver.inverted_drawer = True
+        self.assertTrue(self.printer.is_drawer_open())
+        # The printer was never asked
+        self.assertEqual(self.port.written, b'')
+
+    def test_no_polling(self):
+        self.assertIsNone(self.printer.poll_status())
+        self.assertRaises(DriverError, self.driver.get_realtime_status)
+        self.printer.disable_asb()
+        self.assertFalse(self.driver.is_asb_enabled())
+        self.assertTrue(self.port.written.endswith(b'\x1da\x00'))
@@ -0,0 +1,122 @@
+from decimal import Decimal
+import unittest
+
+from stoqdrivers.enum import UnitType
+from stoqdrivers.exceptions import CapabilityError
+from stoqdrivers.printers.capabilities import Capability
+from stoqdrivers.printers.fiscal import CouponViolation, FiscalPrinter
+
+from tests.base import FakePort, create_device
+
+
+class _FakeDriver:
+    coupon_printer_charset = 'ascii'
+
+    def get_capabilities(self):
+        return dict(
+            item_code=Capability(min_len=3, max_len=13),
+            item_price=Capability(digits=6, decimals=2),
+            item_description=Capability(max_len=10),
+            payment_value=Capability(digits=12, decimals=2),
+            payment_description=Capability(max_len=5),
+            promotional_message=Capability(max_len=20),
+            customer_name=Capability(max_len=30),
+            customer_id=Capability(max_len=4),
+            customer_address=Capability(),
+        )
+
+
+class TestCapability(unittest.TestCase):
+    def test_string(self):
+        validate = Capability(min_len=2, max_len=4).get_validator()
+        self.assertIsNone(validate('abc'))
+        self.assertEqual(validate('abcde'),
+                         "the value can't be greater than 4 characters")
+        self.assertEqual(validate('a'), "the value can't be less than 2 characters")
+        self.assertEqual(validate(1), "the value must be a string")
+
+    def test_number(self):
+        capability = Capability(min_size=1, digits=2, decimals=1)
+        validate = capability.get_validator()
+        self.assertIs(validate, capability.get_validator())
+        self.assertIsNone(validate(Decimal('99.9')))
+        self.assertIsNone(validate(1))
+        self.assertIsNotNone(validate(Decimal('100')))
+        self.assertIsNotNone(validate(0.5))
+        self.assertIsNotNone(validate('1'))
+        self.assertRaises(CapabilityError, capability.check_value, 100)
+
+    def test_unlimited(self):
+        self.assertIsNone(Capability().get_validator()(object()))
+
+
+class TestValidateCoupon(unittest.TestCase):
+    def setUp(self):
+        self.printer = create_device(FiscalPrinter, 'bematech', 'MP25',
+                                     FakePort())
+        self.printer._driver = _FakeDriver()
+        self.printer._capabilities = self.printer._driver.get_capabilities()
+        self.printer._charset = 'ascii'
+
+    def test_valid(self):
+        self.assertEqual(self.printer.validate_coupon(
+            [('123', 'Item', Decimal(10), 'TN'),
+             dict(item_code='456', item_description='Other', item_price=5.5,
+                  taxcode='TN', items_quantity=Decimal(2))],
+            [('M', Decimal(21))], discount=Decimal(0.5),
+            customer=('Customer', 'Address', '123'),
+            promotional_message='Thanks'), [])
+
+    def test_violations(self):
+        violations = self.printer.validate_coupon(
+            [('1', 'Very long description', Decimal(10), 'TN'),
+             dict(item_code='456', item_description='Other',
+                  item_price=Decimal(1000000), taxcode='TN',
+                  unit=UnitType.CUSTOM),
+             ('789', )],
+            [('M', Decimal(5), 'Money')],
+            customer=('Customer', 'Address', '12345'),
+            promotional_message='x' * 21)
+        self.assertEqual([v[:3] for v in violations], [
+            ('customer', None, 'customer_id'),
+            ('items', 0, 'item_code'),
+            ('items', 0, 'item_description'),
+            ('items', 1, 'item_price'),
+            ('items', 1, None),
+            ('items', 2, None),
+            ('payments', None, None),
+            ('close', None, 'promotional_message'),
+        ])
+        self.assertEqual(violations[1], CouponViolation(
+            'items', 0, 'item_code', "the value can't be less than 3 characters"))
+
+    def test_encoded_length(self):
+        # The length is checked after encoding the text for the printer
+        violations = self.printer.validate_coupon(
+            [('123', 'Descrição', Decimal(10), 'TN')], [('M', Decimal(10))])
+        self.assertEqual(violations, [])
+        violations = self.printer.validate_coupon(
+            [('123', 'ﬁﬁﬁﬁﬁ ﬁ', Decimal(10), 'TN')], [('M', Decimal(10))])
+        self.assertEqual([v.field for v in violations], ['item_description'])
+
+    def test_fractional_quantity(self):
+        printer = create_device(FiscalPrinter, 'bematech', 'MP25',
+                                FakePort())
+        violations = printer.validate_coupon(
+            [dict(item_code='123', item_description='Cheese',
+                  item_price=Decimal(10), taxcode='TN',
+                  items_quantity=Decimal('0.5'), unit=UnitType.WEIGHT),
+             dict(item_code='456', item_description='Ham',
+                  item_price=Decimal(10), taxcode='TN',
+                  items_quantity=Decimal('0.0005'), unit=UnitType.WEIGHT)],
+            [('M', Decimal(10))])
+        self.assertEqual([v[:3] for v in violations],
+                         [('items', 1, 'items_quantity')])
+
+    def test_totals(self):
+        violations = self.printer.validate_coupon(
+            [], [], discount=Decimal(1))
+        self.assertEqual([v[:3] for v in violations],
+                         [('items', None, None),
+                          ('totalize', None, 'discount'),
+                          ('payments', None, None)])
@@ -0,0 +1,45 @@
+import datetime
+from decimal import Decimal
+import unittest
+
+from stoqdrivers.printers.bematech.DP20C import DP20C
+from stoqdrivers.printers.cheque import Cheque, _banks_cache
+from stoqdrivers.printers.dataregis.EP375 import EP375
+
+from tests.base import FakePort
+
+
+class TestChequeBanks(unittest.TestCase):
+    def setUp(self):
+        self.port = FakePort()
+        self.printer = DP20C(self.port)
+
+    def test_banks_are_cached(self):
+        banks = self.printer.get_banks()
+        self.assertEqual(banks[1].name, 'Banco do Brasil')
+        other = DP20C(FakePort()).get_banks()
+        self.assertIsNot(banks, other)
+        self.assertIs(banks[1], other[1])
+        self.assertEqual(len([f for f in _banks_cache if f.endswith('bematech.ini')]), 1)
+
+    def test_positions_are_precompiled(self):
+        bank = self.printer.get_banks()[1]
+        # The payload was compiled by get_banks
+        self.assertEqual(bank._payloads['DP20C'], '3222340729621295')
+        # and is compiled separately for each driver class
+        ep375 = EP375(FakePort(), None)
+        payload = ep375._get_positions(bank)
+        self.assertEqual(payload, '02920423071009121162')
+
+    def test_print_cheques(self):
+        bank = self.printer.get_banks()[1]
+        date = datetime.datetime(2026, 10, 19)
+        self.printer.print_cheques([
+            Cheque(bank, Decimal('10.5'), 'Supplier 1', 'Sao Carlos', date),
+            Cheque(bank, Decimal('20'), 'Supplier 2', 'Sao Carlos', date)])
+        written = self.port.written
+        # The coordinates were sent only once
+        self.assertEqual(written.count(b'\x1b\xaa987? '), 1)
+        self.assertIn(b'\x1b\xa310,50\r', written)
+        self.assertIn(b'\x1b\xa320,00\r', written)
+        self.assertEqual(written.count(b'\x1b\xb1\x1b\xb0'), 2)
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from stoqdrivers import configparser
+from stoqdrivers.configparser import StoqdriversConfig
+from stoqdrivers.exceptions import ConfigError
+
+
+class TestStoqdriversConfig(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'stoqdrivers.conf')
+        self._write('[Printer]\nbrand = epson\ninverted_drawer = yes\n', 1000)
+        self.changed = []
+        configparser.add_change_callback(self.changed.append)
+
+    def tearDown(self):
+        configparser.remove_change_callback(self.changed.append)
+        configparser.clear_cache()
+        shutil.rmtree(self.directory)
+
+    def _write(self, data, mtime):
+        with open(self.filename, 'w') as fp:
+            fp.write(data)
+        os.utime(self.filename, (mtime, mtime))
+
+    def test_typed_values(self):
+        config = StoqdriversConfig(self.filename)
+        self.assertEqual(config.get_option('inverted_drawer', 'Printer'), 'yes')
+        self.assertIs(config.get_value('inverted_drawer', 'Printer'), True)
+        self.assertEqual(config.get_value('brand', 'Printer'), 'epson')
+        self.assertIs(config.get_bool('other', 'Printer', False), False)
+        self.assertRaises(ConfigError, config.get_value, 'model', 'Printer')
+        self.assertRaises(ConfigError, config.get_bool, 'brand', 'Printer')
+        self.assertRaises(ConfigError, config.get_value, 'brand', 'Scale')
+
+    def test_no_interpolation(self):
+        self._write('[fiscnet]\ncash_supply = SUP%\n[Printer]\nBrand = x\n',
+                    1000)
+        config = StoqdriversConfig(self.filename)
+        self.assertEqual(config.get_option('cash_supply', 'fiscnet'), 'SUP%')
+        self.assertEqual(config.get_value('cash_supply', 'fiscnet'), 'SUP%')
+        self.assertEqual(config.config.get('fiscnet', 'cash_supply'), 'SUP%')
+        self.assertEqual(config.get_option('Brand', 'Printer'), 'x')
+        self.assertTrue(config.has_option('brand', 'Printer'))
+
+    def test_parse_error(self):
+        self._write('brand = epson\n', 1000)
+        self.assertRaises(ConfigError, StoqdriversConfig, self.filename)
+
+    def test_cache(self):
+        config = StoqdriversConfig(self.filename)
+        self.assertIs(StoqdriversConfig(self.filename)._parsed, config._parsed)
+        # Nothing is parsed again to read the options
+        self.assertIs(config._values, config._parsed.values)
+        self.assertEqual(config.get_option('brand', 'Printer'), 'epson')
+        self.assertTrue(config.has_section('Printer'))
+        self.assertIsNone(config._config)
+
+        # Same mtime, the cached version is still used
+        self._write('[Printer]\nbrand = bematech\n', 1000)
+        self.assertEqual(
+            StoqdriversConfig(self.filename).get_option('brand', 'Printer'),
+            'epson')
+        self.assertEqual(self.changed, [])
+
+        self._write('[Printer]\nbrand = bematech\n', 2000)
+        self.assertEqual(
+            StoqdriversConfig(self.filename).get_option('brand', 'Printer'),
+            'bematech')
+        self.assertEqual(self.changed, [os.path.realpath(self.filename)])
+
+    def test_reload(self):
+        config = StoqdriversConfig(self.filename)
+        self._write('[Printer]\nbrand = daruma\n', 1000)
+        config.reload()
+        self.assertEqual(config.get_option('brand', 'Printer'), 'daruma')
+        self.assertEqual(self.changed, [os.path.realpath(self.filename)])
+
+        # Nothing changed, nobody is notified
+        config.reload()
+        self.assertEqual(len(self.changed), 1)
+
+        os.unlink(self.filename)
+        self.assertRaises(ConfigError, config.reload)
+
+    def test_instances_are_independent(self):
+        config = StoqdriversConfig(self.filename)
+        other = StoqdriversConfig(self.filename)
+        config.set_option('model', 'Printer', 'TM-T20')
+        self.assertEqual(config.get_option('model', 'Printer'), 'TM-T20')
+        self.assertEqual(config.get_value('model', 'Printer'), 'TM-T20')
+        self.assertFalse(other.has_option('model', 'Printer'))
+        self.assertRaises(ConfigError, other.get_value, 'model', 'Printer')
+        self.assertFalse(
+            StoqdriversConfig(self.filename).has_option('model', 'Printer'))
+
+    def test_new_file_is_found(self):
+        home = os.path.join(self.directory, 'home')
+        etc = os.path.join(self.directory, 'etc')
+        os.mkdir(home)
+        os.mkdir(etc)
+
+        class _Config(StoqdriversConfig):
+            def _get_search_paths(self):
+                return home, etc, etc
+
+        shutil.move(self.filename, etc)
+        self.assertEqual(_Config().get_value('brand', 'Printer'), 'epson')
+        # Created later, in a path that comes first
+        with open(os.path.join(home, 'stoqdrivers.conf'), 'w') as fp:
+            fp.write('[Printer]\nbrand = bematech\n')
+        self.assertEqual(_Config().get_value('brand', 'Printer'), 'bematech')
@@ -0,0 +1,141 @@
+import asyncio
+from decimal import Decimal
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from stoqdrivers.daemon.client import DaemonClient
+from stoqdrivers.daemon.protocol import DaemonError
+from stoqdrivers.daemon.server import PrintServer
+from stoqdrivers.exceptions import OutofPaperError
+from stoqdrivers.spooler import get_spooler
+
+
+class _FakePrinter:
+    device = '/dev/fake-daemon'
+
+    def __init__(self):
+        self.lines = []
+        self.columns = 48
+
+    @property
+    def max_characters(self):
+        return self.columns
+
+    def print_line(self, data):
+        self.lines.append(data)
+
+    def cut_paper(self):
+        self.lines.append('<cut>')
+
+    def get_total(self):
+        return Decimal('10.50')
+
+    def fail(self):
+        raise OutofPaperError('No paper')
+
+    def get_object(self):
+        return object()
+
+    def _private(self):
+        pass
+
+    def recover_from_journal(self):
+        self.lines.append('<recovered>')
+
+
+class TestPrintDaemon(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.printer = _FakePrinter()
+        self.server = PrintServer({'receipt': self.printer},
+                                  os.path.join(self.directory, 'daemon.sock'))
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.server.start())
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.client = DaemonClient(self.server.path, timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        asyncio.run_coroutine_threadsafe(self.server.close(),
+                                         self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        shutil.rmtree(self.directory)
+
+    def test_call(self):
+        self.assertEqual(self.client.get_devices(), ['receipt'])
+        printer = self.client.get_printer('receipt')
+        self.assertEqual(printer.max_characters, 48)
+        printer.print_line(b'foo')
+        self.assertEqual(self.printer.lines, [b'foo'])
+        self.assertEqual(printer.get_total(), Decimal('10.50'))
+        self.assertRaises(OutofPaperError, printer.fail)
+        self.assertRaises(AttributeError, getattr, printer, '_private')
+        self.assertRaises(AttributeError, getattr, printer,
+                          'recover_from_journal')
+        self.assertRaises(DaemonError, self.client.get_printer, 'other')
+        # Results that can't be sent are errors
+        self.assertRaises(DaemonError, printer.get_object)
+
+    def test_callback_errors(self):
+        def callback(event):
+            raise ValueError(event)
+        self.client.subscribe(callback)
+        printer = self.client.get_printer('receipt')
+        printer.print_line('foo')
+        self.assertEqual(printer.get_total(), Decimal('10.50'))
+
+    def test_attributes_are_current(self):
+        printer = self.client.get_printer('receipt')
+        self.printer.columns = 64
+        self.assertEqual(printer.max_characters, 64)
+
+    def test_pending_calls_are_batched(self):
+        printer = self.client.get_printer('receipt')
+        spooler = get_spooler(self.printer)
+        jobs_done = spooler.get_metrics()['jobs_done']
+        blocker = threading.Event()
+        spooler.submit(blocker.wait, 5)
+        futures = [printer.call_async('print_line', str(i)) for i in range(3)]
+        futures.append(printer.call_async('fail'))
+        futures.append(printer.call_async('print_line', '3'))
+        # Wait for the daemon to queue all the calls
+        while spooler.get_queue_depth() < 2:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        blocker.set()
+        self.assertRaises(OutofPaperError, futures[3].result, 5)
+        futures[4].result(5)
+        self.assertEqual(self.printer.lines, ['0', '1', '2', '3'])
+        # The blocker and a single job for all the calls
+        self.assertEqual(spooler.get_metrics()['jobs_done'], jobs_done + 2)
+
+    def test_batch_and_events(self):
+        events = []
+        self.client.subscribe(events.append)
+        printer = self.client.get_printer('receipt')
+        with printer.batch() as batch:
+            printer.print_line('foo')
+            printer.cut_paper()
+        self.assertEqual(batch.wait(5), [None, None])
+        self.assertEqual(self.printer.lines, ['foo', '<cut>'])
+
+        with printer.batch() as batch:
+            printer.print_line('bar')
+            printer.fail()
+            printer.cut_paper()
+        self.assertRaises(OutofPaperError, batch.wait, 5)
+        # Nothing is sent after the failed call
+        self.assertEqual(self.printer.lines, ['foo', '<cut>', 'bar'])
+
+        # The events are sent right after the replies
+        printer.get_total()
+        self.assertEqual([e['event'] for e in events],
+                         ['queued', 'done', 'queued', 'failed',
+                          'queued', 'done'])
@@ -0,0 +1,86 @@
+import io
+import os
+import threading
+import unittest
+
+from stoqdrivers.escp import EscPPrinter
+
+
+class _CountingSink(io.BytesIO):
+    def __init__(self):
+        io.BytesIO.__init__(self)
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return io.BytesIO.write(self, data)
+
+
+class TestEscPPrinter(unittest.TestCase):
+    def test_page_is_written_at_once(self):
+        sink = _CountingSink()
+        printer = EscPPrinter(sink)
+        with printer.page():
+            printer.send('Relatório\n')
+            printer.set_vertical_position(180)
+            printer.send('Total\n')
+            self.assertEqual(sink.writes, 0)
+        self.assertEqual(sink.writes, 1)
+        self.assertEqual(sink.getvalue(),
+                         b'\x1b@Relat\xa2rio\n\x1bJ\xb4Total\n\x0c')
+
+    def test_print_pages(self):
+        sink = _CountingSink()
+        printer = EscPPrinter(sink)
+
+        def pages():
+            for i in range(3):
+                # Only the page being printed was composed
+                self.assertEqual(sink.writes, i)
+                yield ['Page %d\n' % i, 10, b'\x0f']
+
+        self.assertEqual(printer.print_pages(pages()), 3)
+        self.assertEqual(sink.writes, 3)
+        self.assertEqual(sink.getvalue().count(b'\x0c'), 3)
+
+    def test_page_error(self):
+        sink = _CountingSink()
+        printer = EscPPrinter(sink)
+        with self.assertRaises(ValueError):
+            with printer.page():
+                printer.send('Broken\n')
+                raise ValueError
+        with printer.page():
+            printer.send('Page\n')
+        self.assertEqual(sink.getvalue(), b'\x1b@Page\n\x0c')
+
+    def test_page_error_after_flush(self):
+        sink = _CountingSink()
+        printer = EscPPrinter(sink, max_buffer_size=16)
+        with self.assertRaises(ValueError):
+            with printer.page():
+                printer.send('x' * 20)
+                printer.send('y')
+                raise ValueError
+        self.assertEqual(sink.getvalue(), b'\x1b@' + b'x' * 20 + b'\x0c')
+
+    def test_max_buffer_size(self):
+        sink = _CountingSink()
+        printer = EscPPrinter(sink, max_buffer_size=16)
+        printer.send('x' * 20)
+        self.assertEqual(sink.writes, 1)
+        printer.done()
+        self.assertEqual(sink.getvalue(), b'\x1b@' + b'x' * 20 + b'\x1b@')
+
+    def test_pipe(self):
+        read_fd, write_fd = os.pipe()
+        received = []
+        reader = threading.Thread(
+            target=lambda: received.append(os.fdopen(read_fd, 'rb').read()))
+        reader.start()
+
+        printer = EscPPrinter(os.fdopen(write_fd, 'wb'))
+        printer.print_pages([['foo\n'], ['bar\n']])
+        printer.fp.close()
+        reader.join()
+        self.assertEqual(received, [b'\x1b@foo\n\x0cbar\n\x0c'])
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import unittest
+from urllib.request import urlopen
+
+from stoqdrivers import metrics
+from stoqdrivers.escpos import RealTimeStatus
+from stoqdrivers.exceptions import OutofPaperError
+from stoqdrivers.exporter import (CONTENT_TYPE, MetricsExporter, TextfileWriter,
+                                  start_http_server)
+from stoqdrivers.spooler import get_spooler, remove_spooler
+
+
+class _FakeDevice:
+    brand = 'fake'
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+
+    def get_spooler(self):
+        return get_spooler(self)
+
+    def get_metrics(self):
+        snapshot = metrics.snapshot(self)
+        spooler = get_spooler(self, create=False)
+        if spooler is not None:
+            snapshot['spooler'] = spooler.get_metrics()
+        return snapshot
+
+    @metrics.timed()
+    def print_line(self, data):
+        metrics.count(self, metrics.BYTES_OUT, len(data))
+
+
+class _FakeFiscal(_FakeDevice):
+    def get_serial(self):
+        return 'SERIAL "1"'
+
+    def query_status(self):
+        pass
+
+    def get_coo(self):
+        return 42
+
+    def get_crz(self):
+        return 7
+
+
+class _FakeNonFiscal(_FakeDevice):
+    def is_drawer_open(self):
+        raise OutofPaperError('No paper')
+
+
+class _FakeEscPos(_FakeDevice):
+    paper = 0
+
+    def poll_status(self):
+        self.polled = True
+
+    def get_last_status(self):
+        return RealTimeStatus(printer=0x12, offline=0x12, error=0x12,
+                              paper=self.paper, timestamp=0)
+
+
+class TestExporter(unittest.TestCase):
+    def setUp(self):
+        metrics.enable()
+        self.fiscal = _FakeFiscal('ECF', '/dev/fake-exporter-0')
+        self.nonfiscal = _FakeNonFiscal('Receipt', '/dev/fake-exporter-1')
+        self.nonfiscal.print_line(b'foo')
+        self.exporter = MetricsExporter({'ecf': self.fiscal,
+                                         'receipt': self.nonfiscal},
+                                        probe=True)
+
+    def tearDown(self):
+        metrics.disable()
+        remove_spooler(self.fiscal)
+        remove_spooler(self.nonfiscal)
+
+    def test_render(self):
+        text = self.exporter.render()
+        self.assertTrue(text.endswith('# EOF\n'))
+        ecf = 'device="ecf",brand="fake",model="ECF",serial="SERIAL \\"1\\""'
+        receipt = 'device="receipt",brand="fake",model="Receipt",serial=""'
+        lines = text.splitlines()
+        self.assertIn('stoqdrivers_fiscal_coo{%s} 42' % ecf, lines)
+        self.assertIn('stoqdrivers_fiscal_crz{%s} 7' % ecf, lines)
+        # The fiscal printer does not report its paper sensors
+        self.assertFalse([line for line in lines if line.startswith(
+            'stoqdrivers_paper_status{%s}' % ecf)])
+        self.assertIn('stoqdrivers_paper_status{%s} 0' % receipt, lines)
+        self.assertIn('stoqdrivers_up{%s} 1' % receipt, lines)
+        self.assertIn('stoqdrivers_transmit_bytes_total{%s} 3' % receipt,
+                      lines)
+        self.assertIn('stoqdrivers_command_duration_seconds_bucket'
+                      '{%s,command="print_line",le="+Inf"} 1' % receipt, lines)
+        self.assertIn('# TYPE stoqdrivers_command_duration_seconds histogram',
+                      lines)
+        self.assertIn('stoqdrivers_spooler_jobs_total{%s} 1' % ecf, lines)
+
+    def test_paper_status(self):
+        device = _FakeEscPos('I9', '/dev/fake-exporter-2')
+        exporter = MetricsExporter({'i9': device}, probe=True,
+                                   probe_interval=0)
+        try:
+            labels = 'device="i9",brand="fake",model="I9",serial=""'
+            self.assertIn('stoqdrivers_paper_status{%s} 2\n' % labels,
+                          exporter.render())
+            self.assertTrue(device.polled)
+            device.paper = 0x0c
+            self.assertIn('stoqdrivers_paper_status{%s} 1\n' % labels,
+                          exporter.render())
+            device.paper = 0x6c
+            self.assertIn('stoqdrivers_paper_status{%s} 0\n' % labels,
+                          exporter.render())
+        finally:
+            remove_spooler(device)
+
+    def test_no_probe(self):
+        def fail():
+            raise AssertionError('the device should not be queried')
+        self.fiscal.get_coo = fail
+        exporter = MetricsExporter({'ecf': self.fiscal,
+                                    'receipt': self.nonfiscal})
+        lines = exporter.render().splitlines()
+        self.assertFalse([line for line in lines if line.startswith(
+            ('stoqdrivers_fiscal_coo', 'stoqdrivers_up'))])
+        self.assertIn('stoqdrivers_transmit_bytes_total'
+                      '{device="receipt",brand="fake",model="Receipt",'
+                      'serial=""} 3', lines)
+
+    def test_probe_interval(self):
+        self.exporter.render()
+        self.fiscal.get_coo = lambda: 43
+        self.assertIn('} 42\n', self.exporter.render())
+        self.exporter.probe_interval = 0
+        self.assertIn('} 43\n', self.exporter.render())
+
+    def test_http(self):
+        server = start_http_server(self.exporter, 0)
+        try:
+            url = 'http://127.0.0.1:%d/metrics' % server.server_address[1]
+            with urlopen(url, timeout=5) as response:
+                self.assertEqual(response.headers['Content-Type'], CONTENT_TYPE)
+                self.assertTrue(response.read().endswith(b'# EOF\n'))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_textfile(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'stoqdrivers.prom')
+            TextfileWriter(self.exporter, filename).write()
+            self.assertEqual(os.listdir(directory), ['stoqdrivers.prom'])
+            with open(filename) as fp:
+                self.assertTrue(fp.read().endswith('# EOF\n'))
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,94 @@
+import unittest
+
+from stoqdrivers.exceptions import OutofPaperError
+from stoqdrivers.printers.epson.FBII import (ACK, ETX, FLD, INTERMEDIATE_ID, STX,
+                                             FBII, escape, unescape)
+
+
+class _FBIIStandIn:
+    """A stand-in for the printer side of the FBII protocol.
+
+    @ivar errors: maps a command (like '0E02') to a list of the reply status
+      of each time it is received. Missing or empty means success.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.errors = {}
+        self.violations = []
+        self.fields = {}
+        self._output = b''
+        self._waiting_ack = False
+
+    def write(self, data):
+        data = data.decode('latin1')
+        if data == ACK:
+            if not self._waiting_ack:
+                self.violations.append('unexpected ACK')
+            self._waiting_ack = False
+            return
+        if self._waiting_ack:
+            self.violations.append('frame sent before acknowledging a reply')
+        assert data[0] == STX
+        command_id = data[1]
+        fields = unescape(data[2:data.rindex(ETX)]).split(FLD)
+        command = '%02X%02X' % (ord(fields[0][0]), ord(fields[0][1]))
+        args = fields[2:]
+        self.commands.append((command, args))
+
+        status = '0000'
+        if self.errors.get(command):
+            status = self.errors[command].pop(0)
+        fields = self.fields.get(command, lambda args: [])(args)
+        reply = (STX + command_id + '\x00\x00' + FLD + '\x00\x00' + FLD +
+                 FLD + escape(chr(int(status[:2], 16)) + chr(int(status[2:], 16))) +
+                 FLD + FLD + FLD.join(escape(f) for f in fields) + ETX)
+        reply += '%04X' % sum(ord(c) for c in reply)
+        intermediate = STX + INTERMEDIATE_ID + ETX
+        intermediate += '%04X' % sum(ord(c) for c in intermediate)
+        self._output += (ACK + intermediate + reply).encode('latin1')
+        self._waiting_ack = True
+
+    def read(self, n_bytes=1):
+        data, self._output = self._output[:n_bytes], self._output[n_bytes:]
+        return data
+
+
+class TestFBIIPipeline(unittest.TestCase):
+    def setUp(self):
+        self.port = _FBIIStandIn()
+        self.printer = FBII(self.port)
+
+    def test_report_text(self):
+        self.printer.gerencial_report_print('first\n\n' + 'x' * 60)
+        self.assertEqual(self.port.commands,
+                         [('0E02', ['first']), ('0E02', ['']),
+                          ('0E02', ['x' * 56]), ('0E02', ['x' * 4])])
+        self.assertEqual(self.port.violations, [])
+
+    def test_error_attribution(self):
+        self.port.errors['0E02'] = ['0000', '0304']
+        self.assertRaises(OutofPaperError, self.printer.gerencial_report_print,
+                          'a\nb\nc\nd')
+        # The third line was in flight when the error was found
+        self.assertEqual(len(self.port.commands), 3)
+        self.assertEqual(self.port.violations, [])
+
+        # The link is still in sync
+        self.printer.gerencial_report_close()
+        self.assertEqual(self.port.commands[-1], ('0E06', []))
+        self.assertEqual(self.port.violations, [])
+
+    def test_payment_constants(self):
+        self.port.errors['050D'] = ['0000', '090C'] * 10
+        self.port.fields['050D'] = lambda args: ['Method %s' % args[0], 'N']
+        self.assertEqual(self.printer.get_payment_constants(),
+                         [('%d' % i, 'Method %d' % i) for i in range(1, 20, 2)])
+        self.assertEqual(self.port.violations, [])
+
+    def test_setup_constants(self):
+        self.printer._setup_constants()
+        self.assertEqual([c for c, args in self.port.commands],
+                         ['050C'] * 6 + ['0540'] * 7)
+        self.assertEqual(self.port.commands[2], ('050C', ['04', 'Cartao credito']))
+        self.assertEqual(self.port.violations, [])
@@ -0,0 +1,169 @@
+from decimal import Decimal
+import shutil
+import tempfile
+import unittest
+
+from stoqdrivers.printers.fiscal import FiscalPrinter
+from stoqdrivers.printers.journal import (RECOVERY_CANCELLED, RECOVERY_CLOSED,
+                                          RECOVERY_RESUMED)
+
+from tests.base import FakePort, create_device
+
+
+class _FakeDriver:
+    """Just enough of a coupon printer to exercise the journal"""
+
+    def __init__(self):
+        self.coo = 10
+        self.is_open = False
+        self.items = 0
+        self.customer = None
+        self.fail_next_item = False
+
+    def get_serial(self):
+        return 'FAKE 01'
+
+    def get_coo(self):
+        return self.coo
+
+    def has_open_coupon(self):
+        return self.is_open
+
+    def coupon_identify_customer(self, name, address, document):
+        self.customer = name
+
+    def coupon_open(self):
+        self.coo += 1
+        self.is_open = True
+
+    def coupon_add_item(self, *args, **kwargs):
+        self.items += 1
+        if self.fail_next_item:
+            # The item reached the printer, but we died before the reply
+            raise KeyboardInterrupt
+        return self.items
+
+    def _get_last_item_id(self):
+        return self.items
+
+    def coupon_cancel(self):
+        self.is_open = False
+        self.items = 0
+        self.coo += 1
+
+    def coupon_totalize(self, discount, surcharge, taxcode):
+        return Decimal(10) * self.items
+
+    def coupon_add_payment(self, method, value, description):
+        return Decimal(0)
+
+    def coupon_close(self, message):
+        self.is_open = False
+        self.items = 0
+        return self.coo
+
+
+def _create_printer(driver, directory):
+    printer = create_device(FiscalPrinter, 'bematech', 'MP25', FakePort())
+    printer._driver = driver
+    printer.enable_journal(directory)
+    return printer
+
+
+class TestCouponJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.driver = _FakeDriver()
+        self.printer = _create_printer(self.driver, self.directory)
+
+    def tearDown(self):
+        self.printer.get_journal().close()
+        shutil.rmtree(self.directory)
+
+    def _restart(self):
+        self.printer.get_journal().close()
+        self.printer = _create_printer(self.driver, self.directory)
+
+    def _sell(self, n_items=1):
+        self.printer.identify_customer('Customer', 'Address', '123')
+        self.printer.open()
+        for i in range(n_items):
+            self.printer.add_item('123', 'Item', Decimal(10), 'TN')
+
+    def test_nothing_to_recover(self):
+        self._sell()
+        self.printer.totalize()
+        self.printer.add_payment('M', Decimal(10))
+        self.printer.close()
+        self._restart()
+        self.assertIsNone(self.printer.get_journal().get_pending_coupon())
+        self.assertEqual(self.printer.recover_from_journal().coupon, None)
+
+    def test_resume(self):
+        self._sell(n_items=2)
+        self.printer.totalize()
+        self._restart()
+
+        result = self.printer.recover_from_journal()
+        self.assertEqual(result.action, RECOVERY_RESUMED)
+        self.assertEqual(result.replayed, [])
+        self.assertTrue(self.printer._has_been_totalized)
+        self.assertEqual(self.printer.totalized_value, Decimal(20))
+        self.assertEqual(self.driver.customer, 'Customer')
+
+        self.printer.add_payment('M', Decimal(20))
+        self.printer.close()
+        self.assertIsNone(self.printer.get_journal().get_pending_coupon())
+
+    def test_in_flight_item_reached_printer(self):
+        self._sell()
+        self.driver.fail_next_item = True
+        self.assertRaises(KeyboardInterrupt, self.printer.add_item,
+                          '456', 'Other', Decimal(5), 'TN')
+        self.driver.fail_next_item = False
+        self._restart()
+
+        result = self.printer.recover_from_journal()
+        self.assertEqual(result.action, RECOVERY_RESUMED)
+        self.assertEqual(result.replayed, [])
+        self.assertEqual(self.driver.items, 2)
+
+    def test_in_flight_item_replayed(self):
+        self._sell()
+        journal = self.printer.get_journal()
+        # The call was journaled, but the process died before sending it
+        journal.record_call('add_item', dict(item_code='456',
+                                             item_description='Other',
+                                             item_price=Decimal(5),
+                                             taxcode='TN'))
+        self._restart()
+
+        result = self.printer.recover_from_journal()
+        self.assertEqual(result.action, RECOVERY_RESUMED)
+        self.assertEqual(len(result.replayed), 1)
+        self.assertEqual(self.driver.items, 2)
+
+    def test_in_flight_close(self):
+        self._sell()
+        self.printer.totalize()
+        self.printer.add_payment('M', Decimal(10))
+        journal = self.printer.get_journal()
+        journal.record_call('close', dict(promotional_message=''))
+        self.driver.coupon_close('')
+        self._restart()
+
+        self.assertEqual(self.printer.recover_from_journal().action,
+                         RECOVERY_CLOSED)
+
+    def test_ambiguous_state_is_cancelled(self):
+        self._sell()
+        self.printer.totalize()
+        journal = self.printer.get_journal()
+        journal.record_call('add_payment', dict(payment_method='M',
+                                                payment_value=Decimal(10),
+                                                description=''))
+        self._restart()
+
+        self.assertEqual(self.printer.recover_from_journal().action,
+                         RECOVERY_CANCELLED)
+        self.assertFalse(self.driver.is_open)
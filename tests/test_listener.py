@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import unittest
+
+from stoqdrivers.listener import DeviceListener, StxEtxFramer
+from stoqdrivers.scales.scales import Scale
+
+from tests.base import PipePort, create_device
+
+# STX, code, weight, price per kg and total price, ETX
+_PACKET = b'\x02' b'000123' b'01250' b'000249' b'000311' b'\x03'
+
+
+class TestStxEtxFramer(unittest.TestCase):
+    def test_feed(self):
+        framer = StxEtxFramer(max_size=25)
+        self.assertEqual(framer.feed(b'noise' + _PACKET[:10]), [])
+        self.assertEqual(framer.feed(_PACKET[10:] + _PACKET), [_PACKET, _PACKET])
+        # A frame that never ends is dropped, and the next one is found
+        self.assertEqual(framer.feed(b'\x02' + b'0' * 30 + _PACKET), [_PACKET])
+
+
+class TestDeviceListener(unittest.TestCase):
+    def setUp(self):
+        self.port = PipePort()
+        self.scale = create_device(Scale, 'toledo', 'PrixIII', self.port)
+        self.listener = DeviceListener()
+
+    def tearDown(self):
+        self.listener.close()
+        self.port.close()
+
+    def _check_package(self, package):
+        self.assertEqual(package.code, 123)
+        self.assertEqual(package.weight, 1.25)
+        self.assertEqual(package.price_per_kg, 2.49)
+        self.assertEqual(package.total_price, 3.11)
+
+    def test_thread(self):
+        received = threading.Event()
+        packages = []
+
+        def callback(package):
+            packages.append(package)
+            received.set()
+
+        errors = []
+        self.listener.start()
+        self.scale.listen(callback, errors.append, listener=self.listener)
+        self.port.push(_PACKET[:7])
+        self.port.push(_PACKET[7:])
+        self.assertTrue(received.wait(5))
+        self._check_package(packages[0])
+
+        received.clear()
+        self.port.push(b'\x02garbage\x03' + _PACKET)
+        self.assertTrue(received.wait(5))
+        self.assertEqual(len(packages), 2)
+        self.assertEqual(len(errors), 1)
+        self.scale.stop_listening(self.listener)
+
+    def test_asyncio(self):
+        loop = asyncio.new_event_loop()
+        try:
+            future = loop.create_future()
+            self.listener.attach(loop)
+            self.scale.listen(future.set_result, listener=self.listener)
+            self.port.push(_PACKET)
+            self._check_package(loop.run_until_complete(
+                asyncio.wait_for(future, 5)))
+            self.listener.detach()
+        finally:
+            loop.close()
@@ -0,0 +1,113 @@
+import shutil
+import tempfile
+import unittest
+
+from stoqdrivers.escpos import EscPosMixin
+from stoqdrivers.logos import LogoIndex
+from stoqdrivers.printers.elgin.I9 import I9
+from stoqdrivers.printers.sweda.SI300 import SI300
+from stoqdrivers.serialbase import SerialBase
+from stoqdrivers.utils import matrix2columns, matrix2raster
+
+from tests.base import FakePort
+
+_LOGO = [[True, False] * 5,
+         [False, True] * 5]
+_OTHER_LOGO = [[True] * 10]
+
+
+class _BitmapPrinter(SerialBase, EscPosMixin):
+    def __init__(self, port):
+        SerialBase.__init__(self, port)
+        EscPosMixin.__init__(self)
+
+
+class TestMatrixConversion(unittest.TestCase):
+    def test_raster(self):
+        self.assertEqual(matrix2raster(_LOGO),
+                         (10, 2, '\xaa\x80\x55\x40'))
+
+    def test_columns(self):
+        x, y, data = matrix2columns(_LOGO)
+        self.assertEqual((x, y), (2, 1))
+        # 16 columns of one byte, the padding is blank
+        self.assertEqual(data, '\x80\x40' * 5 + '\x00' * 6)
+
+
+class _LogoTest(unittest.TestCase):
+    printer_class = None
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.port = FakePort()
+        self.printer = self.printer_class(self.port)
+        self.printer.set_logo_index(LogoIndex('test', self.directory))
+        self.port.written = b''
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _restart(self):
+        # A new process, with the same printer
+        self.printer = self.printer_class(self.port)
+        self.printer.set_logo_index(LogoIndex('test', self.directory))
+        self.port.written = b''
+
+
+class TestGSLogos(_LogoTest):
+    printer_class = I9
+
+    def test_upload_once(self):
+        self.assertEqual(self.printer.load_logos({'store': _LOGO}),
+                         ['store'])
+        self.assertEqual(self.port.written,
+                         b'\x1d(L\x0f\x000C000\x01\x0a\x00\x02\x001'
+                         b'\xaa\x80\x55\x40')
+
+        self._restart()
+        self.assertEqual(self.printer.load_logos({'store': _LOGO}), [])
+        self.assertEqual(self.port.written, b'')
+        self.printer.print_logo('store')
+        self.assertEqual(self.port.written, b'\x1d(L\x06\x000E00\x01\x01')
+
+    def test_changed_logo_keeps_its_key(self):
+        self.printer.load_logos({'store': _LOGO, 'footer': _OTHER_LOGO})
+        self._restart()
+        self.assertEqual(self.printer.load_logos({'store': _OTHER_LOGO}),
+                         ['store'])
+        self.printer.print_logo('store')
+        self.assertTrue(self.port.written.endswith(b'E01\x01\x01'))
+
+    def test_not_loaded(self):
+        self.assertRaises(ValueError, self.printer.print_logo, 'store')
+
+
+class TestFSLogos(_LogoTest):
+    printer_class = SI300
+
+    def test_upload_all_at_once(self):
+        self.assertEqual(self.printer.load_logos({'b': _LOGO, 'a': _LOGO}),
+                         ['a', 'b'])
+        self.assertTrue(self.port.written.startswith(b'\x1cq\x02'))
+
+        self._restart()
+        self.assertEqual(self.printer.load_logos({'b': _LOGO}), [])
+        self.printer.print_logo('b')
+        self.assertEqual(self.port.written, b'\x1cp\x02\x00')
+
+        # Storing a new logo erases the others
+        self.printer.load_logos({'c': _OTHER_LOGO})
+        self.assertRaises(ValueError, self.printer.print_logo, 'b')
+
+
+class TestBitmapLogos(_LogoTest):
+    printer_class = _BitmapPrinter
+
+    def test_cached_bitmap(self):
+        self.assertEqual(self.printer.load_logos({'store': _LOGO}), [])
+        self.assertEqual(self.port.written, b'')
+        self.printer.print_logo('store')
+        printed = self.port.written
+        self.port.written = b''
+        self.printer.print_matrix(_LOGO)
+        self.assertEqual(printed, self.port.written)
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+import unittest
+
+from stoqdrivers.interfaces import ICouponPrinter, INonFiscalPrinter
+from stoqdrivers.printers.base import (get_supported_printers,
+                                       get_supported_printers_by_iface)
+from stoqdrivers.printers.manifest import (DRIVER_MANIFEST, format_manifest,
+                                           generate_manifest)
+
+
+class TestDriverManifest(unittest.TestCase):
+    def test_manifest_is_up_to_date(self):
+        generated = generate_manifest()
+        self.assertEqual(generated, DRIVER_MANIFEST,
+                         "The driver manifest is outdated, replace it with:\n%s"
+                         % format_manifest(generated))
+
+    def test_supported_printers(self):
+        printers = get_supported_printers(lazy=True)
+        self.assertNotIn('virtual', printers)
+        self.assertEqual([info.model for info in printers['bematech']],
+                         ['MP20', 'MP2100', 'MP2100TH', 'MP4200TH', 'MP25'])
+        self.assertEqual(printers['fiscnet'], [])
+
+        printers = get_supported_printers(include_virtual=True)
+        self.assertEqual([driver.__name__ for driver in printers['virtual']],
+                         ['Simple'])
+
+    def test_supported_printers_by_iface(self):
+        printers = get_supported_printers_by_iface(INonFiscalPrinter, 'usb')
+        self.assertEqual(sorted(printers), ['epson', 'snbc', 'sweda', 'tanca'])
+        self.assertEqual([driver.__name__ for driver in printers['epson']],
+                         ['TMT20', 'TMT70'])
+
+        printers = get_supported_printers_by_iface(ICouponPrinter, lazy=True)
+        self.assertEqual([info.model_name for info in printers['epson']],
+                         ['Epson FBII', 'Epson FBIII'])
+        self.assertRaises(TypeError, get_supported_printers_by_iface, object)
+
+    def test_lazy_listing_imports_no_driver(self):
+        code = ("import sys\n"
+                "from stoqdrivers.printers.base import get_supported_printers\n"
+                "get_supported_printers(include_virtual=True, lazy=True)\n"
+                "print([m for m in sys.modules\n"
+                "       if m.startswith('stoqdrivers.printers.') and\n"
+                "       m.count('.') == 3])\n")
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'[]')
@@ -0,0 +1,73 @@
+import threading
+import unittest
+
+from stoqdrivers import metrics
+from stoqdrivers.exceptions import DriverError
+from stoqdrivers.printers.bematech.MP4200TH import MP4200TH
+from stoqdrivers.printers.nonfiscal import NonFiscalPrinter
+
+from tests.base import FakePort, create_device
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.enable()
+        self.printer = create_device(NonFiscalPrinter, 'bematech',
+                                     'MP4200TH', FakePort())
+        self.driver = self.printer._driver
+
+    def tearDown(self):
+        metrics.disable()
+
+    def test_histogram(self):
+        histogram = metrics.Histogram()
+        for value in [0.0005, 0.001, 0.003, 20]:
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 4)
+        self.assertEqual(snapshot['counts'][:3], [2, 0, 1])
+        self.assertEqual(snapshot['counts'][-1], 1)
+
+    def test_device_metrics(self):
+        self.driver.print_line(b'foo')
+        self.assertRaises(DriverError, self.driver.readline)
+
+        snapshot = self.printer.get_metrics()
+        self.assertEqual(snapshot['name'], 'Bematech MP4200 TH')
+        commands = snapshot['commands']
+        self.assertEqual(commands['print_line']['count'], 1)
+        # print_line is implemented with print_inline, which is not counted
+        # again
+        self.assertNotIn('print_inline', commands)
+
+        counters = snapshot['counters']
+        self.assertEqual(counters[metrics.BYTES_OUT],
+                         len(self.driver._port.written))
+        self.assertEqual(counters[metrics.RETRIES], 11)
+        self.assertEqual(counters[metrics.TIMEOUTS], 1)
+        self.assertNotIn('spooler', snapshot)
+
+        self.driver.print_inline(b'bar')
+        self.assertEqual(
+            self.printer.get_metrics()['commands']['print_inline']['count'], 1)
+
+    def test_threads(self):
+        # Each thread records on its own shard, merged by the snapshot
+        def print_lines():
+            for i in range(100):
+                self.driver.print_inline(b'foo')
+        threads = [threading.Thread(target=print_lines) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        snapshot = self.printer.get_metrics()
+        self.assertEqual(snapshot['commands']['print_inline']['count'], 400)
+        self.assertEqual(sum(snapshot['commands']['print_inline']['counts']),
+                         400)
+
+    def test_disabled(self):
+        metrics.disable()
+        driver = MP4200TH(FakePort())
+        driver.print_line(b'foo')
+        self.assertIsNone(metrics.get_metrics(driver, create=False))
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from tests.base import (LogSerialPort, PlaybackPort, PLAYBACK_INSTANT,
+                        PLAYBACK_RECORDED)
+
+THINK_TIME = 0.05
+
+
+class _SlowPort:
+    """Replies 'OK' to every command, after thinking for a while"""
+
+    def __init__(self):
+        self._reply = b''
+        self._thinking = False
+
+    def write(self, data):
+        self._reply = b'OK'
+        self._thinking = True
+
+    def read(self, n_bytes=1):
+        if self._thinking:
+            time.sleep(THINK_TIME)
+            self._thinking = False
+        data, self._reply = self._reply[:n_bytes], self._reply[n_bytes:]
+        return data
+
+
+class TestPlayback(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'slow.txt')
+        port = LogSerialPort(_SlowPort())
+        for command in [b'A', b'B']:
+            port.write(command)
+            self.assertEqual(port.read(1) + port.read(1), b'OK')
+        port.save(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _replay(self, port):
+        start = time.monotonic()
+        for command in [b'A', b'B']:
+            port.write(command)
+            self.assertEqual(port.read(2), b'OK')
+        return time.monotonic() - start
+
+    def test_record(self):
+        with open(self.filename) as fp:
+            lines = fp.read().splitlines()
+        self.assertEqual([line[0] for line in lines], ['W', 'D', 'R'] * 2)
+        think_time, transfer_time = [float(v) for v in lines[1].split()[1:]]
+        self.assertTrue(think_time >= THINK_TIME)
+
+    def test_replay_modes(self):
+        self.assertLess(
+            self._replay(PlaybackPort(self.filename, PLAYBACK_INSTANT)),
+            THINK_TIME)
+        self.assertGreaterEqual(
+            self._replay(PlaybackPort(self.filename, PLAYBACK_RECORDED)),
+            2 * THINK_TIME)
+        scaled = self._replay(PlaybackPort(self.filename, '0.5'))
+        self.assertGreaterEqual(scaled, THINK_TIME)
+        self.assertLess(scaled, 2 * THINK_TIME)
+
+    def test_timeout(self):
+        port = PlaybackPort(self.filename, PLAYBACK_RECORDED)
+        port.timeout = THINK_TIME / 5
+        port.write(b'A')
+        self.assertIsNone(port.read(2))
+        port.timeout = None
+        self.assertEqual(port.read(2), b'OK')
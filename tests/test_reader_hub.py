@@ -0,0 +1,55 @@
+import queue
+import unittest
+
+from stoqdrivers.listener import LineFramer
+from stoqdrivers.readers.barcode.metrologic.MC630 import MC630
+from stoqdrivers.readers.hub import ReaderHub
+from stoqdrivers.scales.toledo.PrixIII import PrixIII
+
+from tests.base import PipePort
+
+
+class TestLineFramer(unittest.TestCase):
+    def test_feed(self):
+        framer = LineFramer(b'\r')
+        self.assertEqual(framer.feed(b'7891'), [])
+        self.assertEqual(framer.feed(b'234\r\n\r5678\r9'), [b'7891234', b'5678'])
+        self.assertEqual(framer.feed(b'\r'), [b'9'])
+
+
+class TestReaderHub(unittest.TestCase):
+    def setUp(self):
+        self.ports = [PipePort() for i in range(3)]
+        self.readers = [MC630(self.ports[0]), MC630(self.ports[1])]
+        self.scale = PrixIII(self.ports[2])
+        self.events = queue.Queue()
+        self.hub = ReaderHub(queue=self.events, duplicate_window=60)
+        for device in self.readers + [self.scale]:
+            self.hub.add(device)
+        self.hub.start()
+
+    def tearDown(self):
+        self.hub.close()
+        for port in self.ports:
+            port.close()
+
+    def _get_events(self, n):
+        return [self.events.get(timeout=5)[:2] for i in range(n)]
+
+    def test_events(self):
+        self.ports[0].push(b'7891234\r')
+        self.assertEqual(self._get_events(1), [(self.readers[0], '7891234')])
+
+        # The same code on the same reader is a duplicate, but not on
+        # another reader
+        self.ports[0].push(b'7891234\r')
+        self.ports[1].push(b'7891234\r')
+        self.assertEqual(self._get_events(1), [(self.readers[1], '7891234')])
+        self.ports[0].push(b'5678\r')
+        self.assertEqual(self._get_events(1), [(self.readers[0], '5678')])
+
+        self.ports[2].push(b'\x02' b'000123' b'01250' b'000249' b'000311' b'\x03')
+        device, package = self._get_events(1)[0]
+        self.assertIs(device, self.scale)
+        self.assertEqual(package.code, 123)
+        self.assertTrue(self.events.empty())
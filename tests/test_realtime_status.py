@@ -0,0 +1,143 @@
+import threading
+import unittest
+
+import usb.core
+
+from stoqdrivers.exceptions import InvalidReplyException
+from stoqdrivers.printers.nonfiscal import NonFiscalPrinter
+from stoqdrivers.printers.sweda.SI300 import SI300
+from stoqdrivers.spooler import remove_spooler
+
+from tests.base import FakePort, create_device
+
+
+class _StatusPort(FakePort):
+    """Replies to DLE EOT n with the status byte n"""
+
+    def __init__(self, status):
+        FakePort.__init__(self)
+        self.status = status
+
+    def write(self, data):
+        self.written += data
+        if self.status is None:
+            # Not connected
+            return
+        for n in range(1, 5):
+            self.reply += bytes([self.status[n - 1]]) * data.count(
+                b'\x10\x04' + bytes([n]))
+
+    def read(self, n_bytes):
+        # Reply one byte at a time, like a slow serial port
+        return FakePort.read(self, 1)
+
+
+class _UsbDevice:
+    """A pyusb device that accepts all the writes"""
+
+    def __init__(self):
+        self.written = b''
+
+    def is_kernel_driver_active(self, interface):
+        return False
+
+    def reset(self):
+        pass
+
+    def write(self, endpoint, data, timeout):
+        self.written += data
+        return len(data)
+
+
+class TestRealTimeStatus(unittest.TestCase):
+    def setUp(self):
+        # Online and drawer pin high; cover open; autocutter error; paper
+        # near end
+        self.port = _StatusPort([0x16, 0x16, 0x1a, 0x1e])
+        self.driver = SI300(self.port)
+        self.port.written = b''
+
+    def test_status(self):
+        status = self.driver.get_realtime_status()
+        self.assertEqual(self.port.written,
+                         b'\x10\x04\x01\x10\x04\x02\x10\x04\x03\x10\x04\x04')
+        self.assertTrue(status.is_online)
+        self.assertTrue(status.drawer_pin_high)
+        self.assertTrue(status.cover_open)
+        self.assertFalse(status.has_error)
+        self.assertTrue(status.autocutter_error)
+        self.assertFalse(status.unrecoverable_error)
+        self.assertTrue(status.paper_near_end)
+        self.assertFalse(status.paper_end)
+
+    def test_cache(self):
+        self.assertIsNone(self.driver.get_last_status())
+        status = self.driver.get_status()
+        self.port.written = b''
+        self.assertIs(self.driver.get_status(), status)
+        self.assertIs(self.driver.get_last_status(), status)
+        self.assertEqual(self.port.written, b'')
+        self.assertIsNot(self.driver.get_status(max_age=0), status)
+
+    def test_invalid_reply(self):
+        self.port.status = [0x16, 0xff, 0x12, 0x12]
+        self.assertRaises(InvalidReplyException,
+                          self.driver.get_realtime_status)
+        self.port.status = None
+        self.assertRaises(InvalidReplyException,
+                          self.driver.get_realtime_status)
+
+    def test_nonfiscal_printer(self):
+        printer = create_device(NonFiscalPrinter, 'sweda', 'SI300', self.port)
+        self.addCleanup(remove_spooler, printer)
+        self.assertIsNone(printer.get_last_status())
+        self.assertTrue(printer.poll_status().cover_open)
+        self.assertIs(printer.get_status(), printer.get_last_status())
+
+        # ESC/BEMA printers don't reply to DLE EOT
+        printer = create_device(NonFiscalPrinter, 'bematech', 'MP4200TH',
+                                self.port)
+        self.assertIsNone(printer.poll_status())
+        self.assertIsNone(printer.get_status())
+
+    def test_usb_printer(self):
+        # The USB drivers only write to the printer
+        device = _UsbDevice()
+        find = usb.core.find
+        usb.core.find = lambda **kwargs: device
+        self.addCleanup(setattr, usb.core, 'find', find)
+        printer = create_device(NonFiscalPrinter, 'epson', 'TMT20', None,
+                                interface='usb', vendor_id=0x04b8,
+                                product_id=0x0e15)
+        self.addCleanup(remove_spooler, printer)
+        # pyusb can't release the fake device
+        self.addCleanup(setattr, printer._driver, 'device', None)
+        self.assertIsNone(printer.poll_status())
+        self.assertIsNone(printer.get_status())
+        self.assertIsNone(printer.get_asb_status())
+        self.assertRaises(TypeError, printer.enable_asb)
+        printer.get_spooler().submit(lambda: None).result(timeout=5)
+        self.assertNotIn(b'\x10\x04', device.written)
+
+    def test_nonfiscal_printer_refresh(self):
+        printer = create_device(NonFiscalPrinter, 'sweda', 'SI300', self.port)
+        self.addCleanup(remove_spooler, printer)
+        spooler = printer.get_spooler()
+        blocker = threading.Event()
+        spooler.submit(blocker.wait, 5)
+        self.port.written = b''
+
+        # The status is never read on the caller thread
+        self.assertIsNone(printer.get_status())
+        self.assertIsNone(printer.get_status())
+        self.assertEqual(self.port.written, b'')
+        blocker.set()
+        spooler.submit(lambda: None).result(timeout=5)
+        # Only one refresh was submitted
+        self.assertEqual(self.port.written.count(b'\x10\x04\x01'), 1)
+
+        status = printer.get_status()
+        self.assertTrue(status.cover_open)
+        self.assertIs(printer.get_status(max_age=0), status)
+        spooler.submit(lambda: None).result(timeout=5)
+        self.assertIsNot(printer.get_last_status(), status)
@@ -0,0 +1,96 @@
+import unittest
+
+from stoqdrivers.printers.bematech.MP4200TH import MP4200TH
+from stoqdrivers.printers.daruma.DR700 import DR700
+from stoqdrivers.printers.sweda.SI300 import SI300
+from stoqdrivers.render import (DIALECT_BEMA, DIALECT_DARUMA, Barcode,
+                                ReceiptRenderer, render)
+
+from tests.base import FakePort
+
+
+def _print_receipt(driver):
+    driver.centralize()
+    driver.set_bold()
+    driver.print_line(b'STORE')
+    driver.unset_bold()
+    driver.descentralize()
+    for i in range(3):
+        driver.print_line(b'%03d Item          10,00' % i)
+    driver.print_barcode('12345')
+
+
+class TestReceiptRenderer(unittest.TestCase):
+    def test_escpos(self):
+        port = FakePort()
+        driver = SI300(port)
+        _print_receipt(driver)
+        driver.print_qrcode('http://www.stoq.com.br')
+        driver.cut_paper()
+        driver.print_line(b'Next')
+
+        renderer = render(port.written)
+        self.assertEqual(renderer.unknown, [])
+        self.assertEqual(renderer.barcodes, [Barcode('CODE93', '12345')])
+        self.assertEqual(renderer.qrcodes, ['http://www.stoq.com.br'])
+
+        stats = renderer.get_stats()
+        self.assertEqual(stats['bytes'], len(port.written))
+        self.assertEqual(stats['cuts'], 1)
+        first, second = stats['sections']
+        self.assertEqual(second.nbytes, len(b'Next\n'))
+        self.assertEqual(second.passes, 1)
+        self.assertEqual(first.bytes_by_kind['text'],
+                         len(b'STORE') + 3 * len(b'000 Item          10,00'))
+        self.assertEqual(first.bytes_by_kind['barcode'], 21)
+        # The title, the 3 items, the barcode (30 dots) and the QR code
+        # (25 modules of 4 dots, without the qrcode module)
+        self.assertEqual(first.passes, 1 + 3 + 2 + 5)
+
+        image = renderer.get_image()
+        self.assertEqual(image.size, (576, stats['paper_length']))
+        # The title is centered
+        bbox = image.crop((0, 0, 576, 24)).point(lambda v: 255 - v).getbbox()
+        self.assertTrue(abs((bbox[0] + bbox[2]) / 2 - 288) < 12, bbox)
+
+    def test_bema_images(self):
+        port = FakePort()
+        driver = MP4200TH(port)
+        driver.separator()
+        renderer = render(port.written, DIALECT_BEMA)
+        self.assertEqual(renderer.unknown, [])
+        # A single band of an 8 dot image, drawn 3 times taller
+        self.assertEqual(renderer.get_paper_length(), 24)
+        self.assertEqual(renderer.get_head_passes(), 1)
+        image = renderer.get_image()
+        self.assertEqual([image.getpixel((10, y)) for y in range(4, 11)],
+                         [255, 255, 0, 0, 0, 255, 255])
+
+    def test_daruma(self):
+        port = FakePort()
+        driver = DR700(port)
+        _print_receipt(driver)
+        driver.print_qrcode('abc')
+        renderer = render(port.written, DIALECT_DARUMA)
+        self.assertEqual(renderer.unknown, [])
+        self.assertEqual(renderer.barcodes, [Barcode('CODE128', '12345')])
+        self.assertEqual(renderer.qrcodes, ['abc'])
+
+    def test_incomplete_commands(self):
+        data = (b'\x1b@\x1b!\x08Title\n\x1d\x76\x30\x00\x01\x00\x02\x00'
+                b'\xff\x00\x1dV\x41\x03')
+        whole = render(data)
+        renderer = ReceiptRenderer()
+        for i in range(len(data)):
+            renderer.feed(data[i:i + 1])
+        renderer.close()
+        self.assertEqual(renderer.get_stats(), whole.get_stats())
+        self.assertEqual(renderer.get_image().tobytes(),
+                         whole.get_image().tobytes())
+
+        image = whole.get_image()
+        # The raster image: a black first row and a white second row
+        y = 30
+        self.assertEqual([image.getpixel((x, y)) for x in range(9)],
+                         [0] * 8 + [255])
+        self.assertEqual(image.getpixel((0, y + 1)), 255)
@@ -0,0 +1,102 @@
+import threading
+import unittest
+
+from stoqdrivers.exceptions import InvalidValue, OutofPaperError
+from stoqdrivers.printers.router import NoPrinterAvailable, PrinterRouter
+from stoqdrivers.spooler import remove_spooler
+
+
+class _FakePrinter:
+    def __init__(self, device):
+        self.device = device
+        self.lines = []
+        self.out_of_paper = False
+
+    def print_line(self, data):
+        if self.out_of_paper:
+            raise OutofPaperError('No paper')
+        self.lines.append(data)
+
+    def is_drawer_open(self):
+        if self.out_of_paper:
+            raise OutofPaperError('No paper')
+        return False
+
+
+class TestPrinterRouter(unittest.TestCase):
+    def setUp(self):
+        self.printers = dict((name, _FakePrinter('/dev/fake-%s' % name))
+                             for name in ['kitchen1', 'kitchen2', 'bar'])
+        self.router = PrinterRouter(cooldown=0)
+        self.router.add_printer('kitchen1', self.printers['kitchen1'],
+                                ['kitchen'])
+        self.router.add_printer('kitchen2', self.printers['kitchen2'],
+                                ['kitchen'])
+        self.router.add_printer('bar', self.printers['bar'], ['bar'])
+
+    def tearDown(self):
+        for printer in self.printers.values():
+            remove_spooler(printer)
+
+    def test_balance(self):
+        blocker = threading.Event()
+        # kitchen1 is busy, so both jobs go to kitchen2
+        self.router.submit('kitchen', lambda printer: blocker.wait(5))
+        for i in range(2):
+            self.router.submit('kitchen', 'print_line', 'ticket %d' % i).result(5)
+        self.assertEqual(self.printers['kitchen2'].lines,
+                         ['ticket 0', 'ticket 1'])
+        blocker.set()
+
+    def test_failover(self):
+        self.printers['kitchen1'].out_of_paper = True
+        self.printers['kitchen2'].lines.append('busy')
+        for i in range(2):
+            self.router.submit('kitchen', 'print_line', 'ticket').result(5)
+        self.assertEqual(self.printers['kitchen2'].lines,
+                         ['busy', 'ticket', 'ticket'])
+        self.assertEqual(self.router.get_status()['kitchen1']['last_error'],
+                         'No paper')
+
+        self.printers['kitchen2'].out_of_paper = True
+        future = self.router.submit('kitchen', 'print_line', 'ticket')
+        self.assertRaises(NoPrinterAvailable, future.result, 5)
+
+        # Back with paper, the probe puts it back in the group
+        self.printers['kitchen1'].out_of_paper = False
+        self.router.submit('kitchen', 'print_line', 'ticket').result(5)
+        self.assertEqual(self.printers['kitchen1'].lines, ['ticket'])
+
+    def test_probe_does_not_block(self):
+        self.printers['kitchen1'].out_of_paper = True
+        self.router.submit('kitchen', 'print_line', 'ticket').result(5)
+        self.printers['kitchen1'].out_of_paper = False
+
+        # The probe waits for the job on kitchen1, the ticket doesn't
+        blocker = threading.Event()
+        spooler = self.router._printers['kitchen1'].spooler
+        spooler.submit(blocker.wait, 5)
+        self.router.submit('kitchen', 'print_line', 'other').result(1)
+        self.assertEqual(self.printers['kitchen2'].lines, ['ticket', 'other'])
+
+        probe = self.router.probe('kitchen1')
+        blocker.set()
+        self.assertTrue(probe.result(5))
+        self.assertTrue(self.router.get_status()['kitchen1']['healthy'])
+
+    def test_job_errors_are_not_retried(self):
+        def job(printer):
+            raise InvalidValue('Bad ticket')
+
+        future = self.router.submit('kitchen', job)
+        self.assertRaises(InvalidValue, future.result, 5)
+        self.assertTrue(all(status['healthy'] for status in
+                            self.router.get_status().values()))
+
+    def test_mirror(self):
+        futures = self.router.mirror(['kitchen', 'bar'], 'print_line', 'order')
+        for future in futures:
+            future.result(5)
+        self.assertEqual(self.printers['bar'].lines, ['order'])
+        self.assertEqual(self.printers['kitchen1'].lines +
+                         self.printers['kitchen2'].lines, ['order'])
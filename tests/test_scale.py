@@ -0,0 +1,81 @@
+import asyncio
+from decimal import Decimal
+import unittest
+
+from stoqdrivers.exceptions import InvalidReply
+from stoqdrivers.scales.base import WeightStabilizer
+from stoqdrivers.scales.scales import Scale
+
+from tests.base import FakePort, create_device
+
+
+class _Reading:
+    def __init__(self, weight):
+        self.weight = weight
+        self.price_per_kg = self.total_price = self.code = None
+
+
+class _FakeDriver:
+    def __init__(self, weights):
+        self._weights = list(weights)
+
+    def read_data(self):
+        weight = self._weights.pop(0)
+        if weight is None:
+            raise InvalidReply("Received inconsistent data")
+        return _Reading(weight)
+
+
+def _create_scale(weights):
+    scale = create_device(Scale, 'toledo', 'PrixIII', FakePort())
+    scale._driver = _FakeDriver(weights)
+    return scale
+
+
+class TestWeightStabilizer(unittest.TestCase):
+    def test_stabilizer(self):
+        stabilizer = WeightStabilizer(size=3, tolerance=Decimal('0.005'))
+        self.assertFalse(stabilizer.add(Decimal('1.000')))
+        self.assertFalse(stabilizer.add(Decimal('1.004')))
+        self.assertTrue(stabilizer.add(Decimal('1.002')))
+        # Moving
+        self.assertFalse(stabilizer.add(Decimal('1.100')))
+        stabilizer.add(Decimal('1.100'))
+        self.assertTrue(stabilizer.add(Decimal('1.100')))
+        # Removed
+        self.assertFalse(stabilizer.add(Decimal(0)))
+        self.assertFalse(stabilizer.add(Decimal('1.100')))
+
+
+class TestScaleStream(unittest.TestCase):
+    weights = [0, 0.5, 1.2, 1.0, None, 1.0, 1.001, 1.001, 0, 2.0, 2.0, 2.0]
+
+    def test_stream(self):
+        scale = _create_scale(self.weights)
+        stable = []
+        stream = scale.stream(interval=0, stable_readings=3,
+                              on_stable=stable.append)
+        readings = [next(stream) for i in range(3)]
+        self.assertEqual([r.weight for r in readings], [1.001, 1.001, 2.0])
+        self.assertEqual([r.weight for r in stable], [1.001, 2.0])
+
+    def test_stream_async(self):
+        scale = _create_scale(self.weights)
+        stable = []
+
+        async def read():
+            readings = []
+            async for reading in scale.stream_async(
+                    interval=0, stable_readings=3, on_stable=stable.append):
+                readings.append(reading.weight)
+                if len(readings) == 3:
+                    break
+            return readings
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(read()),
+                             [1.001, 1.001, 2.0])
+        finally:
+            loop.close()
+        self.assertEqual([r.weight for r in stable], [1.001, 2.0])
@@ -0,0 +1,115 @@
+import threading
+import unittest
+
+from stoqdrivers.spooler import (DeviceSpooler, PRIORITY_LOW,
+                                 get_spooler, remove_spooler)
+
+
+class _FakeDevice:
+    device = '/dev/fake-spooler'
+
+    def __init__(self):
+        self.calls = []
+
+    def print_line(self, text):
+        self.calls.append(text)
+        return text
+
+    def open_drawer(self):
+        self.calls.append('drawer')
+
+    def fail(self):
+        raise ValueError('failed')
+
+
+class _PolledDevice(_FakeDevice):
+    device = '/dev/fake-polled'
+
+    def __init__(self):
+        _FakeDevice.__init__(self)
+        self.polled = threading.Event()
+
+    def poll_status(self):
+        self.calls.append('poll')
+        self.polled.set()
+
+
+class TestDeviceSpooler(unittest.TestCase):
+    def setUp(self):
+        self.device = _FakeDevice()
+        self.spooler = DeviceSpooler(self.device, name='test')
+
+    def tearDown(self):
+        self.spooler.stop()
+
+    def test_submit(self):
+        future = self.spooler.call('print_line', 'foo')
+        self.assertEqual(future.result(timeout=5), 'foo')
+        failed = self.spooler.call('fail')
+        self.assertRaises(ValueError, failed.result, 5)
+
+    def test_group_is_atomic_and_urgent_jumps_ahead(self):
+        blocker = threading.Event()
+        self.spooler.submit(blocker.wait)
+        group = self.spooler.group()
+        group.call('print_line', 'coupon 1')
+        # Queued after the group, but before the group is closed
+        low = self.spooler.submit(self.device.print_line, 'report',
+                                  priority=PRIORITY_LOW)
+        drawer = self.spooler.call('open_drawer')
+        blocker.set()
+        group.call('print_line', 'coupon 2')
+        group.close()
+
+        drawer.result(timeout=5)
+        low.result(timeout=5)
+        # The drawer was opened before the group started, and nothing got in
+        # the middle of the group.
+        self.assertEqual(self.device.calls,
+                         ['drawer', 'coupon 1', 'coupon 2', 'report'])
+
+    def test_metrics(self):
+        futures = self.spooler.submit_group(
+            [(self.device.print_line, ('a', ), {}),
+             (self.device.print_line, ('b', ), {})])
+        self.assertEqual([f.result(timeout=5) for f in futures], ['a', 'b'])
+        metrics = self.spooler.get_metrics()
+        self.assertEqual(metrics['jobs_done'], 2)
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertTrue(metrics['wait_time_max'] >= metrics['wait_time_avg'])
+
+    def test_status_polling(self):
+        device = _PolledDevice()
+        spooler = DeviceSpooler(device, status_interval=0)
+        try:
+            # Polled while idle
+            self.assertTrue(device.polled.wait(5))
+            spooler.set_status_interval(3600)
+            # Let a poll that was already running finish
+            spooler.submit(lambda: None).result(timeout=5)
+            device.calls = []
+            futures = spooler.submit_group(
+                [(device.print_line, ('a', ), {}),
+                 (device.print_line, ('b', ), {})])
+            [f.result(timeout=5) for f in futures]
+            self.assertEqual(device.calls, ['a', 'b'])
+
+            # and between the jobs of a group
+            spooler.set_status_interval(0)
+            with spooler.group() as group:
+                group.call('print_line', 'c')
+                group.call('print_line', 'd')
+            [f.result(timeout=5) for f in group.futures]
+            spooler.set_status_interval(None)
+            self.assertEqual(device.calls[device.calls.index('c') + 1], 'poll')
+        finally:
+            spooler.stop()
+
+    def test_get_spooler(self):
+        other = _FakeDevice()
+        spooler = get_spooler(self.device)
+        try:
+            self.assertIs(get_spooler(other), spooler)
+        finally:
+            remove_spooler(self.device)
+        self.assertIsNone(get_spooler(self.device, create=False))
@@ -1,8 +1,36 @@
+import subprocess
+import sys
 import unittest
 
 from stoqdrivers import __version__
 
 
+def _get_import_times(module):
+    """Import module on a new interpreter with -X importtime.
+
+    @returns: a dict mapping the imported modules to their cumulative
+      import time, in microseconds
+    """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        stderr=subprocess.PIPE, check=True).stderr.decode()
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
 class TestStoqdrivers(unittest.TestCase):
     def test_package_version(self):
         self.assertEquals(__version__, (2, 1, 0))
+
+    def test_import_time(self):
+        times = _get_import_times('stoqdrivers.printers.nonfiscal')
+        for slow_module in ['pkg_resources', 'gi', 'unittest', 'platform']:
+            self.assertNotIn(slow_module, times)
+        # Way more than it takes, this is only here to catch regressions
+        # like importing pkg_resources again, which alone takes ~150ms
+        self.assertLess(times['stoqdrivers.printers.nonfiscal'], 500000)
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from stoqdrivers.exceptions import DriverError
+from stoqdrivers.serialbase import SerialBase
+from stoqdrivers.trace import READ, WRITE, WireTrace, traced
+
+from tests.base import FakePort, PlaybackPort
+
+
+class TestWireTrace(unittest.TestCase):
+    def test_frames(self):
+        trace = WireTrace(frames=2, frame_size=4)
+        trace.write(b'\x1bA')
+        trace.read(b'O')
+        trace.read(b'K')
+        trace.write(b'\x1bB')
+        trace.write(b'\x1bCDEFG')
+        trace.read(b'')
+        trace.read(b'\x06')
+
+        frames = trace.get_frames()
+        # Only the last 2 writes are kept
+        self.assertEqual([(f.direction, f.data, f.length) for f in frames],
+                         [(READ, b'OK', 2),
+                          (WRITE, b'\x1bB', 2),
+                          (WRITE, b'\x1bCDE', 6),
+                          (READ, b'\x06', 1)])
+        self.assertTrue(frames[0].timestamp <= frames[-1].timestamp)
+        self.assertIn(' W \\x1bCDE (6 bytes)', trace.format())
+
+        trace.clear()
+        self.assertEqual(trace.get_frames(), [])
+
+    def test_error(self):
+        driver = SerialBase(FakePort(b'\x15'))
+        with self.assertRaises(DriverError) as cm:
+            driver.writeline('STATUS')
+        self.assertEqual([(f.direction, f.data) for f in cm.exception.wire_trace],
+                         [(WRITE, b'\x1bSTATUS'), (READ, b'\x15')])
+
+    def test_shared_error(self):
+        shared = DriverError('Out of paper', 0x0304)
+
+        class Driver(SerialBase):
+            @traced
+            def command(self, data):
+                self.write(data)
+                self.read(1)
+                raise shared
+
+        driver = Driver(FakePort(b'\x06\x15'))
+        with self.assertRaises(DriverError) as cm:
+            driver.command('A')
+        first = cm.exception
+        driver.get_wire_trace().clear()
+        with self.assertRaises(DriverError) as cm:
+            driver.command('B')
+        second = cm.exception
+
+        self.assertIsNone(shared.wire_trace)
+        self.assertIs(first.__cause__, shared)
+        self.assertEqual(str(second), str(shared))
+        self.assertEqual(second.code, 0x0304)
+        self.assertEqual([f.data for f in first.wire_trace],
+                         [b'A', b'\x06'])
+        self.assertEqual([f.data for f in second.wire_trace],
+                         [b'B', b'\x15'])
+
+    def test_save_and_replay(self):
+        driver = SerialBase(FakePort(b'\\OK\r'))
+        self.assertEqual(driver.writeline('\x00\n'), '\\OK')
+
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'trace.txt')
+            driver.get_wire_trace().save(filename)
+            playback = SerialBase(PlaybackPort(filename))
+            self.assertEqual(playback.writeline('\x00\n'), '\\OK')
+        finally:
+            shutil.rmtree(directory)
@@ -1,6 +1,10 @@
+import codecs
+import io
 import unittest
 
-from stoqdrivers.utils import get_obj_from_module
+from stoqdrivers import abicomp
+from stoqdrivers.utils import (bytes2str, encode_text, get_obj_from_module,
+                               str2bytes)
 
 
 class TestUtils(unittest.TestCase):
@@ -13,3 +17,47 @@ class TestUtils(unittest.TestCase):
 
         obj = get_obj_from_module('stoqdrivers.utils', obj_name='get_obj_from_module')
         self.assertEquals(obj, get_obj_from_module)
+
+    def test_encode_text(self):
+        self.assertEqual(encode_text('Pão de açúcar', 'ascii'), 'Pao de acucar')
+        self.assertEqual(encode_text('Pão € 1', 'cp850'), 'P\xc6o  1')
+        self.assertEqual(encode_text('ﬁ', 'ascii'), 'fi')
+        self.assertEqual(encode_text('plain', 'cp850'), 'plain')
+        # Not encoded character by character
+        self.assertEqual(encode_text('ã', 'utf-16'),
+                         bytes2str('ã'.encode('utf-16')))
+
+    def test_bytes2str(self):
+        data = bytes(range(256))
+        self.assertEqual(str2bytes(bytes2str(data)), data)
+        self.assertEqual(bytes2str(b'\x06\xff'), '\x06\xff')
+
+
+class TestAbicomp(unittest.TestCase):
+    def setUp(self):
+        abicomp.register_codec()
+
+    def test_codec(self):
+        text = ''.join(abicomp.TABLE) + 'abc 123'
+        data = text.encode('abicomp')
+        self.assertEqual(data, b''.join(abicomp.TABLE.values()) + b'abc 123')
+        self.assertEqual(data.decode('abicomp'), text)
+        self.assertEqual(encode_text('não €', 'abicomp'), 'n\xc4o ')
+        self.assertRaises(UnicodeEncodeError, '€'.encode, 'abicomp')
+        # Bytes that are not ABICOMP are decoded as latin-1
+        self.assertEqual(b'\xe0\xff'.decode('abicomp'), '\xe0\xff')
+
+    def test_incremental_and_streams(self):
+        encoder = codecs.getincrementalencoder('abicomp')()
+        self.assertEqual(encoder.encode('çã') + encoder.encode('o', True),
+                         b'\xc6\xc4o')
+        decoder = codecs.getincrementaldecoder('abicomp')()
+        self.assertEqual(decoder.decode(b'\xc6') + decoder.decode(b'\xc4o', True),
+                         'ção')
+
+        stream = io.BytesIO()
+        writer = codecs.getwriter('abicomp')(stream)
+        writer.write('Açaí')
+        self.assertEqual(stream.getvalue(), b'A\xc6a\xcc')
+        reader = codecs.getreader('abicomp')(io.BytesIO(stream.getvalue()))
+        self.assertEqual(reader.read(), 'Açaí')
@@ -0,0 +1,170 @@
+from decimal import Decimal
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from stoqdrivers.printers.fiscal import FiscalPrinter
+from stoqdrivers.printers.virtual.Simple import STATE_ENV, Simple
+from stoqdrivers.printers.virtual.output import (FileSink, MemorySink,
+                                                 OutputSink, get_sink)
+
+from tests.base import create_device
+
+
+class TestVirtualPrinter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.state_file = os.path.join(self.directory, 'printer.json')
+        # Never touch the state of the real user
+        self._setenv('HOME', self.directory)
+        self._setenv(STATE_ENV, self.state_file)
+
+        self.sink = MemorySink()
+        self.printer = create_device(FiscalPrinter, 'virtual', 'Simple',
+                                     self.sink)
+        self.driver = self.printer._driver
+
+    def _setenv(self, name, value):
+        old = os.environ.get(name)
+        os.environ[name] = value
+        if old is None:
+            self.addCleanup(os.environ.pop, name, None)
+        else:
+            self.addCleanup(os.environ.__setitem__, name, old)
+
+    def _sell(self):
+        self.printer.open()
+        self.printer.add_item('123', 'Item', Decimal(10), 'TN')
+        self.printer.totalize()
+        self.printer.add_payment('M', Decimal(10))
+        self.printer.close()
+
+    def test_coupon(self):
+        self.printer.open()
+        self.printer.add_item('123', 'Item', Decimal(10), 'TN',
+                              items_quantity=Decimal(2))
+        state = self.driver.get_state()
+        self.assertTrue(state['coupon_opened'])
+        self.assertEqual(state['items'], [(1, Decimal(2), Decimal(10))])
+
+        self.printer.totalize()
+        self.printer.add_payment('M', Decimal(20))
+        self.printer.close()
+        self.assertFalse(self.driver.get_state()['coupon_opened'])
+
+        output = self.driver.get_output()
+        self.assertIn('CUPOM SIMULADO', output)
+        self.assertIn('001 123 Item', output)
+        self.sink.clear()
+        self.assertEqual(self.driver.get_output(), '')
+
+    def test_drawer(self):
+        self.driver.open_drawer()
+        self.assertTrue(self.driver.get_state()['drawer_open'])
+        self.driver.close_drawer()
+        self.assertFalse(self.driver.get_state()['drawer_open'])
+
+    def test_state_is_per_printer(self):
+        other = Simple(MemorySink(), state_file=False)
+        self.driver.open_drawer()
+        self.driver.set_off(True)
+        self.assertTrue(self.driver.is_drawer_open())
+        self.assertFalse(other.is_drawer_open())
+        self.assertEqual(other.get_state()['off'], False)
+        other.query_status()
+
+    def test_state_is_saved_once_per_coupon(self):
+        saves = []
+        save_state = self.driver._save_state
+
+        def _save_state():
+            saves.append(self.driver.is_coupon_opened)
+            save_state()
+        self.driver._save_state = _save_state
+
+        coo = self.driver.coo
+        self._sell()
+        self._sell()
+        self.assertEqual(saves, [False, False])
+
+        other = Simple(MemorySink(), state_file=self.state_file)
+        self.assertEqual(other.coo, coo + 2)
+        self.assertEqual(other.ccf, self.driver.ccf)
+        self.assertEqual(other.total, Decimal(20))
+        self.assertEqual(os.listdir(self.directory), ['printer.json'])
+
+        self.printer.close_till()
+        other.set_state_file(self.state_file)
+        self.assertTrue(other.till_closed)
+        self.assertEqual(other.crz, self.driver.crz)
+        self.assertEqual(other.period_total, Decimal(0))
+
+    def test_state_file_from_environment(self):
+        self.assertEqual(self.driver._state_filename, self.state_file)
+        del os.environ[STATE_ENV]
+        printer = Simple(MemorySink())
+        self.assertEqual(printer._state_filename, os.path.join(
+            self.directory, '.stoq', 'virtual-printer.json'))
+
+    def test_missing_state_file(self):
+        self._sell()
+        self.printer.close_till()
+        self.driver.set_state_file(os.path.join(self.directory, 'new.json'))
+        self.assertFalse(self.driver.till_closed)
+        self.assertEqual(self.driver.coo, 1)
+        self.assertEqual(self.driver.crz, 1)
+        self.assertEqual(self.driver.total, Decimal(0))
+        self.assertEqual(self.driver.taxes, [])
+
+    def test_taxes(self):
+        self.printer.open()
+        self.printer.add_item('123', 'Item', Decimal(10), 'TN')
+        self.printer.add_item('456', 'Other', Decimal(5), 'T1',
+                              items_quantity=Decimal(2))
+        self.printer.add_item('789', 'Service', Decimal(4), 'S0')
+        self.printer.totalize(discount=Decimal(10))
+        self.printer.add_payment('M', Decimal(30))
+        self.printer.close()
+        self.printer.open()
+        self.printer.add_item('123', 'Item', Decimal(7), 'TN')
+        self.printer.cancel()
+        expected = [('N', Decimal(10), 'ICMS'),
+                    ('1800', Decimal(10), 'ICMS'),
+                    ('0300', Decimal(4), 'ISS'),
+                    ('DESC', Decimal('2.40'), 'ICMS'),
+                    ('CANC', Decimal(7), 'ICMS')]
+        self.assertEqual(self.driver.get_sintegra().taxes, expected)
+
+        other = Simple(MemorySink(), state_file=self.state_file)
+        self.assertEqual(other.get_sintegra().taxes, expected)
+
+        self.printer.close_till()
+        self.assertEqual(self.driver.get_sintegra().taxes, [])
+
+    def test_no_state_file(self):
+        printer = Simple(MemorySink(), state_file=False)
+        printer.summarize()
+        self.assertFalse(printer._state_dirty)
+
+
+class TestSinks(unittest.TestCase):
+    def test_memory_is_a_ring(self):
+        sink = MemorySink(max_chunks=2)
+        for text in ['a\n', 'b\n', 'c\n']:
+            sink.feed(text)
+        self.assertEqual(sink.get_lines(), ['b', 'c'])
+
+    def test_file(self):
+        fp = io.StringIO()
+        sink = FileSink(fp)
+        sink.feed('foo\n')
+        sink.close()
+        self.assertEqual(fp.getvalue(), 'foo\n')
+
+    def test_get_sink(self):
+        self.assertEqual(type(get_sink('null')), OutputSink)
+        self.assertIsInstance(get_sink('memory'), MemorySink)
+        self.assertRaises(ValueError, get_sink, 'printer')